@@ -0,0 +1,39 @@
+"""FrameDecoder性能测试: python -m benchmarks.frame_decoder"""
+
+import time
+
+from wendy.logs import FrameDecoder
+
+
+def benchmark(size: int = 1 << 20, chunk_size: int = 1 << 14):
+    """对比逐字符拼接与FrameDecoder在不同日志大小下的耗时."""
+    line = "[00:00:01]: 测试日志 Sim paused\n".encode()
+    for multiple in (1, 2, 4, 8):
+        data = line * (size * multiple // len(line))
+        frames = bytearray()
+        for i in range(0, len(data), chunk_size):
+            payload = data[i : i + chunk_size]
+            frames += bytes([1, 0, 0, 0]) + len(payload).to_bytes(4, "big") + payload
+        for name, raw in (("tty", data), ("mux", bytes(frames))):
+            decoder = FrameDecoder()
+            start = time.perf_counter()
+            count = 0
+            for i in range(0, len(raw), chunk_size - 7):
+                count += len(decoder.feed(raw[i : i + chunk_size - 7]))
+            count += len(decoder.close())
+            elapsed = time.perf_counter() - start
+            print(f"{name} {len(raw) / (1 << 20):6.1f}MB {count:8d} lines {elapsed * 1000:8.1f}ms")
+        if multiple == 1:
+            start = time.perf_counter()
+            text, count = "", 0
+            for i in range(0, len(data), chunk_size):
+                for ch in data[i : i + chunk_size].decode("utf-8", "replace"):
+                    if ch == "\n":
+                        text, count = "", count + 1
+                    else:
+                        text += ch
+            print(f"char {len(data) / (1 << 20):6.1f}MB {count:8d} lines {(time.perf_counter() - start) * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,20 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "port" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "docker_api" VARCHAR(255) NOT NULL,
+    "slot" INT NOT NULL,
+    "deploy_id" INT,
+    "created_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT "uid_port_docker__8e5a3c" UNIQUE ("docker_api", "slot")
+) /* 端口段分配记录, deploy_id为空表示已回收可复用 */;
+CREATE INDEX IF NOT EXISTS "idx_port_deploy__cc63a3" ON "port" ("deploy_id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "port";"""
@@ -0,0 +1,21 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "job" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "deploy_id" INT NOT NULL,
+    "action" VARCHAR(32) NOT NULL,
+    "status" VARCHAR(32) NOT NULL,
+    "progress" JSON NOT NULL,
+    "error" TEXT,
+    "created_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP
+) /* 部署任务 */;
+CREATE INDEX IF NOT EXISTS "idx_job_deploy__4c0551" ON "job" ("deploy_id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "job";"""
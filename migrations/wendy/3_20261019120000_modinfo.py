@@ -0,0 +1,20 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "modinfo" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "mod_id" VARCHAR(64) NOT NULL,
+    "time_updated" INT NOT NULL,
+    "code" TEXT NOT NULL,
+    "info" JSON,
+    "error" TEXT,
+    "created_at" TIMESTAMP NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT "uid_modinfo_mod_id_226fe8" UNIQUE ("mod_id", "time_updated")
+) /* 模组modinfo.lua及解析结果缓存 */;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "modinfo";"""
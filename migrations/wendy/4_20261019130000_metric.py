@@ -0,0 +1,19 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "metric" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "deploy_id" INT NOT NULL,
+    "world" VARCHAR(64) NOT NULL,
+    "resolution" INT NOT NULL,
+    "time" INT NOT NULL,
+    "data" JSON NOT NULL,
+    CONSTRAINT "uid_metric_deploy__5b0c7e" UNIQUE ("deploy_id", "world", "resolution", "time")
+) /* 资源指标聚合, resolution为聚合粒度(秒), time为时间段开始的时间戳 */;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "metric";"""
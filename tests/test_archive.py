@@ -0,0 +1,50 @@
+import io
+import tarfile
+
+import zstandard
+
+from wendy import archive
+
+
+SESSION = "/data/Master/save/session/ABC"
+
+
+def test_latest_snapshots_with_meta():
+    files = [
+        f"{SESSION}/0000000002",
+        f"{SESSION}/0000000002.meta",
+        f"{SESSION}/0000000010",
+        f"{SESSION}/0000000010.meta",
+        f"{SESSION}/KU_x_/0000000001",
+        f"{SESSION}/KU_x_/0000000001.meta",
+        "/data/Master/save/0000000001",
+    ]
+    assert archive.latest_snapshots(files) == {f"{SESSION}/0000000002", f"{SESSION}/0000000002.meta"}
+
+
+def build(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w", format=tarfile.PAX_FORMAT) as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_tar_filter():
+    long_name = "save/" + "x" * 150 + "/0000000002"
+    data = build({"save/0000000010": b"new", long_name: b"old" * 200, "cluster.ini": b"ini"})
+    tar_filter = archive.TarFilter(lambda name: not name.endswith("0000000002"))
+    # 按不同长度切分输入, 覆盖头部跨块的情况
+    output = b"".join(tar_filter.feed(data[i : i + 300]) for i in range(0, len(data), 300)) + tar_filter.close()
+    with tarfile.open(fileobj=io.BytesIO(output)) as tar:
+        assert tar.getnames() == ["save/0000000010", "cluster.ini"]
+        assert tar.extractfile("cluster.ini").read() == b"ini"
+
+
+def test_zstd_compressor():
+    compressor = archive.Compressor("zstd")
+    data = compressor.compress(b"hello " * 1000) + compressor.flush()
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(data) == b"hello " * 1000
+    assert compressor.suffix == ".tar.zst"
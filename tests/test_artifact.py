@@ -0,0 +1,75 @@
+import io
+import os
+import asyncio
+import zipfile
+
+import pytest
+
+from wendy import artifact
+
+
+@pytest.fixture(autouse=True)
+def archive_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifact, "GAME_ARCHIVE_PATH", str(tmp_path))
+    return tmp_path
+
+
+def make_mod(root, mod_id: str, files: dict) -> str:
+    path = os.path.join(root, "src", mod_id)
+    for name, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(path, name)), exist_ok=True)
+        with open(os.path.join(path, name), "w") as file:
+            file.write(content)
+    return path
+
+
+def read_bundle(paths) -> bytes:
+    async def main():
+        size, content = await artifact.bundle(paths, chunk_size=7)
+        data = b"".join([chunk async for chunk in content])
+        assert len(data) == size
+        return data
+
+    return asyncio.run(main())
+
+
+def test_relocate():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        zip_file.writestr("a", b"1")
+        zip_file.writestr("b", b"22")
+    offset, directory, count = artifact.read_directory(buffer)
+    moved = artifact.relocate(directory, 1000)
+    headers = [info.header_offset for info in zipfile.ZipFile(buffer).infolist()]
+    assert count == 2
+    assert moved[42:46] == (headers[0] + 1000).to_bytes(4, "little")
+    with pytest.raises(ValueError):
+        artifact.relocate(directory, 0xFFFFFFFF)
+
+
+def test_bundle(archive_path):
+    first = artifact.build("111", make_mod(archive_path, "111", {"modinfo.lua": "name = 'a'"}), "1")
+    second = artifact.build("222", make_mod(archive_path, "222", {"scripts/main.lua": "print(1)" * 100}), "5")
+    with zipfile.ZipFile(io.BytesIO(read_bundle([first, second]))) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.read("111/modinfo.lua") == b"name = 'a'"
+        assert zip_file.read("222/scripts/main.lua") == b"print(1)" * 100
+
+
+def test_rebuild_during_download(archive_path):
+    path = make_mod(archive_path, "111", {"modinfo.lua": "old"})
+    target = artifact.build("111", path, "1")
+    assert artifact.is_current("111", "1")
+
+    async def main():
+        size, content = await artifact.bundle([target])
+        # 下载开始后替换为新版本, 本次下载仍是完整的旧版本
+        with open(os.path.join(path, "modinfo.lua"), "w") as file:
+            file.write("new version")
+        artifact.build("111", path, "2")
+        return b"".join([chunk async for chunk in content])
+
+    with zipfile.ZipFile(io.BytesIO(asyncio.run(main()))) as zip_file:
+        assert zip_file.read("111/modinfo.lua") == b"old"
+    assert artifact.is_current("111", "2")
+    assert not artifact.is_current("111", "1")
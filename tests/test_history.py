@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from tortoise import Tortoise
+
+from wendy import history
+
+
+# 整点
+HOUR = 1792396800
+
+
+def sample(timestamp: int, cpu: float) -> dict:
+    return {"time": timestamp, "cpu_percent": cpu, "memory": 100, "net_rx": None}
+
+
+def test_bucket():
+    bucket = history.Bucket(0)
+    bucket.add([10.0] * 6, [20.0] * 6, count=3)
+    bucket.add([50.0] * 6, [50.0] * 6)
+    assert bucket.count == 4
+    assert bucket.data()["cpu_percent"] == [20.0, 50.0]
+
+
+def test_series_rollup():
+    series = history.Series()
+    closed = []
+    for offset in range(0, 3600 + 120):
+        closed.extend(series.add(sample(HOUR + offset, offset % 60)))
+    minutes = [bucket for resolution, bucket in closed if resolution == history.MINUTE]
+    hours = [bucket for resolution, bucket in closed if resolution == history.HOUR]
+    assert [bucket.start for bucket in minutes] == [HOUR + 60 * i for i in range(61)]
+    assert minutes[0].count == 60
+    assert minutes[0].data()["cpu_percent"] == [29.5, 59.0]
+    # 缺失的指标按0计
+    assert minutes[0].data()["net_rx"] == [0.0, 0.0]
+    # 第一个小时在下一小时的第一个分钟结束时汇总
+    assert [bucket.start for bucket in hours] == [HOUR]
+    assert hours[0].count == 3600
+    assert hours[0].data()["cpu_percent"] == [29.5, 59.0]
+
+
+def run(coro):
+    async def main():
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["wendy.models"]})
+        await Tortoise.generate_schemas()
+        try:
+            return await coro
+        finally:
+            await Tortoise.close_connections()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def series(monkeypatch):
+    monkeypatch.setattr(history, "series", {})
+    item = history.series[(1, "Master")] = history.Series()
+    return item
+
+
+def test_query(series):
+    async def main():
+        rows = []
+        for offset in range(0, 180):
+            for resolution, bucket in series.add(sample(HOUR + offset, offset)):
+                rows.append((1, "Master", resolution, bucket))
+        await history.save(rows)
+        raw = await history.query(1, "Master", "cpu_percent", HOUR + 10, HOUR + 12)
+        minutes = await history.query(1, "Master", "cpu_percent", HOUR, HOUR + 180, 60)
+        return raw, minutes
+
+    raw, minutes = run(main())
+    assert raw == [{"time": HOUR + t, "avg": t, "max": t} for t in (10, 11, 12)]
+    # 已写入的两个分钟段加上内存中未结束的分钟段
+    assert minutes == [
+        {"time": HOUR, "avg": 29.5, "max": 59.0},
+        {"time": HOUR + 60, "avg": 89.5, "max": 119.0},
+        {"time": HOUR + 120, "avg": 149.5, "max": 179.0},
+    ]
+
+
+def test_query_resolution():
+    with pytest.raises(ValueError):
+        asyncio.run(history.query(1, "Master", "cpu_percent", 0, 60, 5))
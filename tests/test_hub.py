@@ -0,0 +1,76 @@
+import asyncio
+
+from wendy.hub import Hub
+from wendy.sse import BoundedQueue
+from wendy.logs import LogFilter
+from wendy.api.console import LogFollow
+
+
+def test_queue_drop_oldest():
+    async def main():
+        queue = BoundedQueue(maxsize=3)
+        for item in range(5):
+            queue.put_nowait(item)
+        assert queue.qsize() == 3
+        assert queue.take_dropped() == 2
+        assert await queue.get_batch(size=2, interval=0) == [2, 3]
+        queue.put_nowait(5)
+        queue.put_nowait(6)
+        queue.put_nowait(7)
+        assert await queue.get_batch(size=10, interval=0) == [5, 6, 7]
+        # 累计丢弃数保留, 新丢弃数已取走
+        assert queue.dropped == 3
+        assert queue.take_dropped() == 1
+        assert queue.take_dropped() == 0
+
+    asyncio.run(main())
+
+
+def test_queue_batch_interval():
+    async def main():
+        queue = BoundedQueue()
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.01, queue.put_nowait, 1)
+        loop.call_later(0.02, queue.put_nowait, 2)
+        # 第一个元素到达后继续等待interval秒合并
+        return await queue.get_batch(size=10, interval=0.1)
+
+    assert asyncio.run(main()) == [1, 2]
+
+
+def log(timestamp: int, data: str) -> dict:
+    return {"time": timestamp, "data": data}
+
+
+def test_hub_replay_since():
+    async def main():
+        hub = Hub(size=3)
+        stop = asyncio.Event()
+
+        async def source(channel):
+            for timestamp in range(1, 6):
+                channel.publish(log(timestamp, f"line {timestamp}"))
+            await stop.wait()
+
+        first = BoundedQueue()
+        channel = hub.subscribe("a", source, first)
+        await asyncio.sleep(0)
+        # 只保留最近的3条
+        assert [item["time"] for item in channel.history] == [3, 4, 5]
+
+        # 回放按since过滤, 实时消息不受since限制
+        follow = LogFollow(None, since=4, log_filter=LogFilter(grep="line"))
+        hub.subscribe("a", source, follow.queue, accept=follow.log_filter, replay=follow._replay)
+        channel.publish(log(2, "line late"))
+        channel.publish(log(6, "other"))
+        received = await follow.queue.get_batch(size=10, interval=0)
+        assert received == [("a", log(4, "line 4")), ("a", log(5, "line 5")), ("a", log(2, "line late"))]
+        assert first.qsize() == 7
+
+        hub.unsubscribe("a", first)
+        hub.unsubscribe("a", follow.queue)
+        assert "a" not in hub.channels
+        await asyncio.sleep(0)
+        assert channel.task.cancelled()
+
+    asyncio.run(main())
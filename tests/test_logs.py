@@ -0,0 +1,43 @@
+import pytest
+
+from wendy.logs import FrameDecoder
+
+
+def frame(stream: int, payload: bytes) -> bytes:
+    return bytes([stream, 0, 0, 0]) + len(payload).to_bytes(4, "big") + payload
+
+
+def decode(decoder: FrameDecoder, data: bytes, size: int) -> list:
+    lines = []
+    for i in range(0, len(data), size):
+        lines.extend(decoder.feed(data[i : i + size]))
+    return lines + decoder.close()
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 8, 9, 1024])
+def test_mux_split_across_chunks(size: int):
+    data = (
+        frame(1, "[00:00:01]: 玩家加入\n第二".encode())
+        + frame(2, b"error line\r\n")
+        + frame(1, "行\nno newline".encode())
+    )
+    assert decode(FrameDecoder(), data, size) == [
+        ("stdout", "[00:00:01]: 玩家加入"),
+        ("stderr", "error line"),
+        ("stdout", "第二行"),
+        ("stdout", "no newline"),
+    ]
+
+
+@pytest.mark.parametrize("size", [1, 5, 1024])
+def test_tty(size: int):
+    data = "第一行\r\nsecond\nthird".encode()
+    expected = [("stdout", "第一行"), ("stdout", "second"), ("stdout", "third")]
+    # 自动判断: 开头不是帧头时按tty处理
+    assert decode(FrameDecoder(), data, size) == expected
+    assert decode(FrameDecoder(tty=True), data, size) == expected
+
+
+def test_tty_data_like_frame_header():
+    data = b"\x01\x00\x00\x00abcd\n"
+    assert decode(FrameDecoder(tty=True), data, 2) == [("stdout", "\x01\x00\x00\x00abcd")]
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from wendy import logstore
+
+
+# 2026-10-19 08:00:00 UTC
+HOUR = 1792396800
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(logstore, "LOG_STORE_PATH", str(tmp_path))
+    monkeypatch.setattr(logstore, "segments", {})
+    return tmp_path
+
+
+def write(lines):
+    logstore.write({(1, "Master"): lines})
+
+
+def search(keyword="", start=HOUR, end=HOUR + 7200, limit=500):
+    return [(item["time"], item["data"]) for item in logstore.search(1, ["Master"], start, end, keyword, limit)]
+
+
+def test_search_keyword():
+    write([(HOUR + 1, "[Join Announcement] Wilson"), (HOUR + 2, "Sim paused"), (HOUR + 3, "玩家 威尔逊 加入")])
+    write([(HOUR + 4, "[Leave Announcement] Wilson")])
+    assert search("wilson") == [(HOUR + 1, "[Join Announcement] Wilson"), (HOUR + 4, "[Leave Announcement] Wilson")]
+    # 英文按完整单词匹配
+    assert search("wils") == []
+    assert search("威尔逊") == [(HOUR + 3, "玩家 威尔逊 加入")]
+    assert search(start=HOUR + 2, end=HOUR + 3) == [(HOUR + 2, "Sim paused"), (HOUR + 3, "玩家 威尔逊 加入")]
+
+
+def test_search_limit_across_segments():
+    write([(HOUR + i, f"line {i}") for i in range(10)])
+    write([(HOUR + 3600 + i, f"line {i}") for i in range(10)])
+    result = search("line", limit=5)
+    assert [timestamp for timestamp, _ in result] == [HOUR + 3600 + i for i in range(5, 10)]
+
+
+def test_closed_segment_index(store, monkeypatch):
+    write([(HOUR + 1, "first hour")])
+    write([(HOUR + 3601, "second hour")])
+    path = os.path.join(store, "1", "Master", "2026101908.log.gz")
+    # 切换到下一小时后前一段写入索引, 索引缺失时搜索会重建
+    assert os.path.exists(logstore.index_path(path))
+    os.remove(logstore.index_path(path))
+    assert search("first") == [(HOUR + 1, "first hour")]
+    assert os.path.exists(logstore.index_path(path))
+
+
+def test_truncated_member(store):
+    write([(HOUR + 1, "complete")])
+    path = os.path.join(store, "1", "Master", "2026101908.log.gz")
+    size = os.path.getsize(path)
+    with open(path, "ab") as file:
+        file.write(b"\x1f\x8b\x08\x00partial")
+    index = logstore.Index.build(path)
+    assert len(index.members) == 1
+    assert os.path.getsize(path) == size
+
+
+def test_restart_skips_written_lines(monkeypatch):
+    write([(HOUR + 1, "a"), (HOUR + 2, "b")])
+    monkeypatch.setattr(logstore, "segments", {})
+    # 重启后上游回放的日志不会重复写入
+    write([(HOUR + 2, "b"), (HOUR + 3, "c")])
+    assert search() == [(HOUR + 1, "a"), (HOUR + 2, "b"), (HOUR + 3, "c")]
+
+
+@pytest.mark.parametrize("world", ["", ".", "..", "a/b", "a\\b", "a\0b"])
+def test_world_path(world):
+    with pytest.raises(ValueError):
+        logstore.world_path(1, world)
@@ -0,0 +1,153 @@
+import asyncio
+
+import pytest
+
+from wendy import lua, modinfo
+
+
+MODINFO = r"""
+-- 常见的模组写法: 本地化、配置项循环生成、字符串函数
+local function zh_en(zh, en)
+    return ChooseTranslationTable({zh = zh, en})
+end
+
+name = zh_en("全球定位", "Global Positions")
+description = [[
+Shows players and pings on the map.
+󰀏 v1.2.3
+]]
+author = "rezecib"
+version = "1.2.3"
+api_version = 10
+priority = -1
+dst_compatible = true
+client_only_mod = false
+all_clients_require_mod = true
+icon_atlas = "modicon.xml"
+icon = "modicon.tex"
+server_filter_tags = {"global positions", "map"}
+
+local keys = {}
+for i = 1, 3 do
+    keys[#keys + 1] = {description = string.format("%s %d", "Key", i), data = "KEY_F" .. i}
+end
+
+local boolean = {
+    {description = zh_en("开启", "Enabled"), data = true},
+    {description = zh_en("关闭", "Disabled"), data = false},
+}
+
+configuration_options = {
+    {name = "SHOWPLAYERSOPTIONS", label = zh_en("显示玩家", "Player Indicators"), options = keys, default = "KEY_F1"},
+    {name = "SHAREMINIMAPPROGRESS", label = string.upper("share"), options = boolean, default = true},
+    {name = "ENABLEPINGS", label = "Pings", hover = table.concat({"a", "b", "c"}, ","), options = boolean, default = true},
+}
+"""
+
+
+def run(code: str, **kwargs) -> lua.Scope:
+    return lua.Interpreter(**kwargs).run(code, {"locale": "zh"})
+
+
+def test_real_modinfo():
+    scope = run(MODINFO)
+    assert scope.vars["name"] == "全球定位"
+    assert scope.vars["api_version"] == 10
+    assert scope.vars["priority"] == -1
+    assert lua.to_python(scope.vars["server_filter_tags"]) == ["global positions", "map"]
+    options = lua.to_python(scope.vars["configuration_options"])
+    assert [item["name"] for item in options] == ["SHOWPLAYERSOPTIONS", "SHAREMINIMAPPROGRESS", "ENABLEPINGS"]
+    assert options[0]["options"][2] == {"description": "Key 3", "data": "KEY_F3"}
+    assert options[1]["label"] == "SHARE"
+    assert options[1]["options"][1] == {"description": "关闭", "data": False}
+    assert options[2]["hover"] == "a,b,c"
+
+
+def test_modinfo_parse_in_subprocess():
+    result = asyncio.run(modinfo.parse(MODINFO, "378160973"))
+    assert result["error"] is None
+    assert result["info"]["name"] == "全球定位"
+    assert result["info"]["configuration_options"][0]["default"] == "KEY_F1"
+
+
+def test_modinfo_parse_error():
+    result = asyncio.run(modinfo.parse("name = ", "1"))
+    assert result["info"] is None
+    assert result["error"]
+
+
+@pytest.mark.parametrize(
+    "code, message",
+    [
+        ("while true do end", "step limit exceeded"),
+        ("local function f() return f() + 1 end f()", "stack overflow"),
+        ('local s = "x" while true do s = s .. s end', "string too long"),
+        ('x = string.rep("x", 2 ^ 30)', "string too long"),
+        ('x = string.rep("", 2 ^ 30, "x")', "string too long"),
+        ('x = string.format("%900000000d", 1)', "invalid conversion"),
+        ('local s = string.rep("x", 2 ^ 19) x = string.format("%s%s%s", s, s, s)', "string too long"),
+        ('local s = string.rep("x", 2 ^ 19) x = table.concat({s, s, s})', "string too long"),
+        (
+            'local t = {} for i = 1, 3000 do t[i] = string.rep("x", 1000) end x = table.concat(t, ",")',
+            "string too long",
+        ),
+    ],
+)
+def test_limits(code: str, message: str):
+    with pytest.raises(lua.LuaError, match=message):
+        run(code, max_steps=100_000)
+
+
+def test_time_limit():
+    with pytest.raises(lua.LuaError, match="time limit exceeded"):
+        run("while true do end", max_steps=1 << 60, timeout=0.1)
+
+
+def test_table_depth():
+    scope = run("t = {} local c = t for i = 1, 100 do c.next = {} c = c.next end")
+    with pytest.raises(lua.LuaError, match="table too deep"):
+        lua.to_python(scope.vars["t"])
+
+
+def test_modinfo_parse_time_limit():
+    result = asyncio.run(modinfo.parse("while true do end", "1"))
+    assert result["info"] is None
+    assert result["error"] in ("step limit exceeded", "time limit exceeded")
+
+
+@pytest.mark.parametrize(
+    "code, value",
+    [
+        ("x = 9223372036854775807 + 1", -(1 << 63)),
+        ("x = -9223372036854775807 - 2", (1 << 63) - 1),
+        ("x = 0x7fffffffffffffff * 2", -2),
+        ("x = -(-9223372036854775807 - 1)", -(1 << 63)),
+        ("x = 9223372036854775808", float(1 << 63)),
+        ("x = 7 // 2", 3),
+        ("x = -7 % 3", 2),
+        ("x = 7.5 // 2", 3.0),
+        ("x = 2 ^ 10", 1024.0),
+    ],
+)
+def test_integer_arithmetic(code: str, value):
+    assert run(code).vars["x"] == value
+
+
+def test_integer_growth_is_bounded():
+    scope = run("x = 1 for i = 1, 10000 do x = x * 3 end")
+    assert lua.INT_MIN <= scope.vars["x"] <= lua.INT_MAX
+
+
+@pytest.mark.parametrize(
+    "name", ["os", "io", "load", "loadstring", "loadfile", "dofile", "require", "debug", "package"]
+)
+def test_sandbox(name: str):
+    assert run(f"x = type({name})").vars["x"] == "nil"
+    with pytest.raises(lua.LuaError):
+        run(f"{name}()")
+
+
+def test_sandbox_no_python_access():
+    assert run('x = ("").__class__').vars.get("x") is None
+    scope = run('x = string.format("%s", string)')
+    assert "object at" not in scope.vars["x"]
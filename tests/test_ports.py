@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from tortoise import Tortoise
+
+from wendy import models, ports
+from wendy.cluster import Cluster
+from wendy.settings import PORT_RANGE_START, PORT_RANGE_SIZE
+
+
+DOCKER_API = "tcp://h1:2375"
+PROC_NET = """# tcp
+  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode
+   0: 00000000:2710 00000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 1
+   1: 0100007F:271A 0100007F:1F90 01 00000000:00000000 00:00000000 00000000     0        0 2
+   2: 0100007F:271B 0100007F:1F90 06 00000000:00000000 00:00000000 00000000     0        0 3
+# udp
+  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode ref pointer drops
+   0: 00000000:2724 00000000:0000 07 00000000:00000000 00:00000000 00000000     0        0 4 2 0 0
+   1: 0100007F:272E 08080808:0035 01 00000000:00000000 00:00000000 00000000     0        0 5 2 0 0
+# tcp6
+  sl  local_address                         remote_address                        st
+   0: 00000000000000000000000000000000:2738 00000000000000000000000000000000:0000 0A
+# udp6
+"""
+
+
+def test_parse_proc_net():
+    # 10000 tcp监听, 10020 udp绑定, 10040 tcp6监听; 已连接和TIME_WAIT的端口不算
+    assert ports.parse_proc_net(PROC_NET) == {10000, 10020, 10040}
+
+
+def run(coro):
+    async def main():
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["wendy.models"]})
+        await Tortoise.generate_schemas()
+        try:
+            return await coro
+        finally:
+            await Tortoise.close_connections()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture(autouse=True)
+def host(monkeypatch):
+    in_use = set()
+
+    async def host_ports(docker_api: str):
+        return in_use
+
+    monkeypatch.setattr(ports, "host_ports", host_ports)
+    monkeypatch.setattr(ports, "high_water", {})
+    return in_use
+
+
+def test_acquire_skips_busy_and_reuses_released(host):
+    host.add(ports.slot_port(0) + 3)
+
+    async def main():
+        first = await ports.acquire(DOCKER_API, 1)
+        second = await ports.acquire(DOCKER_API, 2)
+        await ports.release(1)
+        third = await ports.acquire(DOCKER_API, 3)
+        # 被占用的端口段记为空闲, 空闲后重新检测
+        host.clear()
+        fourth = await ports.acquire(DOCKER_API, 4)
+        return first.slot, second.slot, third.slot, fourth.slot
+
+    assert run(main()) == (1, 2, 1, 0)
+
+
+def test_seed_legacy_ports():
+    cluster = Cluster(cluster_token="x")
+    for world in cluster.world:
+        world.docker_api = DOCKER_API
+    # 旧版本的端口: 10000 + id * 100
+    cluster.auto_port({DOCKER_API: 10000 + 100})
+
+    async def main():
+        await models.Deploy.create(id=1, cluster=cluster.model_dump(), status="running")
+        await ports.seed()
+        await ports.seed()
+        records = {port.slot: port.deploy_id async for port in models.Port.filter(docker_api=DOCKER_API)}
+        port = await ports.acquire(DOCKER_API, 2)
+        return records, port.slot
+
+    records, slot = run(main())
+    legacy = (10100 - PORT_RANGE_START) // PORT_RANGE_SIZE
+    assert records[legacy] == 1
+    # 登记的端口段以下记为空闲, 分配时优先复用
+    assert all(records[slot] is None for slot in range(legacy))
+    assert slot == 0
@@ -0,0 +1,83 @@
+import io
+import re
+import asyncio
+import zipfile
+
+import httpx
+import pytest
+
+from wendy import remotezip
+
+
+def serve(content: bytes) -> httpx.MockTransport:
+    """按Range返回content的部分内容."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        value = request.headers["range"]
+        if match := re.fullmatch(r"bytes=-(\d+)", value):
+            start, end = max(len(content) - int(match[1]), 0), len(content) - 1
+        else:
+            match = re.fullmatch(r"bytes=(\d+)-(\d+)", value)
+            start, end = int(match[1]), min(int(match[2]), len(content) - 1)
+        return httpx.Response(
+            206,
+            content=content[start : end + 1],
+            headers={"content-range": f"bytes {start}-{end}/{len(content)}"},
+        )
+
+    return httpx.MockTransport(handler)
+
+
+def build(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        for name, data in files.items():
+            zip_ref.writestr(name, data)
+    return buffer.getvalue()
+
+
+async def read(content: bytes, name: str, **kwargs) -> bytes:
+    async with httpx.AsyncClient(transport=serve(content)) as client:
+        remote = remotezip.RemoteZip(client, "http://mod.zip")
+        members = await remote.directory()
+        method, compress_size, file_size, header_offset = members[name]
+        return await remote.read_member(
+            method, compress_size, kwargs.pop("file_size", file_size), header_offset, **kwargs
+        )
+
+
+def test_read_member():
+    content = build({"mod/modinfo.lua": "name = 'x'", "mod/data.bin": b"\0" * 4096})
+    assert asyncio.run(read(content, "mod/modinfo.lua")) == b"name = 'x'"
+
+
+def test_member_too_large():
+    content = build({"bomb.lua": b"\0" * (1 << 20)})
+    with pytest.raises(ValueError, match="too large"):
+        asyncio.run(read(content, "bomb.lua", max_size=1 << 16))
+
+
+def test_member_larger_than_recorded():
+    content = build({"bomb.lua": b"\0" * (1 << 20)})
+    with pytest.raises(ValueError, match="larger than 100"):
+        asyncio.run(read(content, "bomb.lua", file_size=100))
+
+
+def test_range_not_supported():
+    sent = []
+
+    async def body():
+        for _ in range(1024):
+            sent.append(1)
+            yield b"\0" * 65536
+
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+
+    async def main():
+        async with httpx.AsyncClient(transport=transport) as client:
+            await remotezip.RemoteZip(client, "http://mod.zip").directory()
+
+    with pytest.raises(remotezip.RangeNotSupported):
+        asyncio.run(main())
+    # 忽略Range的完整响应不会被读取
+    assert len(sent) <= 1
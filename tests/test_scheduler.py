@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from wendy import scheduler
+from wendy.cluster import Cluster
+from wendy.constants import DOCKER_API_AUTO
+from wendy.scheduler import ContainerUsage, HostLoad
+
+
+H1, H2 = "tcp://10.0.0.1:2375", "tcp://10.0.0.2:2375"
+
+
+def load(docker_api: str, capacity: int = 4, shards: int = 0, **containers: float) -> HostLoad:
+    usage = {name: ContainerUsage(cpu_percent=cpu) for name, cpu in containers.items()}
+    return HostLoad(docker_api=docker_api, cpus=4, memory=1 << 30, capacity=capacity, shards=shards, containers=usage)
+
+
+def cluster(docker_api: str = DOCKER_API_AUTO, affinity: str = "together") -> Cluster:
+    item = Cluster(cluster_token="x", affinity=affinity)
+    for world in item.world:
+        world.docker_api = docker_api
+    return item
+
+
+def test_pick_best_fit():
+    loads = [load(H1, capacity=4, shards=3), load(H2, capacity=8)]
+    # 放得下的主机中选剩余容量最少的
+    assert scheduler.pick(loads, 1).docker_api == H1
+    assert scheduler.pick(loads, 2).docker_api == H2
+    assert scheduler.pick(loads, 9) is None
+
+
+def test_pick_skips_busy_host():
+    loads = [load(H1, capacity=4, shards=3, a=400), load(H2, capacity=8)]
+    assert scheduler.pick(loads, 1).docker_api == H2
+
+
+def test_pick_exclude_fallback():
+    loads = [load(H1), load(H2, shards=1)]
+    assert scheduler.pick(loads, 1, exclude=[H2]).docker_api == H1
+    # 全部被排除时退回到所有可用主机
+    assert scheduler.pick(loads, 1, exclude=[H1, H2]).docker_api == H2
+
+
+@pytest.fixture
+def hosts(monkeypatch):
+    loads = []
+
+    async def hosts_load():
+        return loads
+
+    monkeypatch.setattr(scheduler, "hosts_load", hosts_load)
+    return loads
+
+
+def test_place_together(hosts):
+    hosts.extend([load(H1), load(H2, shards=1)])
+    item = asyncio.run(scheduler.place(cluster()))
+    assert [world.docker_api for world in item.world] == [H2, H2]
+    assert item.ini.bind_ip == "127.0.0.1"
+
+
+def test_place_apart(hosts):
+    hosts.extend([load(H1), load(H2, shards=1)])
+    item = asyncio.run(scheduler.place(cluster(affinity="apart")))
+    assert [world.docker_api for world in item.world] == [H2, H1]
+    assert item.ini.bind_ip == "0.0.0.0"
+    assert item.ini.master_ip == "10.0.0.2"
+
+
+def test_place_apart_single_host(hosts):
+    hosts.append(load(H1))
+    item = asyncio.run(scheduler.place(cluster(affinity="apart")))
+    assert [world.docker_api for world in item.world] == [H1, H1]
+
+
+def test_place_no_host(hosts):
+    with pytest.raises(ValueError, match="no docker host"):
+        asyncio.run(scheduler.place(cluster()))
+
+
+def test_place_links_manual_split(hosts):
+    item = cluster(H1)
+    item.world[1].docker_api = H2
+    item.ini.master_ip = "192.168.1.10"
+    item = asyncio.run(scheduler.place(item))
+    assert item.ini.bind_ip == "0.0.0.0"
+    # 已手动配置的地址不覆盖
+    assert item.ini.master_ip == "192.168.1.10"
+
+
+def test_link_shards_unix_master():
+    item = cluster("unix:///var/run/docker.sock")
+    item.world[1].docker_api = H2
+    with pytest.raises(ValueError, match="master_ip"):
+        scheduler.link_shards(item)
+
+
+def test_rebalance_moves_groups(monkeypatch):
+    big, small = cluster(H1), cluster(H1)
+    for index, world in enumerate(big.world + small.world):
+        world.container = f"dst_{index}"
+    small.world.pop()
+
+    async def reserved_shards():
+        return {H1: [(1, world) for world in big.world] + [(2, world) for world in small.world]}
+
+    async def hosts_load():
+        return [load(H1, shards=3), load(H2)]
+
+    monkeypatch.setattr(scheduler, "reserved_shards", reserved_shards)
+    monkeypatch.setattr(scheduler, "hosts_load", hosts_load)
+    # 先迁移最小的组; 再迁移两个世界的部署会让差距变大, 不迁移
+    assert asyncio.run(scheduler.rebalance()) == [{"id": 2, "worlds": ["Master"], "source": H1, "target": H2}]
@@ -1,27 +1,36 @@
 import shutil
-from typing import List
+from typing import List, Callable, Awaitable, AsyncIterator
 
 import io
 import os
+import json
 import asyncio
-import tarfile
+import uuid
+import hashlib
+import tempfile
 import zipfile
+from contextlib import asynccontextmanager
 
 import httpx
 import structlog
 import aiodocker
+import aiodocker.volumes
+import aiodocker.containers
 
 from wendy.cluster import Cluster
-from wendy import models, steamcmd
+from wendy import archive, console, models, ports, scheduler, steamcmd
 from wendy.constants import DeployStatus
 from wendy.settings import (
     DST_IMAGE,
     GAME_ARCHIVE_PATH,
+    CONSOLE_TIMEOUT,
 )
 
 # 下载模组加锁
 lock = asyncio.Lock()
 log = structlog.get_logger()
+# 容器配置摘要标签
+CONFIG_LABEL = "wendy.config"
 
 
 def get_archive_path(id: str | int) -> str:
@@ -36,32 +45,74 @@ def get_archive_path(id: str | int) -> str:
     return os.path.join(GAME_ARCHIVE_PATH, str(id))
 
 
-def make_tarfile_in_memory(archive_path: str) -> io.BytesIO:
-    tar_stream = io.BytesIO()
-    with tarfile.open(fileobj=tar_stream, mode="w") as tar:
-        for root, _, files in os.walk(archive_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, start=archive_path)
-                tar.add(file_path, arcname=arcname)
-    tar_stream.seek(0)
-    return tar_stream
+def fingerprint(
+    path: str,
+    image: str,
+    details: dict | None,
+) -> str:
+    """计算部署指纹: 镜像版本、渲染后的集群配置文件和模组更新时间.
 
+    Args:
+        path (str): 部署目录路径.
+        image (str): dst镜像.
+        details (dict | None): publishedfiledetails信息.
 
-async def download_archive(
+    Returns:
+        str: 指纹.
+    """
+    sha = hashlib.sha256()
+    sha.update(image.encode())
+    files = [os.path.join(path, "mods", "dedicated_server_mods_setup.lua")]
+    for root, _, filenames in os.walk(os.path.join(path, "Cluster_1")):
+        files.extend(os.path.join(root, filename) for filename in filenames)
+    for file_path in sorted(files):
+        if os.path.exists(file_path):
+            sha.update(os.path.relpath(file_path, path).encode())
+            with open(file_path, "rb") as file:
+                sha.update(hashlib.sha256(file.read()).digest())
+    mods = []
+    if details is not None:
+        for mod in details["response"]["publishedfiledetails"]:
+            mods.append(f"{mod['publishedfileid']}:{mod.get('time_updated', '')}")
+    sha.update(",".join(sorted(mods)).encode())
+    return sha.hexdigest()
+
+
+def config_digest(config: dict) -> str:
+    """容器配置摘要, 用于判断容器是否需要重建."""
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+async def volumes_exist(
+    docker: aiodocker.Docker,
+    volumes: List[str],
+) -> bool:
+    for volume in volumes:
+        try:
+            await aiodocker.volumes.DockerVolume(docker, volume).show()
+        except aiodocker.DockerError:
+            return False
+    return True
+
+
+# 存档卷在busybox中的挂载路径
+ARCHIVE_TARGET_PATH = "/home/steam/dst/archive"
+
+
+@asynccontextmanager
+async def archive_busybox(
     id: str | int,
     docker_api: str,
-):
-    """下载存档.
+) -> AsyncIterator[aiodocker.containers.DockerContainer]:
+    """挂载存档卷的busybox容器, 容器名随机, 同时进行的多个下载互不影响, 退出时删除.
 
     Args:
         id (str | int): id.
         docker_api (str): docker.
     """
     async with aiodocker.Docker(docker_api) as docker:
-        container_name = f"wendy_busybox_{id}"
+        container_name = f"wendy_busybox_{id}_{uuid.uuid4().hex[:8]}"
         await pull("busybox:latest", docker)
-        target_path = "/home/steam/dst/archive"
         config = {
             "Image": "busybox:latest",
             "RestartPolicy": {"Name": "no"},
@@ -71,16 +122,69 @@ async def download_archive(
                     {
                         "Type": "volume",
                         "Source": f"wendy_{id}",
-                        "Target": target_path,
+                        "Target": ARCHIVE_TARGET_PATH,
                     }
                 ]
             },
         }
         busybox = await docker.containers.create_or_replace(container_name, config)
         await busybox.start()
-        file = await busybox.get_archive(target_path)
-        await busybox.stop()
-    return file
+        try:
+            yield busybox
+        finally:
+            await busybox.delete(force=True)
+
+
+async def list_archive(
+    busybox: aiodocker.containers.DockerContainer,
+    path: str,
+) -> List[str]:
+    """列出存档文件, 每行格式为"修改时间 大小 路径", 修改时间精确到纳秒, 同一秒内的多次写入也能区分.
+
+    Args:
+        busybox (aiodocker.containers.DockerContainer): archive_busybox.
+        path (str): 路径.
+
+    Returns:
+        List[str]: 按路径排序的文件列表.
+    """
+    execute = await busybox.exec(["find", path, "-type", "f", "-exec", "stat", "-c", "%s %y %n", "{}", "+"])
+    output = bytearray()
+    async with execute.start(detach=False) as stream:
+        while message := await stream.read_out():
+            if message.stream == 1:
+                output += message.data
+    lines = []
+    for line in output.decode("utf-8", "replace").splitlines():
+        # "大小 2024-01-01 00:00:00.123456789 +0000 路径"
+        parts = line.split(" ", 4)
+        if len(parts) < 5:
+            continue
+        size, day, clock, zone, name = parts
+        mtime = "".join(char for char in day + clock if char.isdigit()) + zone
+        lines.append(f"{mtime} {size} {name}")
+    return sorted(lines, key=lambda line: line.split(" ", 2)[-1])
+
+
+async def stream_archive(
+    busybox: aiodocker.containers.DockerContainer,
+    path: str,
+    chunk_size: int = 65536,
+) -> AsyncIterator[bytes]:
+    """流式读取docker archive接口返回的tar.
+
+    Args:
+        busybox (aiodocker.containers.DockerContainer): archive_busybox.
+        path (str): 路径.
+        chunk_size (int): 块大小.
+    """
+    async with busybox.docker._query(
+        f"containers/{busybox.id}/archive",
+        method="GET",
+        params={"path": path},
+    ) as response:
+        async for chunk in response.content.iter_chunked(chunk_size):
+            yield chunk
 
 
 async def filter_downloaded_ugc_mods(
@@ -215,12 +319,14 @@ async def download_mods_by_steamcmd(
 async def download_mods(
     mods: List[str],
     path: str,
+    details: dict | None = None,
 ):
     """下载模组.
 
     Args:
         mods (List[str]): 模组.
         path (str): 存储路径.
+        details (dict | None, optional): 已获取的publishedfiledetails信息, 为空时重新获取.
 
     Returns:
         dict: {mod_id: mod_path, ...}.
@@ -228,7 +334,8 @@ async def download_mods(
     mods_path = {}
     if not mods:
         return mods_path
-    details = await steamcmd.publishedfiledetails(mods)
+    if details is None:
+        details = await steamcmd.publishedfiledetails(mods)
     async with lock:
         mods_path.update(await download_mods_by_fileurl(os.path.join(path, "mods"), details))
         mods_path.update(await download_mods_by_steamcmd(os.path.join(path, "ugc_mods"), details))
@@ -275,8 +382,10 @@ async def upload(
     }
     busybox = await docker.containers.create_or_replace(volume_name, config)
     await busybox.start()
-    tar_stream = make_tarfile_in_memory(path)
-    await busybox.put_archive(path, tar_stream.read())
+    # 打包到临时文件并流式上传, 避免大存档占用内存
+    with tempfile.TemporaryFile() as tar_stream:
+        await asyncio.to_thread(archive.make_tarfile, path, tar_stream)
+        await busybox.put_archive(path, tar_stream)
     await busybox.stop()
     return volume_name
 
@@ -312,6 +421,7 @@ async def update_mods(
     ugc_volume: str,
     docker: aiodocker.Docker,
     timeout: int = 300,
+    log_config: dict | None = None,
 ):
     config = {
         "Image": image,
@@ -337,6 +447,8 @@ async def update_mods(
             "NetworkMode": "host",
         },
     }
+    if log_config:
+        config["HostConfig"]["LogConfig"] = log_config
     container = await docker.containers.create_or_replace(name=container_name, config=config)
     await container.start()
     while timeout > 0:
@@ -358,6 +470,8 @@ async def deploy_world(
     mods_volume: str,
     ugc_volume: str,
     world_type: str,
+    host_config: dict | None = None,
+    log_config: dict | None = None,
 ):
     config = {
         "Image": image,
@@ -394,27 +508,73 @@ async def deploy_world(
                 },
             ],
             "NetworkMode": "host",
+            **({"LogConfig": log_config} if log_config else {}),
+            **(host_config or {}),
         },
         "Tty": True,
         "OpenStdin": True,
     }
+    digest = config_digest(config)
+    config["Labels"] = {CONFIG_LABEL: digest}
+    try:
+        container = await docker.containers.get(container_name)
+        labels = container._container.get("Config", {}).get("Labels") or {}
+    except aiodocker.DockerError:
+        container, labels = None, {}
+    if container is not None and labels.get(CONFIG_LABEL) == digest:
+        # 配置未变化, 直接重启已有容器
+        log.info(f"reuse container: {container_name}")
+        await container.restart()
+        return container_name
     container = await docker.containers.create_or_replace(name=container_name, config=config)
     await container.start()
     return container_name
 
 
+async def container_running(docker: aiodocker.Docker, container_name: str) -> bool:
+    try:
+        container = await docker.containers.get(container_name)
+    except aiodocker.DockerError:
+        return False
+    return container._container.get("State", {}).get("Status") == "running"
+
+
 async def deploy(
     id: int,
     cluster: Cluster,
     version: str | None = None,
+    progress: Callable[[str], Awaitable[None]] | None = None,
+    restart: bool = False,
 ) -> Cluster:
+    """部署集群, 指纹未变化时跳过模组下载、上传, 运行中的容器也不重启.
+
+    Args:
+        id (int): 部署ID.
+        cluster (Cluster): cluster.
+        version (str | None, optional): dst版本, 默认最新版本.
+        progress (Callable[[str], Awaitable[None]] | None, optional): 进度回调, 参数为阶段名.
+        restart (bool, optional): 指纹未变化时也重启容器.
+
+    Returns:
+        Cluster: 部署后的cluster.
+    """
+
+    async def report(stage: str):
+        if progress is not None:
+            await progress(stage)
+
     if version is None:
         version = await steamcmd.dst_version()
     image = DST_IMAGE + ":" + version
-    cluster.auto_port(id)
+    await report("schedule")
+    await scheduler.place(cluster)
+    await scheduler.assign_cpuset(id, cluster)
+    cluster.auto_port(await ports.allocate(id, cluster))
     path = get_archive_path(id)
     cluster.save(path)
-    await download_mods(cluster.mods, path)
+    # 模组更新时间只获取一次, 同时用于指纹和下载
+    details = await steamcmd.publishedfiledetails(cluster.mods) if cluster.mods else None
+    digest = fingerprint(path, image, details)
     tasks = {}
     for index, world in enumerate(cluster.world):
         docker_api = world.docker_api
@@ -423,14 +583,45 @@ async def deploy(
         world.version = version
         world.container = f"dst_{world.type.lower()}_{id}_{index}"
         tasks[docker_api].append(world)
+    # 容器的资源限制和日志配置变化时也需要重建容器
+    host_digests = {}
+    for docker_api, worlds in tasks.items():
+        config = json.dumps([cluster.log.log_config, [world.host_config for world in worlds]], sort_keys=True)
+        host_digests[docker_api] = hashlib.sha256(f"{digest}:{docker_api}:{config}".encode()).hexdigest()
+    if all(world.fingerprint == host_digests[world.docker_api] for world in cluster.world):
+        log.info(f"cluster {id} fingerprint unchanged, skip download_mods")
+    else:
+        await report("download_mods")
+        await download_mods(cluster.mods, path, details)
     for docker_api in tasks:
+        host_digest = host_digests[docker_api]
+        archive_volume, mods_volume, ugc_volume = f"wendy_{id}", f"wendy_mods_{id}", f"wendy_ugc_{id}"
         async with aiodocker.Docker(docker_api) as docker:
+            await report(f"pull {docker_api}")
             await pull(image, docker)
-            archive_volume = await upload_archive(id, f"{path}/Cluster_1", docker)
-            mods_volume = await upload_mods(id, f"{path}/mods", docker)
-            ugc_volume = await upload_ugc_mods(id, f"{path}/ugc_mods", docker)
-            await update_mods(f"dst_update_mods_{id}", image, mods_volume, ugc_volume, docker)
+            unchanged = all(world.fingerprint == host_digest for world in tasks[docker_api])
+            unchanged = unchanged and await volumes_exist(docker, [archive_volume, mods_volume, ugc_volume])
+            if unchanged:
+                log.info(f"cluster {id} fingerprint unchanged on {docker_api}, skip upload")
+            else:
+                await report(f"upload {docker_api}")
+                archive_volume = await upload_archive(id, f"{path}/Cluster_1", docker)
+                mods_volume = await upload_mods(id, f"{path}/mods", docker)
+                ugc_volume = await upload_ugc_mods(id, f"{path}/ugc_mods", docker)
+                await report(f"update_mods {docker_api}")
+                await update_mods(
+                    f"dst_update_mods_{id}",
+                    image,
+                    mods_volume,
+                    ugc_volume,
+                    docker,
+                    log_config=cluster.log.log_config,
+                )
             for world in tasks[docker_api]:
+                if unchanged and not restart and await container_running(docker, world.container):
+                    log.info(f"cluster {id} world {world.name} unchanged and running, skip restart")
+                    continue
+                await report(f"deploy {world.name}")
                 await deploy_world(
                     docker,
                     image,
@@ -439,7 +630,10 @@ async def deploy(
                     mods_volume,
                     ugc_volume,
                     world.type,
+                    world.host_config,
+                    cluster.log.log_config,
                 )
+                world.fingerprint = host_digest
     return cluster
 
 
@@ -457,6 +651,42 @@ async def pull(image: str, docker: aiodocker.Docker) -> str:
     raise ValueError(f"image: {image} not found")
 
 
+async def run_busybox(
+    docker_api: str,
+    container_name: str,
+    command: str,
+    host_config: dict | None = None,
+    timeout: int = 30,
+) -> str:
+    """使用busybox执行一次性命令并返回输出.
+
+    Args:
+        docker_api (str): docker api.
+        container_name (str): 容器名.
+        command (str): sh命令.
+        host_config (dict | None): HostConfig.
+        timeout (int): 超时时间.
+
+    Returns:
+        str: 输出.
+    """
+    async with aiodocker.Docker(docker_api) as docker:
+        await pull("busybox:latest", docker)
+        config = {
+            "Image": "busybox:latest",
+            "RestartPolicy": {"Name": "no"},
+            "Cmd": ["sh", "-c", command],
+            "HostConfig": host_config or {},
+            "Tty": True,
+        }
+        container = await docker.containers.create_or_replace(container_name, config)
+        await container.start()
+        await container.wait(timeout=timeout)
+        lines = await container.log(stdout=True)
+        await container.delete(force=True)
+    return "".join(lines)
+
+
 async def delete(cluster: Cluster):
     for world in cluster.world:
         async with aiodocker.Docker(world.docker_api) as docker:
@@ -520,20 +750,21 @@ async def redeploy(
 
 
 async def monitor():
-    # TODO 这里会和接口处的状态修改冲突, 没想到好的解决办法, 只能说以期望的状态运行
+    # 重新部署通过任务队列执行, 与接口提交的任务串行, 已有未完成任务时跳过
+    from wendy import jobs
+
     while True:
         try:
             version = await steamcmd.dst_version()
             async for item in models.Deploy.all():
+                # 任务完成前部署状态仍为pending/stop, 不能停止任务刚启动的容器
+                if await jobs.active(item.id):
+                    continue
                 cluster = Cluster.model_validate(item.cluster)
                 if item.status in (DeployStatus.pending.value, DeployStatus.stop.value):
                     await stop(cluster)
-                else:
-                    if await redeploy(item.id, cluster, version):
-                        cluster = await deploy(item.id, cluster, version=version)
-                        await models.Deploy.filter(id=item.id).update(
-                            cluster=cluster.model_dump(),
-                        )
+                elif await redeploy(item.id, cluster, version):
+                    await jobs.submit(item.id, "redeploy")
         except Exception:
             import traceback
 
@@ -546,16 +777,17 @@ async def attach(
     command: str,
     docker_api: str,
     container_name: str,
-):
-    """控制台执行命令.
+    timeout: float = CONSOLE_TIMEOUT,
+) -> List[str]:
+    """控制台执行命令, 复用容器的attach会话.
 
     Args:
         command (str): 命令.
         docker_api (str): DOCKER API.
         container_name (str): 容器名.
+        timeout (float): 等待输出的最长时间(秒).
+
+    Returns:
+        List[str]: 命令的输出.
     """
-    async with aiodocker.Docker(docker_api) as docker:
-        container = await docker.containers.get(container_name)
-        console = container.attach(stdout=True, stderr=True, stdin=True)
-        async with console:
-            await console.write_in(command.encode())
+    return await console.execute(command, docker_api, container_name, timeout)
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from wendy.api import deploy, cluster, console, mod, stats
+from wendy.api import deploy, cluster, console, mod, stats, host, job, metric
 
 
 router = APIRouter()
@@ -40,3 +40,21 @@ router.include_router(
     prefix="/stats",
     tags=["资源消耗"],
 )
+
+router.include_router(
+    host.router,
+    prefix="/host",
+    tags=["主机"],
+)
+
+router.include_router(
+    job.router,
+    prefix="/job",
+    tags=["任务"],
+)
+
+router.include_router(
+    metric.router,
+    prefix="/metric",
+    tags=["资源历史"],
+)
@@ -1,32 +1,136 @@
+from typing import Dict, Literal
+
+import re
+import hashlib
+import posixpath
+from contextlib import AsyncExitStack
+
 import structlog
-from fastapi import APIRouter
+from fastapi import APIRouter, Query, Request, Response
 from fastapi.responses import StreamingResponse
 
-from wendy import models, agent
+from wendy import models, agent, archive
 from wendy.cluster import Cluster
 
 
 router = APIRouter()
 log = structlog.get_logger()
+# {etag: 完整下载的字节数}, 只保存在内存中, 大小未知(如重启后首次下载)时返回完整内容且不声明Accept-Ranges
+archive_sizes: Dict[str, int] = {}
+subset_paths = {
+    "all": "",
+    "master": "Master",
+    "master_save": "Master/save",
+    "latest": "",
+}
+
+
+def parse_range(value: str | None, size: int | None) -> int | None:
+    """解析"bytes=start-"形式的Range, 不支持时返回None."""
+    if not value or size is None:
+        return None
+    match = re.fullmatch(r"bytes=(\d+)-", value.strip())
+    if match is None:
+        return None
+    return int(match.group(1))
 
 
 @router.get(
     "/download/{id}",
-    description="下载存档",
+    description="下载存档, 支持子集、压缩以及ETag/Range续传",
 )
-async def download(id: int):
+async def download(
+    request: Request,
+    id: int,
+    subset: Literal["all", "master", "master_save", "latest"] = Query(default="all"),
+    compression: Literal["none", "gzip", "zstd"] = Query(default="none"),
+):
     deploy = await models.Deploy.get(id=id)
     cluster = Cluster.model_validate(deploy.cluster)
     docker_api = None
     for world in cluster.world:
         docker_api = world.docker_api
-    tar_file = await agent.download_archive(id, docker_api)
-    tar_file.fileobj.seek(0)
-    def file_chunk_generator(fileobj, chunk_size=8192):
-        while chunk := fileobj.read(chunk_size):
-            yield chunk
+    compressor = archive.Compressor(compression)
+    path = posixpath.join(agent.ARCHIVE_TARGET_PATH, subset_paths[subset]).rstrip("/")
+    stack = AsyncExitStack()
+    busybox = await stack.enter_async_context(agent.archive_busybox(id, docker_api))
+    try:
+        files = await agent.list_archive(busybox, path)
+    except Exception:
+        await stack.aclose()
+        raise
+    digest = hashlib.sha256("\n".join([str(id), subset, compression, *files]).encode()).hexdigest()[:32]
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Content-Disposition": f"attachment; filename=archive_{id}{compressor.suffix}",
+    }
+    if request.headers.get("if-none-match") == etag:
+        await stack.aclose()
+        return Response(status_code=304, headers=headers)
+    size = archive_sizes.get(etag)
+    if_range = request.headers.get("if-range")
+    start = parse_range(request.headers.get("range"), size) if if_range in (None, etag) else None
+    status_code = 200
+    if size is not None:
+        headers["Accept-Ranges"] = "bytes"
+        headers["Content-Length"] = str(size)
+    if start is not None:
+        if start >= size:
+            await stack.aclose()
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{size - 1}/{size}"
+        headers["Content-Length"] = str(size - start)
+    excluded = set()
+    if subset == "latest":
+        excluded = archive.latest_snapshots([line.split(" ", 2)[-1] for line in files])
+    base = posixpath.dirname(path)
+
+    def keep(name: str) -> bool:
+        return posixpath.join(base, name).rstrip("/") not in excluded
+
+    async def generator():
+        tar_filter = archive.TarFilter(keep) if excluded else None
+        skip = start or 0
+        total = 0
+
+        def output(data: bytes) -> bytes:
+            nonlocal skip, total
+            data = compressor.compress(data)
+            total += len(data)
+            if skip:
+                n = min(skip, len(data))
+                data, skip = data[n:], skip - n
+            return data
+
+        try:
+            async for chunk in agent.stream_archive(busybox, path):
+                if tar_filter is not None:
+                    chunk = tar_filter.feed(chunk)
+                if data := output(chunk):
+                    yield data
+            tail = output(tar_filter.close()) if tar_filter is not None else b""
+            flushed = compressor.flush()
+            total += len(flushed)
+            if skip:
+                flushed = flushed[skip:]
+            if tail + flushed:
+                yield tail + flushed
+            if size is not None and total != size:
+                # 内容与ETag相同时的输出不一致, 不再支持续传
+                log.warning(f"archive {id} size changed: {size} -> {total}")
+                archive_sizes.pop(etag, None)
+            else:
+                archive_sizes[etag] = total
+            while len(archive_sizes) > 1024:
+                archive_sizes.pop(next(iter(archive_sizes)))
+        finally:
+            await stack.aclose()
+
     return StreamingResponse(
-        file_chunk_generator(tar_file.fileobj),
-        media_type="application/x-tar",
-        headers={"Content-Disposition": f"attachment; filename=archive_{id}.tar"},
+        generator(),
+        status_code=status_code,
+        media_type=compressor.media_type,
+        headers=headers,
     )
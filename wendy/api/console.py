@@ -1,30 +1,92 @@
-from typing import Dict
+from typing import Dict, List, Literal
 
 import json
+import time
 import asyncio
+from functools import partial
 
-import httpx
 import structlog
+from pydantic import BaseModel
 from sse_starlette.sse import EventSourceResponse
-from fastapi import APIRouter, Body, Query, Request
+from fastapi import APIRouter, Body, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 
-from wendy import agent, models
+from wendy import agent, console, logstore, models, shards
+from wendy.hub import Channel
+from wendy.sse import BoundedQueue
+from wendy.logs import FrameDecoder, LogFilter, docker_client, follow, hub, level, local_log_path, tail_file
 from wendy.constants import DeployStatus
 from wendy.cluster import Cluster, ClusterWorld
+from wendy.settings import CONSOLE_TIMEOUT, CONSOLE_CONCURRENCY
 
 
 router = APIRouter()
 log = structlog.get_logger()
 
 
+class BroadcastTarget(BaseModel):
+    """广播目标, world_names为空时发送到部署的全部世界"""
+
+    id: int
+    world_names: List[str] = []
+
+
+class BroadcastResult(BaseModel):
+    id: int
+    world: str
+    output: List[str] = []
+    error: str | None = None
+
+
+@router.post(
+    "/broadcast",
+    description="向多个部署的控制台并发执行命令, 各条件同时生效, status为空时不限状态",
+)
+async def broadcast(
+    command: str = Body(),
+    status: Literal["pending", "running", "stop"] | None = Body(default="running"),
+    docker_api: str | None = Body(default=None),
+    targets: List[BroadcastTarget] | None = Body(default=None),
+    concurrency: int = Body(default=CONSOLE_CONCURRENCY, ge=1),
+    timeout: float = Body(default=CONSOLE_TIMEOUT),
+) -> List[BroadcastResult]:
+    command = command.strip() + "\n"
+    deploys = models.Deploy.all()
+    if status is not None:
+        deploys = deploys.filter(status=status)
+    selected = {item.id: set(item.world_names) for item in targets or []}
+    if targets is not None:
+        deploys = deploys.filter(id__in=list(selected))
+    worlds: List[tuple] = []
+    async for deploy in deploys:
+        cluster = Cluster.model_validate(deploy.cluster)
+        for world in cluster.world:
+            if docker_api is not None and world.docker_api != docker_api:
+                continue
+            if selected.get(deploy.id) and world.name not in selected[deploy.id]:
+                continue
+            worlds.append((deploy.id, world))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(deploy_id: int, world: ClusterWorld) -> BroadcastResult:
+        async with semaphore:
+            try:
+                output = await agent.attach(command, world.docker_api, world.container, timeout)
+            except Exception as e:
+                return BroadcastResult(id=deploy_id, world=world.name, error=str(e) or type(e).__name__)
+        return BroadcastResult(id=deploy_id, world=world.name, output=output)
+
+    return await asyncio.gather(*(run(deploy_id, world) for deploy_id, world in worlds))
+
+
 @router.post(
     "/{id}",
-    description="控制台执行命令",
+    description="控制台执行命令, 返回命令执行期间的输出",
 )
 async def command_(
     id: int,
     command: str = Body(),
     world_index: int = Body(),
+    timeout: float = Body(default=CONSOLE_TIMEOUT),
 ):
     command = command.strip() + "\n"
     deploy = await models.Deploy.get(id=id)
@@ -32,18 +94,18 @@ async def command_(
     world = cluster.world[world_index]
     docker_api = world.docker_api
     container_name = world.container
-    await agent.attach(command, docker_api, container_name)
-    return "ok"
+    return await agent.attach(command, docker_api, container_name, timeout)
 
 
 @router.post(
     "/command/{id}",
-    description="控制台执行命令",
+    description="控制台执行命令, 返回命令执行期间的输出",
 )
 async def command(
     id: int,
     command: str = Body(),
     world_name: str = Body(),
+    timeout: float = Body(default=CONSOLE_TIMEOUT),
 ):
     command = command.strip() + "\n"
     deploy = await models.Deploy.get(id=id)
@@ -55,8 +117,7 @@ async def command(
             container_name = world.container
     if docker_api is None:
         raise ValueError(f"world {world_name} not found")
-    await agent.attach(command, docker_api, container_name)
-    return "ok"
+    return await agent.attach(command, docker_api, container_name, timeout)
 
 
 @router.get(
@@ -73,13 +134,17 @@ async def tail_logs(
     deploy = await models.Deploy.get(id=id)
     cluster = Cluster.model_validate(deploy.cluster)
     world = cluster.world[world_index]
-    if world.docker_api.startswith("http"):
-        transport = None
-        base_url = world.docker_api.replace("unix://", "")
-    else:
-        transport = httpx.AsyncHTTPTransport(uds="/var/run/docker.sock")
-        base_url = "http://docker"
-    async with httpx.AsyncClient(transport=transport, base_url=base_url) as client:
+    # 本机json-file日志直接从文件末尾读取, 避免docker扫描整个日志文件
+    path = await local_log_path(world)
+    if path is not None:
+        try:
+            lines = await asyncio.to_thread(tail_file, path, tail)
+        except (OSError, ValueError) as e:
+            log.warning(f"tail log file {path} failed: {e}")
+            lines = None
+        if lines is not None:
+            return [line.strip() for line in lines][: max(count, 0)]
+    async with docker_client(world.docker_api) as client:
         url = f"/containers/{world.container}/logs"
         params = {
             "stdout": True,
@@ -87,19 +152,29 @@ async def tail_logs(
             "follow": False,
             "tail": tail,
         }
-        line = ""
+        decoder = FrameDecoder()
         async with client.stream("GET", url, params=params) as response:
             async for chunk in response.aiter_bytes():
-                for ch in chunk.decode("utf-8"):
-                    if ch == "\n":
-                        if count > 0:
-                            data.append(line.strip())
-                            count -= 1
-                        line = ""
-                    else:
-                        line += ch
-                if count <= 0:
+                data.extend(line.strip() for _, line in decoder.feed(chunk))
+                if len(data) >= count:
                     break
+            else:
+                data.extend(line.strip() for _, line in decoder.close())
+    return data[: max(count, 0)]
+
+
+@router.get(
+    "/state",
+    description="分片实时状态: 在线玩家、天数季节、世界生成进度及是否就绪, 由日志增量解析",
+)
+async def state(
+    deploy_id: List[int] = Query(default=[]),
+) -> List[dict]:
+    data = []
+    for (item_id, world), item in sorted(shards.states.items()):
+        if deploy_id and item_id not in deploy_id:
+            continue
+        data.append({"deploy_id": item_id, "world": world, **item.data()})
     return data
 
 
@@ -108,57 +183,59 @@ class LogFollow:
         self,
         request: Request,
         since: int,
+        deploy_ids: List[int] | None = None,
+        world_names: List[str] | None = None,
+        log_filter: LogFilter | None = None,
     ):
         self.request = request
         self.since = since
-        self.queue = asyncio.Queue()
-        self.tasks: Dict[str, asyncio.Task] = {}
-        self.lock = asyncio.Lock()
+        # 只订阅指定的部署和世界, 为空时订阅全部
+        self.deploy_ids = set(deploy_ids or [])
+        self.world_names = set(world_names or [])
+        self.log_filter = log_filter or LogFilter()
+        self.queue = BoundedQueue()
+        # {上游key: 前端key}
+        self.keys: Dict[str, str] = {}
+        self.channels: Dict[str, Channel] = {}
         self._started = False
         self._task: asyncio.Task | None = None
 
     def __aiter__(self):
         return self
 
-    async def _read(
-        self,
-        key: str,
-        world: ClusterWorld,
-    ):
-        if world.docker_api.startswith("http"):
-            transport = None
-            base_url = world.docker_api.replace("unix://", "")
-        else:
-            transport = httpx.AsyncHTTPTransport(uds="/var/run/docker.sock")
-            base_url = "http://docker"
-        try:
-            async with httpx.AsyncClient(transport=transport, base_url=base_url) as client:
-                url = f"/containers/{world.container}/logs"
-                params = {
-                    "stdout": True,
-                    "stderr": True,
-                    "follow": True,
-                    "since": self.since,
-                }
-                timeout = httpx.Timeout(None, connect=5)
-                async with client.stream("GET", url, params=params, timeout=timeout) as response:
-                    async for line in response.aiter_lines():
-                        await self.queue.put(json.dumps({"key": key, "data": line.strip()}))
-        finally:
-            async with self.lock:
-                if key in self.tasks:
-                    self.tasks.pop(key)
+    def _replay(self, item: dict) -> bool:
+        return item["time"] >= self.since and self.log_filter(item)
 
     async def _watch_tasks(self):
         running = DeployStatus.running.value
-        async with self.lock:
-            async for deploy in models.Deploy.filter(status=running):
-                cluster = Cluster.model_validate(deploy.cluster)
-                for index, world in enumerate(cluster.world):
-                    key = f"log_{deploy.id}_{index}"
-                    if key not in self.tasks:
-                        task = asyncio.create_task(self._read(key, world))
-                        self.tasks[key] = task
+        keys: Dict[str, str] = {}
+        worlds: Dict[str, ClusterWorld] = {}
+        deploys = models.Deploy.filter(status=running)
+        if self.deploy_ids:
+            deploys = deploys.filter(id__in=self.deploy_ids)
+        async for deploy in deploys:
+            cluster = Cluster.model_validate(deploy.cluster)
+            for index, world in enumerate(cluster.world):
+                if self.world_names and world.name not in self.world_names:
+                    continue
+                channel_key = f"{world.docker_api}/{world.container}"
+                keys[channel_key] = f"log_{deploy.id}_{index}"
+                worlds[channel_key] = world
+        for channel_key in self.channels.keys() - keys.keys():
+            hub.unsubscribe(channel_key, self.queue)
+            self.channels.pop(channel_key)
+        self.keys = keys
+        for channel_key, world in worlds.items():
+            channel = self.channels.get(channel_key)
+            if channel is None or hub.channels.get(channel_key) is not channel:
+                source = partial(follow, world=world)
+                self.channels[channel_key] = hub.subscribe(
+                    channel_key,
+                    source,
+                    self.queue,
+                    accept=self.log_filter,
+                    replay=self._replay,
+                )
 
     async def _run(self):
         while True:
@@ -171,19 +248,200 @@ class LogFollow:
 
     async def aclose(self):
         self._task.cancel()
-        for _, task in self.tasks.items():
-            task.cancel()
+        for channel_key in self.channels:
+            hub.unsubscribe(channel_key, self.queue)
+        self.channels.clear()
 
     async def __anext__(self):
         if not self._started:
             self._task = asyncio.create_task(self._run())
             self._started = True
-        return await self.queue.get()
+        while True:
+            items = [
+                {
+                    "key": self.keys[channel_key],
+                    "data": item["data"].strip(),
+                    "level": level(item),
+                }
+                for channel_key, item in await self.queue.get_batch()
+                if channel_key in self.keys
+            ]
+            dropped = self.queue.take_dropped()
+            if items or dropped:
+                return json.dumps({"items": items, "dropped": dropped})
 
     async def __aexit__(self, _exc_type, _exc, _tb):
         await self.aclose()
 
 
-@router.get("/logs/follow")
-async def logs(request: Request, since: int = Query(default=0)):
-    return EventSourceResponse(LogFollow(request, since), send_timeout=60)
+@router.get(
+    "/logs/follow",
+    description="订阅在线日志, 可按部署、世界、关键字及级别过滤",
+)
+async def logs(
+    request: Request,
+    since: int = Query(default=0),
+    deploy_id: List[int] = Query(default=[]),
+    world_name: List[str] = Query(default=[]),
+    grep: str | None = Query(default=None),
+    regex: bool = Query(default=False),
+    min_level: Literal["info", "warning", "error"] = Query(default="info"),
+):
+    try:
+        log_filter = LogFilter(grep, regex, min_level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return EventSourceResponse(
+        LogFollow(request, since, deploy_id, world_name, log_filter),
+        send_timeout=60,
+    )
+
+
+@router.get(
+    "/logs/search",
+    description="搜索历史日志, 关键字中的英文单词需完整匹配",
+)
+async def search_logs(
+    deploy_id: int = Query(),
+    world_name: str | None = Query(default=None),
+    start: float | None = Query(default=None),
+    end: float | None = Query(default=None),
+    keyword: str = Query(default=""),
+    limit: int = Query(default=500),
+):
+    deploy = await models.Deploy.get(id=deploy_id)
+    cluster = Cluster.model_validate(deploy.cluster)
+    worlds = [world.name for world in cluster.world]
+    if world_name is not None:
+        if world_name not in worlds:
+            raise HTTPException(status_code=404, detail=f"world {world_name} not found")
+        worlds = [world_name]
+    end = end or time.time()
+    start = start if start is not None else end - 86400
+    return await asyncio.to_thread(logstore.search, deploy_id, worlds, start, end, keyword, limit)
+
+
+class ConsoleSocket:
+    """一个websocket连接上的多个控制台频道, 共享容器的attach会话.
+
+    客户端消息:
+        {"type": "open", "channel": 频道名, "deploy_id": 部署ID, "world_name": 世界名称}
+        {"type": "command", "channel": 频道名, "command": 命令}
+        {"type": "close", "channel": 频道名}
+    服务端消息:
+        {"type": "opened" | "closed", "channel": 频道名}
+        {"type": "output", "channel": 频道名, "items": [{"time", "stream", "data"}, ...]}
+        {"type": "dropped", "count": 丢弃行数}
+        {"type": "error", "channel": 频道名, "message": 错误信息}
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.queue = BoundedQueue()
+        # {频道名: 会话}
+        self.channels: Dict[str, console.Session] = {}
+
+    async def open(self, channel: str, deploy_id: int, world_name: str):
+        deploy = await models.Deploy.get(id=deploy_id)
+        cluster = Cluster.model_validate(deploy.cluster)
+        for world in cluster.world:
+            if world.name == world_name:
+                break
+        else:
+            raise ValueError(f"world {world_name} not found")
+        self.close(channel)
+        session = await console.get(world.docker_api, world.container)
+        session.listeners.add(self.queue)
+        self.channels[channel] = session
+        await self.websocket.send_json({"type": "opened", "channel": channel})
+
+    def close(self, channel: str):
+        session = self.channels.pop(channel, None)
+        if session is not None and session not in self.channels.values():
+            session.listeners.discard(self.queue)
+
+    async def command(self, channel: str, command: str):
+        session = self.channels.get(channel)
+        if session is None:
+            raise ValueError(f"channel {channel} not opened")
+        if session.closed:
+            session = await self.reopen(session)
+        # 不等待输出, 输出通过订阅推送
+        async with session.lock:
+            await session.write(command.strip() + "\n")
+
+    async def reopen(self, session: console.Session) -> console.Session:
+        """会话断开(如容器重启)后重新连接, 同一会话的频道一起切换."""
+        current = await console.get(session.docker_api, session.container)
+        current.listeners.add(self.queue)
+        for name, item in self.channels.items():
+            if item is session:
+                self.channels[name] = current
+        return current
+
+    async def send(self):
+        while True:
+            try:
+                # 交互场景只短暂合并, 保证回显延迟
+                batch = await asyncio.wait_for(self.queue.get_batch(interval=0.02), 5)
+            except asyncio.TimeoutError:
+                batch = []
+            for session in set(self.channels.values()):
+                if session.closed:
+                    try:
+                        await self.reopen(session)
+                    except Exception as e:
+                        log.warning(f"reopen console {session.key} failed: {e}")
+            if dropped := self.queue.take_dropped():
+                await self.websocket.send_json({"type": "dropped", "count": dropped})
+            items: Dict[str, list] = {}
+            for key, item in batch:
+                items.setdefault(key, []).append(item)
+            for channel, session in list(self.channels.items()):
+                if session.key in items:
+                    await self.websocket.send_json({"type": "output", "channel": channel, "items": items[session.key]})
+
+    async def receive(self):
+        while True:
+            frame = await self.websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            # 格式错误的消息只回复错误, 不影响连接上的其他频道
+            channel = ""
+            try:
+                message = json.loads(frame.get("text") or frame.get("bytes") or "")
+                if not isinstance(message, dict):
+                    raise ValueError("message must be a json object")
+                channel = str(message.get("channel", ""))
+                match message.get("type"):
+                    case "open":
+                        await self.open(channel, int(message["deploy_id"]), str(message["world_name"]))
+                    case "command":
+                        await self.command(channel, str(message["command"]))
+                    case "close":
+                        self.close(channel)
+                        await self.websocket.send_json({"type": "closed", "channel": channel})
+                    case other:
+                        raise ValueError(f"unknown message type {other}")
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                await self.websocket.send_json({"type": "error", "channel": channel, "message": str(e)})
+
+    async def run(self):
+        await self.websocket.accept()
+        sender = asyncio.create_task(self.send())
+        try:
+            await self.receive()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+            for channel in list(self.channels):
+                self.close(channel)
+
+
+@router.websocket("/ws")
+async def console_ws(websocket: WebSocket):
+    """多路复用的交互式控制台"""
+    await ConsoleSocket(websocket).run()
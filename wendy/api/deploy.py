@@ -1,18 +1,15 @@
 from typing import Literal
 
 import os
-import shutil
-import zipfile
-import tarfile
+import asyncio
 import tempfile
-from io import BytesIO
 
 import structlog
 import aiodocker
-from tortoise.transactions import atomic
 from fastapi import APIRouter, Body, File, UploadFile, Query
+from tortoise.contrib.pydantic import pydantic_model_creator
 
-from wendy import models, agent
+from wendy import models, agent, archive, jobs, ports, scheduler
 from wendy.cluster import Cluster
 from wendy.constants import DeployStatus
 from wendy.settings import DOCKER_API_DEFAULT
@@ -20,13 +17,15 @@ from wendy.settings import DOCKER_API_DEFAULT
 
 router = APIRouter()
 log = structlog.get_logger()
+DeployOut = pydantic_model_creator(models.Deploy, name="DeployOut")
+JobOut = pydantic_model_creator(models.Job, name="JobOut")
 
 
 @router.post(
     "",
-    description="部署并启动",
+    description="创建部署, status为running时提交部署任务并返回任务, 否则返回部署",
+    response_model=JobOut | DeployOut,
 )
-@atomic(connection_name="default")
 async def create(
     cluster: Cluster = Body(),
     status: Literal["pending", "running"] = Body(default="running"),
@@ -36,28 +35,22 @@ async def create(
         status=DeployStatus.pending.value,
     )
     if status == "running":
-        cluster = await agent.deploy(deploy.id, cluster)
-        deploy.cluster = cluster.model_dump()
-        deploy.status = DeployStatus.running.value
-        await deploy.save()
+        return await jobs.submit(deploy.id, "deploy")
     return deploy
 
 
 @router.put(
     "/{id}",
-    description="更新配置并部署",
+    description="更新配置并部署, 返回部署任务",
 )
 async def update(
     id: int,
     cluster: Cluster = Body(),
 ):
     # TODO 如果修改的是docker_api需要同步存档
-    deploy = await models.Deploy.get(id=id)
-    cluster = await agent.deploy(deploy.id, cluster)
-    deploy.cluster = cluster.model_dump()
-    deploy.status = DeployStatus.running.value
-    await deploy.save()
-    return deploy
+    await models.Deploy.get(id=id)
+    await models.Deploy.filter(id=id).update(cluster=cluster.model_dump())
+    return await jobs.submit(id, "update")
 
 
 @router.get(
@@ -89,6 +82,7 @@ async def remove(id: int):
     deploy = await models.Deploy.get(id=id)
     cluster = Cluster.model_validate(deploy.cluster)
     await agent.delete(cluster)
+    await ports.release(id)
     return await models.Deploy.filter(id=id).delete()
 
 
@@ -105,16 +99,11 @@ async def stop(id: int):
 
 @router.get(
     "/restart/{id}",
-    description="重启",
+    description="重启, 返回部署任务",
 )
 async def restart(id: int):
     deploy = await models.Deploy.get(id=id)
-    cluster = Cluster.model_validate(deploy.cluster)
-    await agent.deploy(deploy.id, cluster)
-    deploy.cluster = cluster.model_dump()
-    deploy.status = DeployStatus.running.value
-    await deploy.save()
-    return "ok"
+    return await jobs.submit(deploy.id, "restart")
 
 
 @router.post(
@@ -131,38 +120,22 @@ async def upload(
         docker_api (str, optional): docker api.
         file (UploadFile): 存档文件.
     """
-    filename = file.filename
-    file_content = await file.read(1_073_741_824)
-    _, suffix = os.path.splitext(filename)
-    if suffix == ".zip":
-        temp_dir = tempfile.mkdtemp()
-        with zipfile.ZipFile(BytesIO(file_content), "r") as zip_ref:
-            zip_ref.extractall(temp_dir)
-    elif suffix == ".tar":
-        temp_dir = tempfile.mkdtemp()
-        with tarfile.open(fileobj=BytesIO(file_content), mode="r:*") as tar_ref:
-            tar_ref.extractall(temp_dir)
-    else:
-        raise ValueError(f"Unsupported {suffix}")
-    target_path = None
-    target_file = "cluster.ini"
-    for dirpath, _, filenames in os.walk(temp_dir):
-        if target_file in filenames:
-            target_path = dirpath
-    if target_path is None:
-        raise ValueError(f"not found {target_file}")
-    cluster = Cluster.create_from_dir(target_path, docker_api)
-    deploy = await models.Deploy.create(
-        cluster=cluster.model_dump(),
-        status=DeployStatus.pending.value,
-    )
-    temp_path = tempfile.mkdtemp()
-    archive_path = os.path.join(temp_path, "Cluster_1")
-    shutil.move(target_path, archive_path)
-    async with aiodocker.Docker(docker_api) as docker:
-        await agent.upload_archive(
-            id=deploy.id,
-            archive_path=archive_path,
-            docker=docker,
+    _, suffix = os.path.splitext(file.filename)
+    # UploadFile已由starlette分块落盘, 在线程中直接从文件解压cluster.ini所在目录
+    with tempfile.TemporaryDirectory() as temp_dir:
+        archive_path = os.path.join(temp_dir, "Cluster_1")
+        await asyncio.to_thread(archive.extract_cluster, file.file, suffix, archive_path)
+        cluster = await scheduler.place(Cluster.create_from_dir(archive_path, docker_api))
+        deploy = await models.Deploy.create(
+            cluster=cluster.model_dump(),
+            status=DeployStatus.pending.value,
         )
+        for docker_api in {world.docker_api for world in cluster.world}:
+            async with aiodocker.Docker(docker_api) as docker:
+                await agent.upload_archive(
+                    id=deploy.id,
+                    archive_path=archive_path,
+                    docker=docker,
+                )
+    await file.close()
     return deploy
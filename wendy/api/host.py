@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Query
+
+from wendy import scheduler
+
+
+router = APIRouter()
+
+
+@router.get(
+    "",
+    description="获取主机负载",
+)
+async def reads():
+    loads = await scheduler.hosts_load()
+    return [
+        {
+            **item.model_dump(exclude={"containers"}),
+            "cpu_usage": item.cpu_usage,
+            "memory_usage": item.memory_usage,
+            "utilization": item.utilization,
+        }
+        for item in loads
+    ]
+
+
+@router.get(
+    "/rebalance",
+    description="获取迁移建议",
+)
+async def rebalance(threshold: float = Query(default=0.2)):
+    return await scheduler.rebalance(threshold)
@@ -0,0 +1,63 @@
+import json
+import asyncio
+
+from fastapi import APIRouter, Query, Request
+from sse_starlette.sse import EventSourceResponse
+
+from wendy import jobs, models
+from wendy.constants import JobStatus
+
+
+router = APIRouter()
+
+
+@router.get(
+    "",
+    description="获取部署任务",
+)
+async def reads(
+    deploy_id: int | None = Query(default=None),
+    status: JobStatus | None = Query(default=None),
+    limit: int = Query(default=100),
+):
+    query = models.Job.all()
+    if deploy_id is not None:
+        query = query.filter(deploy_id=deploy_id)
+    if status is not None:
+        query = query.filter(status=status.value)
+    return await query.order_by("-id").limit(limit)
+
+
+@router.get(
+    "/{id}",
+    description="获取部署任务状态和进度",
+)
+async def read(id: int):
+    return await models.Job.get(id=id)
+
+
+@router.get(
+    "/{id}/events",
+    description="部署任务进度事件",
+)
+async def events(request: Request, id: int):
+    job = await models.Job.get(id=id)
+    finished = (JobStatus.success.value, JobStatus.failed.value)
+
+    async def generator():
+        subscriber = jobs.subscribe(id)
+        try:
+            event = {"status": job.status, "progress": job.progress, "error": job.error}
+            while True:
+                yield json.dumps(event)
+                if event["status"] in finished or await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(subscriber.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    current = await models.Job.get(id=id)
+                    event = {"status": current.status, "progress": current.progress, "error": current.error}
+        finally:
+            jobs.unsubscribe(id, subscriber)
+
+    return EventSourceResponse(generator(), send_timeout=60)
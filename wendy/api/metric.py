@@ -0,0 +1,29 @@
+import time
+from typing import Literal
+
+from fastapi import APIRouter, HTTPException, Query
+
+from wendy import history
+
+
+router = APIRouter()
+
+
+@router.get(
+    "",
+    description="查询资源指标历史, 未指定粒度时按时间范围自动选择秒/分钟/小时",
+)
+async def read(
+    deploy_id: int = Query(),
+    world_name: str = Query(),
+    metric: Literal[history.METRICS] = Query(default="cpu_percent"),
+    start: int | None = Query(default=None),
+    end: int | None = Query(default=None),
+    resolution: int | None = Query(default=None, description="1, 60或3600"),
+):
+    end = end or int(time.time())
+    start = start if start is not None else end - 3600
+    try:
+        return await history.query(deploy_id, world_name, metric, start, end, resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
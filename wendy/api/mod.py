@@ -1,48 +1,32 @@
 from typing import List
 
-import io
-import os
-import zipfile
-
 from pydantic import BaseModel
-from fastapi import APIRouter, Body, Response
+from fastapi import APIRouter, Body
+from fastapi.responses import StreamingResponse
 
-from wendy import steamcmd
-from wendy.agent import download_mods
-from wendy.settings import GAME_ARCHIVE_PATH
+from wendy import artifact, modinfo, steamcmd
 
 
 router = APIRouter()
 
 
 class ModInfo(BaseModel):
-    """模组modinfo.lua内容"""
+    """模组modinfo.lua内容及解析结果"""
 
     id: str
     code: str | bytes
+    info: dict | None = None
+    error: str | None = None
 
 
 @router.post(
     "/info",
-    description="获取模组modinfo.lua内容",
+    description="获取模组modinfo.lua内容及解析结果",
 )
 async def read_modinfo(
     mods: List[str] = Body(),
 ) -> List[ModInfo]:
-    mods_path = await download_mods(
-        mods=mods,
-        path=os.path.join(GAME_ARCHIVE_PATH, "mods"),
-    )
-    data = []
-    for mod_id in mods:
-        if mod_id in mods_path:
-            mod_path = mods_path[mod_id]
-            with open(os.path.join(mod_path, "modinfo.lua"), "r") as file:
-                code = file.read()
-        else:
-            code = ""
-        data.append(ModInfo(id=mod_id, code=code))
-    return data
+    return [ModInfo(**item) for item in await modinfo.load(mods)]
 
 
 @router.post(
@@ -52,25 +36,16 @@ async def read_modinfo(
 async def download(
     mods: List[str] = Body(),
 ):
-    mods_path = await download_mods(
-        mods=mods,
-        path=os.path.join(GAME_ARCHIVE_PATH, "mods"),
-    )
-    buffer = io.BytesIO()
-    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for mod_id in mods:
-            if mod_id in mods_path:
-                mod_path = mods_path[mod_id]
-                zip_file.write(mod_path, mod_id)
-                for root, _, files in os.walk(mod_path):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.join(mod_id, os.path.relpath(file_path, mod_path))
-                        zip_file.write(file_path, arcname)
-    buffer.seek(0)
-    return Response(
-        content=buffer.read(),
-        headers={"Content-Disposition": "attachment; filename=mods.zip"},
+    # 重复的模组只打包一次
+    mods = list(dict.fromkeys(mods))
+    paths = await artifact.artifacts(mods)
+    size, content = await artifact.bundle([paths[mod_id] for mod_id in mods if mod_id in paths])
+    return StreamingResponse(
+        content,
+        headers={
+            "Content-Disposition": "attachment; filename=mods.zip",
+            "Content-Length": str(size),
+        },
         media_type="application/zip",
     )
 
@@ -1,14 +1,17 @@
 import json
 import time
-from typing import Dict
+from typing import Dict, List
 
 import asyncio
+from functools import partial
 
-import httpx
 from fastapi import APIRouter, Request, Query
 from sse_starlette.sse import EventSourceResponse
 
-from wendy import models
+from wendy import models, metrics
+from wendy.hub import Channel
+from wendy.stats import channel_key, collect, hub
+from wendy.sse import BoundedQueue
 from wendy.constants import DeployStatus
 from wendy.cluster import Cluster, ClusterWorld
 
@@ -20,53 +23,38 @@ class Stats:
     def __init__(self, request: Request, interval: int):
         self.request = request
         self.interval = interval
-        self.queue = asyncio.Queue()
-        self.tasks: Dict[str, asyncio.Task] = {}
-        self.lock = asyncio.Lock()
+        self.queue = BoundedQueue()
+        # {上游key: 前端key}
+        self.keys: Dict[str, str] = {}
+        self.channels: Dict[str, Channel] = {}
         self._started = False
         self._task: asyncio.Task | None = None
 
     def __aiter__(self):
         return self
 
-    async def _read(
-        self,
-        key: str,
-        world: ClusterWorld,
-    ):
-        if world.docker_api.startswith("http"):
-            transport = None
-            base_url = world.docker_api.replace("unix://", "")
-        else:
-            transport = httpx.AsyncHTTPTransport(uds="/var/run/docker.sock")
-            base_url = "http://docker"
-        try:
-            async with httpx.AsyncClient(transport=transport, base_url=base_url) as client:
-                url = f"/containers/{world.container}/stats"
-                timeout = httpx.Timeout(None, connect=5)
-                async with client.stream("GET", url, timeout=timeout) as response:
-                    start_time = time.time()
-                    async for chunk in response.aiter_raw():
-                        current_time = time.time()
-                        elapsed_time = current_time - start_time
-                        if elapsed_time >= self.interval:
-                            await self.queue.put(json.dumps({"key": key, "data": json.loads(chunk)}))
-                            start_time = current_time
-        finally:
-            async with self.lock:
-                if key in self.tasks:
-                    self.tasks.pop(key)
+    def _replay(self, item: dict) -> bool:
+        return item["time"] >= time.time() - self.interval
 
     async def _watch_tasks(self):
         running = DeployStatus.running.value
-        async with self.lock:
-            async for deploy in models.Deploy.filter(status=running):
-                cluster = Cluster.model_validate(deploy.cluster)
-                for index, world in enumerate(cluster.world):
-                    key = f"stats_{deploy.id}_{index}"
-                    if key not in self.tasks:
-                        task = asyncio.create_task(self._read(key, world))
-                        self.tasks[key] = task
+        keys: Dict[str, str] = {}
+        worlds: Dict[str, ClusterWorld] = {}
+        async for deploy in models.Deploy.filter(status=running):
+            cluster = Cluster.model_validate(deploy.cluster)
+            for index, world in enumerate(cluster.world):
+                key = channel_key(world.docker_api, world.container)
+                keys[key] = f"stats_{deploy.id}_{index}"
+                worlds[key] = world
+        for key in self.channels.keys() - keys.keys():
+            hub.unsubscribe(key, self.queue)
+            self.channels.pop(key)
+        self.keys = keys
+        for key, world in worlds.items():
+            channel = self.channels.get(key)
+            if channel is None or hub.channels.get(key) is not channel:
+                source = partial(collect, world=world)
+                self.channels[key] = hub.subscribe(key, source, self.queue, replay=self._replay)
 
     async def _run(self):
         while True:
@@ -79,19 +67,32 @@ class Stats:
 
     async def aclose(self):
         self._task.cancel()
-        for _, task in self.tasks.items():
-            task.cancel()
+        for key in self.channels:
+            hub.unsubscribe(key, self.queue)
+        self.channels.clear()
 
     async def __anext__(self):
         if not self._started:
             self._task = asyncio.create_task(self._run())
             self._started = True
-        return await self.queue.get()
+        while True:
+            # 每个interval内的采样合并为一条
+            samples: Dict[str, List[dict]] = {}
+            for key, item in await self.queue.get_batch(self.queue.maxsize, self.interval):
+                if key in self.keys:
+                    samples.setdefault(self.keys[key], []).append(item)
+            items = [{"key": key, "data": metrics.merge(values)} for key, values in samples.items()]
+            dropped = self.queue.take_dropped()
+            if items or dropped:
+                return json.dumps({"items": items, "dropped": dropped})
 
     async def __aexit__(self, _exc_type, _exc, _tb):
         await self.aclose()
 
 
-@router.get("")
+@router.get(
+    "",
+    description="订阅容器资源指标, 每个interval秒推送一次汇总",
+)
 async def stats(request: Request, interval: int = Query()):
     return EventSourceResponse(Stats(request, interval), send_timeout=60)
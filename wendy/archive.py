@@ -0,0 +1,269 @@
+"""存档文件打包与解压"""
+
+from typing import BinaryIO, Callable, List, Set
+
+import os
+import zlib
+import shutil
+import tarfile
+import zipfile
+import posixpath
+
+import zstandard
+
+
+CLUSTER_INI = "cluster.ini"
+
+
+def safe_path(target: str, name: str) -> str | None:
+    """成员解压路径, 绝对路径或跳出目标目录时返回None.
+
+    Args:
+        target (str): 解压目录.
+        name (str): 成员相对路径.
+
+    Returns:
+        str | None: 解压路径.
+    """
+    name = posixpath.normpath(name.replace("\\", "/"))
+    if name.startswith("/") or name == ".." or name.startswith("../"):
+        return None
+    path = os.path.realpath(os.path.join(target, name))
+    if os.path.commonpath([path, os.path.realpath(target)]) != os.path.realpath(target):
+        return None
+    return path
+
+
+def cluster_prefix(names: List[str]) -> str:
+    """找到cluster.ini所在目录, 存在多个时取层级最浅的.
+
+    Args:
+        names (List[str]): 成员路径.
+
+    Returns:
+        str: 目录前缀, 以/结尾, 根目录为空字符串.
+    """
+    prefixes = []
+    for name in names:
+        name = name.replace("\\", "/")
+        if posixpath.basename(name) == CLUSTER_INI:
+            prefix = posixpath.dirname(name)
+            prefixes.append(prefix + "/" if prefix else "")
+    if not prefixes:
+        raise ValueError(f"not found {CLUSTER_INI}")
+    return min(prefixes, key=lambda item: item.count("/"))
+
+
+def extract_cluster(fileobj: BinaryIO, suffix: str, target: str) -> str:
+    """从存档压缩包中只解压cluster.ini所在目录, 逐个成员流式写入磁盘.
+
+    Args:
+        fileobj (BinaryIO): 压缩包文件.
+        suffix (str): 文件后缀.
+        target (str): 解压目录.
+
+    Returns:
+        str: 解压目录.
+    """
+    os.makedirs(target, exist_ok=True)
+    if suffix == ".zip":
+        with zipfile.ZipFile(fileobj, "r") as zip_ref:
+            infos = zip_ref.infolist()
+            prefix = cluster_prefix([info.filename for info in infos])
+            for info in infos:
+                name = info.filename.replace("\\", "/")
+                if not name.startswith(prefix) or info.is_dir():
+                    continue
+                path = safe_path(target, name[len(prefix) :])
+                if path is None:
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with zip_ref.open(info) as source, open(path, "wb") as dest:
+                    shutil.copyfileobj(source, dest)
+    elif suffix in (".tar", ".gz", ".tgz"):
+        with tarfile.open(fileobj=fileobj, mode="r:*") as tar_ref:
+            members = tar_ref.getmembers()
+            prefix = cluster_prefix([member.name for member in members])
+            for member in members:
+                if not member.name.startswith(prefix) or not member.isfile():
+                    continue
+                path = safe_path(target, member.name[len(prefix) :])
+                if path is None:
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with tar_ref.extractfile(member) as source, open(path, "wb") as dest:
+                    shutil.copyfileobj(source, dest)
+    else:
+        raise ValueError(f"Unsupported {suffix}")
+    return target
+
+
+def make_tarfile(archive_path: str, fileobj: BinaryIO) -> BinaryIO:
+    """将目录打包写入文件.
+
+    Args:
+        archive_path (str): 目录.
+        fileobj (BinaryIO): 写入的文件.
+
+    Returns:
+        BinaryIO: 文件, 已定位到开头.
+    """
+    with tarfile.open(fileobj=fileobj, mode="w") as tar:
+        for root, _, files in os.walk(archive_path):
+            for file in files:
+                file_path = os.path.join(root, file)
+                arcname = os.path.relpath(file_path, start=archive_path)
+                tar.add(file_path, arcname=arcname)
+    fileobj.seek(0)
+    return fileobj
+
+
+class TarFilter:
+    """流式过滤tar, 只输出keep(成员路径)为True的成员, 支持pax和gnu长文件名"""
+
+    def __init__(self, keep: Callable[[str], bool]):
+        self.keep = keep
+        self.buffer = bytearray()
+        # 当前成员剩余数据长度及是否输出
+        self.remaining = 0
+        self.emit = True
+        # 长文件名等元数据块, 随后续成员一起输出或丢弃
+        self.meta = bytearray()
+        self.meta_remaining = 0
+        self.meta_type = b""
+        self.meta_size = 0
+        self.name: str | None = None
+        self.finished = False
+
+    @classmethod
+    def _size(cls, header: bytes) -> int:
+        field = header[124:136]
+        if field[0] & 0x80:
+            return int.from_bytes(field[1:], "big")
+        return int(field.strip(b"\0 ") or b"0", 8)
+
+    @classmethod
+    def _name(cls, header: bytes) -> str:
+        name = header[0:100].split(b"\0", 1)[0]
+        if header[257:262] == b"ustar":
+            prefix = header[345:500].split(b"\0", 1)[0]
+            if prefix:
+                name = prefix + b"/" + name
+        return name.decode("utf-8", "replace")
+
+    def _parse_meta(self):
+        data = bytes(self.meta[512 : 512 + self.meta_size])
+        if self.meta_type == b"L":
+            self.name = data.split(b"\0", 1)[0].decode("utf-8", "replace")
+        elif self.meta_type == b"x":
+            # pax记录格式: "长度 key=value\n"
+            while data:
+                length = int(data.split(b" ", 1)[0])
+                record, data = data[:length], data[length:]
+                key, _, value = record.split(b" ", 1)[1].partition(b"=")
+                if key == b"path":
+                    self.name = value.rstrip(b"\n").decode("utf-8", "replace")
+
+    def feed(self, data: bytes) -> bytes:
+        self.buffer += data
+        out = bytearray()
+        while not self.finished:
+            if self.remaining:
+                n = min(self.remaining, len(self.buffer))
+                if n == 0:
+                    break
+                if self.emit:
+                    out += self.buffer[:n]
+                del self.buffer[:n]
+                self.remaining -= n
+                continue
+            if self.meta_remaining:
+                n = min(self.meta_remaining, len(self.buffer))
+                if n == 0:
+                    break
+                self.meta += self.buffer[:n]
+                del self.buffer[:n]
+                self.meta_remaining -= n
+                if not self.meta_remaining:
+                    self._parse_meta()
+                continue
+            if len(self.buffer) < 512:
+                break
+            header = bytes(self.buffer[:512])
+            del self.buffer[:512]
+            if header == bytes(512):
+                self.finished = True
+                break
+            size = self._size(header)
+            padded = (size + 511) // 512 * 512
+            typeflag = header[156:157]
+            if typeflag in (b"x", b"L", b"K"):
+                self.meta += header
+                self.meta_type, self.meta_size, self.meta_remaining = typeflag, size, padded
+                if not padded:
+                    self._parse_meta()
+                continue
+            name = self.name if self.name is not None else self._name(header)
+            self.emit = typeflag == b"g" or self.keep(name)
+            if self.emit:
+                out += self.meta + header
+            self.meta = bytearray()
+            self.name = None
+            self.remaining = padded
+        return bytes(out)
+
+    def close(self) -> bytes:
+        return bytes(1024)
+
+
+def latest_snapshots(files: List[str]) -> Set[str]:
+    """找出session目录中非最新的快照文件及其.meta文件(文件名为数字, 同目录只保留最大的).
+
+    Args:
+        files (List[str]): 文件路径.
+
+    Returns:
+        Set[str]: 需要排除的文件路径.
+    """
+    snapshots = {}
+    for file in files:
+        dirname, basename = posixpath.split(file)
+        stem = basename.removesuffix(".meta")
+        if "/session/" in file and stem.isdigit():
+            snapshots.setdefault(dirname, {}).setdefault(stem, []).append(file)
+    excluded = set()
+    for stems in snapshots.values():
+        latest = max(stems, key=int)
+        for stem, paths in stems.items():
+            if stem != latest:
+                excluded.update(paths)
+    return excluded
+
+
+class Compressor:
+    """流式压缩, 输出可复现(gzip头不含时间戳), 用于断点续传"""
+
+    def __init__(self, compression: str):
+        self.compression = compression
+        if compression == "gzip":
+            self._obj = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif compression == "zstd":
+            self._obj = zstandard.ZstdCompressor().compressobj()
+        elif compression == "none":
+            self._obj = None
+        else:
+            raise ValueError(f"Unsupported compression {compression}")
+
+    @property
+    def suffix(self) -> str:
+        return {"gzip": ".tar.gz", "zstd": ".tar.zst"}.get(self.compression, ".tar")
+
+    @property
+    def media_type(self) -> str:
+        return {"gzip": "application/gzip", "zstd": "application/zstd"}.get(self.compression, "application/x-tar")
+
+    def compress(self, data: bytes) -> bytes:
+        return data if self._obj is None else self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        return b"" if self._obj is None else self._obj.flush()
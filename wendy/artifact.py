@@ -0,0 +1,200 @@
+"""模组压缩包缓存: 每个模组保存最新版本的压缩包, 下载时直接拼接不再压缩"""
+
+from typing import AsyncIterator, BinaryIO, Dict, List, Tuple
+
+import os
+import struct
+import asyncio
+import zipfile
+
+import structlog
+
+from wendy import steamcmd
+from wendy.agent import download_mods
+from wendy.settings import GAME_ARCHIVE_PATH
+
+
+log = structlog.get_logger()
+# 同一模组同时只打包一次
+locks: Dict[str, asyncio.Lock] = {}
+END_RECORD = struct.Struct("<4s4H2LH")
+
+
+def artifacts_path() -> str:
+    path = os.path.join(GAME_ARCHIVE_PATH, "mods", "artifacts")
+    if not os.path.exists(path):
+        os.makedirs(path)
+    return path
+
+
+def artifact_path(mod_id: str) -> str:
+    return os.path.join(artifacts_path(), f"{mod_id}.zip")
+
+
+def version_path(mod_id: str) -> str:
+    """记录压缩包对应的time_updated."""
+    return os.path.join(artifacts_path(), f"{mod_id}.version")
+
+
+def is_current(mod_id: str, time_updated: str) -> bool:
+    """压缩包是否存在且为该版本."""
+    try:
+        with open(version_path(mod_id), "r") as file:
+            version = file.read()
+    except FileNotFoundError:
+        return False
+    return version == time_updated and os.path.exists(artifact_path(mod_id))
+
+
+def build(mod_id: str, mod_path: str, time_updated: str) -> str:
+    """打包模组目录, 成员路径以模组ID开头.
+
+    写完后原子替换旧版本, 正在读取旧版本的下载持有文件句柄, 不受影响. 最后写入版本号,
+    替换前中断时版本号仍为旧版本, 下次会重新打包.
+
+    Args:
+        mod_id (str): 模组ID.
+        mod_path (str): 模组目录.
+        time_updated (str): 模组更新时间.
+
+    Returns:
+        str: 压缩包路径.
+    """
+    target = artifact_path(mod_id)
+    temp = target + ".tmp"
+    with zipfile.ZipFile(temp, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.write(mod_path, mod_id)
+        for root, _, files in os.walk(mod_path):
+            for file in sorted(files):
+                file_path = os.path.join(root, file)
+                arcname = os.path.join(mod_id, os.path.relpath(file_path, mod_path))
+                zip_file.write(file_path, arcname)
+    os.replace(temp, target)
+    with open(version_path(mod_id) + ".tmp", "w") as file:
+        file.write(time_updated)
+    os.replace(version_path(mod_id) + ".tmp", version_path(mod_id))
+    # 旧版本按"模组ID_更新时间.zip"命名, 已不再读取
+    for filename in os.listdir(artifacts_path()):
+        if filename.startswith(f"{mod_id}_") and filename.endswith(".zip"):
+            os.remove(os.path.join(artifacts_path(), filename))
+    return target
+
+
+async def artifacts(mods: List[str]) -> Dict[str, str]:
+    """获取模组压缩包, 缺失或过期的模组下载后打包.
+
+    Args:
+        mods (List[str]): 模组ID.
+
+    Returns:
+        Dict[str, str]: {mod_id: 压缩包路径}.
+    """
+    if not mods:
+        return {}
+    details = await steamcmd.publishedfiledetails(list(mods))
+    versions = {}
+    for mod in details["response"]["publishedfiledetails"]:
+        if time_updated := mod.get("time_updated"):
+            versions[mod["publishedfileid"]] = str(time_updated)
+    missing = [mod_id for mod_id, time_updated in versions.items() if not is_current(mod_id, time_updated)]
+    if missing:
+        mods_path = await download_mods(mods=missing, path=os.path.join(GAME_ARCHIVE_PATH, "mods"))
+        for mod_id in missing:
+            if mod_id not in mods_path:
+                continue
+            async with locks.setdefault(mod_id, asyncio.Lock()):
+                if not is_current(mod_id, versions[mod_id]):
+                    log.info(f"build mod artifact: {mod_id}")
+                    await asyncio.to_thread(build, mod_id, mods_path[mod_id], versions[mod_id])
+    return {
+        mod_id: artifact_path(mod_id) for mod_id in versions if mod_id in mods and os.path.exists(artifact_path(mod_id))
+    }
+
+
+def read_directory(file: BinaryIO) -> Tuple[int, bytes, int]:
+    """读取压缩包的中央目录.
+
+    Args:
+        file (BinaryIO): 由build生成的压缩包(无注释, 非zip64).
+
+    Returns:
+        Tuple[int, bytes, int]: (中央目录偏移, 中央目录, 成员数).
+    """
+    file.seek(-END_RECORD.size, os.SEEK_END)
+    _, _, _, _, count, size, offset, _ = END_RECORD.unpack(file.read(END_RECORD.size))
+    file.seek(offset)
+    return offset, file.read(size), count
+
+
+def relocate(directory: bytes, base: int) -> bytes:
+    """中央目录中每条记录的本地文件头偏移加上base.
+
+    Args:
+        directory (bytes): 中央目录.
+        base (int): 偏移.
+
+    Returns:
+        bytes: 新的中央目录.
+    """
+    data = bytearray(directory)
+    position = 0
+    while position < len(data):
+        name_length, extra_length, comment_length = struct.unpack_from("<3H", data, position + 28)
+        (offset,) = struct.unpack_from("<L", data, position + 42)
+        if offset + base > 0xFFFFFFFF:
+            raise ValueError("mods bundle too large")
+        struct.pack_into("<L", data, position + 42, offset + base)
+        position += 46 + name_length + extra_length + comment_length
+    return bytes(data)
+
+
+async def bundle(paths: List[str], chunk_size: int = 1 << 20) -> Tuple[int, AsyncIterator[bytes]]:
+    """拼接多个模组压缩包为一个压缩包, 直接复制已压缩的成员.
+
+    每个压缩包只打开一次, 中央目录和内容都从同一个文件句柄读取, 期间被新版本替换也不影响本次下载.
+
+    Args:
+        paths (List[str]): 压缩包路径.
+        chunk_size (int): 读取块大小.
+
+    Returns:
+        Tuple[int, AsyncIterator[bytes]]: (总大小, 内容).
+    """
+    files = []
+    sections = []
+    directory = bytearray()
+    count = base = 0
+    try:
+        for path in paths:
+            file = await asyncio.to_thread(open, path, "rb")
+            files.append(file)
+            offset, data, number = await asyncio.to_thread(read_directory, file)
+            directory += relocate(data, base)
+            sections.append((file, offset))
+            count += number
+            base += offset
+        if count > 0xFFFF:
+            raise ValueError("mods bundle too large")
+    except BaseException:
+        for file in files:
+            file.close()
+        raise
+    end = END_RECORD.pack(b"PK\005\006", 0, 0, count, count, len(directory), base, 0)
+    size = base + len(directory) + len(end)
+
+    async def generator():
+        try:
+            for file, length in sections:
+                file.seek(0)
+                while length > 0:
+                    chunk = await asyncio.to_thread(file.read, min(chunk_size, length))
+                    if not chunk:
+                        break
+                    length -= len(chunk)
+                    yield chunk
+            yield bytes(directory) + end
+        finally:
+            for file in files:
+                file.close()
+
+    return size, generator()
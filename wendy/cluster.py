@@ -1,4 +1,4 @@
-from typing import Literal, List
+from typing import Literal, List, Dict
 
 import re
 import os
@@ -6,7 +6,14 @@ import configparser
 
 from pydantic import BaseModel
 
-from wendy.settings import DOCKER_API_DEFAULT
+from wendy.settings import (
+    DOCKER_API_DEFAULT,
+    PORT_RANGE_SIZE,
+    LOG_DRIVER,
+    LOG_MAX_SIZE,
+    LOG_MAX_FILE,
+    LOG_COMPRESS,
+)
 from wendy.constants import (
     modoverrides_default,
     caves_leveldataoverride_default,
@@ -33,6 +40,15 @@ class ClusterWorld(BaseModel):
     version: str = ""
     docker_api: str
     container: str = ""
+    # 最近一次部署的指纹, 未变化时跳过上传和模组更新
+    fingerprint: str = ""
+    # 资源限制, 0或空表示不限制; cpuset为auto时自动绑核, 并把cpuset_mems设置为cpu所在的numa节点
+    cpuset: str = ""
+    cpuset_mems: str = ""
+    cpu_shares: int = 0
+    cpu_quota: int = 0
+    memory: int = 0
+    pids_limit: int = 0
 
     def save(self, path: str):
         path = os.path.join(path, self.type)
@@ -66,6 +82,25 @@ class ClusterWorld(BaseModel):
     def _dump_bool(cls, value: bool) -> str:
         return "true" if value else "false"
 
+    @property
+    def host_config(self) -> dict:
+        """容器HostConfig中的资源限制."""
+        config = {}
+        if self.cpuset:
+            config["CpusetCpus"] = self.cpuset
+        if self.cpuset_mems:
+            config["CpusetMems"] = self.cpuset_mems
+        if self.cpu_shares:
+            config["CpuShares"] = self.cpu_shares
+        if self.cpu_quota:
+            config["CpuPeriod"] = 100000
+            config["CpuQuota"] = self.cpu_quota
+        if self.memory:
+            config["Memory"] = self.memory
+        if self.pids_limit:
+            config["PidsLimit"] = self.pids_limit
+        return config
+
     @classmethod
     def load_from_file(
         cls,
@@ -173,9 +208,37 @@ class ClusterIni(BaseModel):
         return cls(**data)
 
 
+class ClusterLog(BaseModel):
+    """容器日志驱动及轮转配置"""
+
+    driver: str = LOG_DRIVER
+    # 单个日志文件大小上限, 如50m, 空表示不限制
+    max_size: str = LOG_MAX_SIZE
+    max_file: int = LOG_MAX_FILE
+    compress: bool = LOG_COMPRESS
+
+    @property
+    def log_config(self) -> dict:
+        """容器HostConfig中的LogConfig, 轮转参数只对json-file和local驱动生效."""
+        config = {}
+        if self.driver in ("json-file", "local"):
+            if self.max_size:
+                config["max-size"] = self.max_size
+                config["max-file"] = str(max(self.max_file, 1))
+            config["compress"] = self._dump_bool(self.compress)
+        return {"Type": self.driver, "Config": config}
+
+    @classmethod
+    def _dump_bool(cls, value: bool) -> str:
+        return "true" if value else "false"
+
+
 class Cluster(BaseModel):
     cluster_token: str
     ini: ClusterIni = ClusterIni()
+    # 自动调度(docker_api为auto)时世界放在同一主机(together)或分散(apart)
+    affinity: Literal["together", "apart"] = "together"
+    log: ClusterLog = ClusterLog()
     world: List[ClusterWorld] = [
         ClusterWorld(
             id="1",
@@ -303,15 +366,26 @@ class Cluster(BaseModel):
             world.authentication_port = -1
         return cluster
 
-    def auto_port(self, id: int):
-        port = 10000 + id * 100
-        if self.ini.master_port == -1:
-            self.ini.master_port = port
+    def auto_port(self, ports: Dict[str, int]):
+        """按docker_api分配的端口段填充未设置(-1)的端口.
+
+        Args:
+            ports (Dict[str, int]): {docker_api: 端口段起始端口}.
+        """
+        offsets = {}
         for world in self.world:
+            if world.docker_api not in ports:
+                continue
+            port = ports[world.docker_api]
+            if world.is_master and self.ini.master_port == -1:
+                self.ini.master_port = port
+            offset = offsets.get(world.docker_api, 1)
+            if offset + 3 > PORT_RANGE_SIZE:
+                raise ValueError(f"too many worlds on {world.docker_api}")
             if world.server_port == -1:
-                world.server_port = port + 1
+                world.server_port = port + offset
             if world.master_server_port == -1:
-                world.master_server_port = port + 2
+                world.master_server_port = port + offset + 1
             if world.authentication_port == -1:
-                world.authentication_port = port + 3
-            port += 3
+                world.authentication_port = port + offset + 2
+            offsets[world.docker_api] = offset + 3
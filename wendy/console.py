@@ -0,0 +1,176 @@
+"""控制台会话池: 每个容器保持一个attach连接, 命令复用连接并收集输出.
+
+命令后追加打印一个随机标记, 读到标记即认为命令的输出已结束. 标记在输入中拆成两段字符串拼接,
+TTY回显的输入行不会匹配.
+"""
+
+from typing import Dict, List, Set
+
+import time
+import uuid
+import asyncio
+
+import structlog
+import aiodocker
+
+from wendy.sse import BoundedQueue
+from wendy.logs import STREAMS, FrameDecoder
+from wendy.settings import CONSOLE_TIMEOUT, CONSOLE_SESSION_IDLE
+
+
+log = structlog.get_logger()
+MARKER = "__wendy_"
+# {docker_api/容器名: 会话}
+sessions: Dict[str, "Session"] = {}
+reaper: asyncio.Task | None = None
+
+
+class Session:
+    """一个容器的attach连接, 输出按行广播给所有监听队列"""
+
+    def __init__(self, docker_api: str, container: str):
+        self.docker_api = docker_api
+        self.container = container
+        self.key = f"{docker_api}/{container}"
+        self.docker: aiodocker.Docker | None = None
+        self.stream = None
+        self.task: asyncio.Task | None = None
+        self.closed = False
+        self.used = time.time()
+        # 同一时间只执行一条命令, 保证输出和标记对应
+        self.lock = asyncio.Lock()
+        self._opening = asyncio.Lock()
+        self.listeners: Set[BoundedQueue] = set()
+
+    async def open(self):
+        async with self._opening:
+            if self.stream is not None:
+                return
+            self.docker = aiodocker.Docker(self.docker_api)
+            try:
+                container = await self.docker.containers.get(self.container)
+                stream = container.attach(stdout=True, stderr=True, stdin=True)
+                await stream.__aenter__()
+            except Exception:
+                await self.close()
+                raise
+            self.stream = stream
+            self.task = asyncio.create_task(self._read())
+
+    async def _read(self):
+        decoders = {name: FrameDecoder(tty=True) for name in STREAMS.values()}
+        try:
+            while True:
+                message = await self.stream.read_out()
+                if message is None:
+                    break
+                stream = STREAMS.get(message.stream, "stdout")
+                for _, line in decoders[stream].feed(message.data):
+                    item = {"time": time.time(), "stream": stream, "data": line}
+                    for queue in self.listeners:
+                        queue.put_nowait((self.key, item))
+        except Exception as e:
+            log.warning(f"console {self.key} closed: {e}")
+        finally:
+            # 容器重启等原因断开后, 下次使用时重新连接
+            self.closed = True
+            await self.close()
+
+    async def close(self):
+        self.closed = True
+        if self.stream is not None:
+            try:
+                await self.stream.close()
+            except Exception:
+                pass
+        if self.docker is not None:
+            await self.docker.close()
+            self.docker = None
+        if self.task is not None and self.task is not asyncio.current_task():
+            self.task.cancel()
+        if sessions.get(self.key) is self:
+            sessions.pop(self.key)
+
+    async def write(self, data: str):
+        self.used = time.time()
+        await self.stream.write_in(data.encode())
+
+    async def execute(self, command: str, timeout: float = CONSOLE_TIMEOUT) -> List[str]:
+        """执行命令并收集输出.
+
+        Args:
+            command (str): 命令, 多行时逐行执行.
+            timeout (float): 等待输出结束的最长时间(秒), 超时返回已收到的输出.
+
+        Returns:
+            List[str]: 命令执行期间服务器输出的行.
+        """
+        token = uuid.uuid4().hex[:12]
+        marker = f"{MARKER}{token}"
+        queue = BoundedQueue()
+        lines = []
+        async with self.lock:
+            self.listeners.add(queue)
+            try:
+                await self.write(f'{command.strip()}\nprint("{MARKER}" .. "{token}")\n')
+                deadline = time.monotonic() + timeout
+                done = False
+                while not done and (remaining := deadline - time.monotonic()) > 0:
+                    try:
+                        batch = await asyncio.wait_for(queue.get_batch(interval=0), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    for _, item in batch:
+                        if marker in item["data"]:
+                            done = True
+                            break
+                        if f'"{MARKER}" .. "{token}"' not in item["data"]:
+                            lines.append(item["data"])
+            finally:
+                self.listeners.discard(queue)
+                self.used = time.time()
+        return lines
+
+
+async def get(docker_api: str, container: str) -> Session:
+    """获取容器的会话, 不存在或已断开时新建."""
+    global reaper
+    key = f"{docker_api}/{container}"
+    session = sessions.get(key)
+    if session is None or session.closed:
+        session = sessions[key] = Session(docker_api, container)
+    await session.open()
+    if reaper is None:
+        reaper = asyncio.create_task(reap())
+    return session
+
+
+async def execute(
+    command: str,
+    docker_api: str,
+    container: str,
+    timeout: float = CONSOLE_TIMEOUT,
+) -> List[str]:
+    """在容器控制台执行命令, 连接已断开(如容器重启)时重连一次."""
+    session = await get(docker_api, container)
+    try:
+        return await session.execute(command, timeout)
+    except (RuntimeError, ConnectionError, aiodocker.DockerError) as e:
+        log.warning(f"console {session.key} failed, reconnect: {e}")
+        await session.close()
+        session = await get(docker_api, container)
+        return await session.execute(command, timeout)
+
+
+async def reap():
+    """关闭长时间未使用且没有监听者的会话."""
+    global reaper
+    try:
+        while sessions:
+            await asyncio.sleep(min(CONSOLE_SESSION_IDLE, 60))
+            now = time.time()
+            for session in list(sessions.values()):
+                if not session.listeners and not session.lock.locked() and now - session.used > CONSOLE_SESSION_IDLE:
+                    await session.close()
+    finally:
+        reaper = None
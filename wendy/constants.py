@@ -7,6 +7,17 @@ class DeployStatus(StrEnum):
     stop = "stop"
 
 
+class JobStatus(StrEnum):
+    pending = "pending"
+    running = "running"
+    success = "success"
+    failed = "failed"
+
+
+# docker_api为该值时由调度器选择主机
+DOCKER_API_AUTO = "auto"
+
+
 caves_leveldataoverride_default = """return {
   background_node_range={ 0, 1 },
   desc="探查洞穴…… 一起！",
@@ -0,0 +1,234 @@
+"""资源指标历史: 内存中保留秒级采样, 按分钟和小时聚合后写入数据库"""
+
+from typing import Dict, List, Tuple
+
+import time
+import asyncio
+from collections import deque
+from functools import partial
+
+import structlog
+
+from wendy import models
+from wendy.sse import BoundedQueue
+from wendy.cluster import Cluster, ClusterWorld
+from wendy.constants import DeployStatus
+from wendy.stats import channel_key, collect, hub
+from wendy.settings import METRIC_RAW_SIZE, METRIC_MINUTE_RETENTION, METRIC_HOUR_RETENTION
+
+
+log = structlog.get_logger()
+METRICS = ("cpu_percent", "memory", "net_rx", "net_tx", "block_read", "block_write")
+MINUTE = 60
+HOUR = 3600
+# 秒级采样只在内存中, 分钟和小时聚合写入数据库, 各粒度的保留天数
+RETENTION = {MINUTE: METRIC_MINUTE_RETENTION, HOUR: METRIC_HOUR_RETENTION}
+
+
+class Bucket:
+    """一个聚合时间段, 保存每个指标的总和、最大值和采样数"""
+
+    def __init__(self, start: int):
+        self.start = start
+        self.count = 0
+        self.sums = [0.0] * len(METRICS)
+        self.maxs = [0.0] * len(METRICS)
+
+    def add(self, avgs: List[float], maxs: List[float], count: int = 1):
+        self.count += count
+        for index in range(len(METRICS)):
+            self.sums[index] += avgs[index] * count
+            self.maxs[index] = max(self.maxs[index], maxs[index])
+
+    @property
+    def avgs(self) -> List[float]:
+        return [value / max(self.count, 1) for value in self.sums]
+
+    def data(self) -> Dict[str, List[float]]:
+        return {key: [round(avg, 2), round(peak, 2)] for key, avg, peak in zip(METRICS, self.avgs, self.maxs)}
+
+
+class Series:
+    """单个世界的指标历史"""
+
+    def __init__(self):
+        # [(时间, [指标值, ...]), ...]
+        self.raw = deque(maxlen=METRIC_RAW_SIZE)
+        self.buckets: Dict[int, Bucket] = {}
+
+    def _roll(self, resolution: int, child: Bucket) -> List[Tuple[int, Bucket]]:
+        start = child.start // resolution * resolution
+        bucket = self.buckets.get(resolution)
+        closed = []
+        if bucket is not None and bucket.start != start:
+            closed.append((resolution, bucket))
+            bucket = None
+        if bucket is None:
+            bucket = self.buckets[resolution] = Bucket(start)
+        bucket.add(child.avgs, child.maxs, child.count)
+        return closed
+
+    def add(self, sample: dict) -> List[Tuple[int, Bucket]]:
+        """加入一个秒级采样, 分钟结束时汇总到小时.
+
+        Returns:
+            List[Tuple[int, Bucket]]: 本次结束的(粒度, 聚合段).
+        """
+        values = [float(sample.get(key) or 0) for key in METRICS]
+        self.raw.append((sample["time"], values))
+        start = int(sample["time"]) // MINUTE * MINUTE
+        minute = self.buckets.get(MINUTE)
+        closed = []
+        if minute is not None and minute.start != start:
+            closed.append((MINUTE, minute))
+            closed.extend(self._roll(HOUR, minute))
+            minute = None
+        if minute is None:
+            minute = self.buckets[MINUTE] = Bucket(start)
+        minute.add(values, values)
+        return closed
+
+
+# {(部署ID, 世界名称): 指标历史}
+series: Dict[Tuple[int, str], Series] = {}
+queue = BoundedQueue(maxsize=METRIC_RAW_SIZE)
+# {上游key: (部署ID, 世界名称)}
+keys: Dict[str, Tuple[int, str]] = {}
+tasks: List[asyncio.Task] = []
+
+
+async def watch():
+    """订阅所有运行中世界的资源采集, 不依赖前端是否打开"""
+    channels = {}
+    while True:
+        try:
+            current: Dict[str, Tuple[int, str]] = {}
+            worlds: Dict[str, ClusterWorld] = {}
+            async for deploy in models.Deploy.filter(status=DeployStatus.running.value):
+                cluster = Cluster.model_validate(deploy.cluster)
+                for world in cluster.world:
+                    key = channel_key(world.docker_api, world.container)
+                    current[key] = (deploy.id, world.name)
+                    worlds[key] = world
+            for key in channels.keys() - current.keys():
+                hub.unsubscribe(key, queue)
+                channels.pop(key)
+            keys.clear()
+            keys.update(current)
+            for item in series.keys() - set(current.values()):
+                series.pop(item)
+            for key, world in worlds.items():
+                channel = channels.get(key)
+                if channel is None or hub.channels.get(key) is not channel:
+                    channels[key] = hub.subscribe(key, partial(collect, world=world), queue, replay=lambda _: False)
+        except Exception as e:
+            log.exception(f"watch metrics failed: {e}")
+        await asyncio.sleep(5)
+
+
+async def save(rows: List[Tuple[int, str, int, Bucket]]):
+    for deploy_id, world, resolution, bucket in rows:
+        await models.Metric.update_or_create(
+            deploy_id=deploy_id,
+            world=world,
+            resolution=resolution,
+            time=bucket.start,
+            defaults={"data": bucket.data()},
+        )
+
+
+async def cleanup():
+    now = int(time.time())
+    for resolution, days in RETENTION.items():
+        await models.Metric.filter(resolution=resolution, time__lt=now - days * 86400).delete()
+
+
+async def record():
+    """消费采样, 更新内存历史并写入结束的聚合段"""
+    cleaned = 0
+    while True:
+        try:
+            rows = []
+            for key, sample in await queue.get_batch(queue.maxsize, 1):
+                if key not in keys:
+                    continue
+                deploy_id, world = keys[key]
+                item = series.setdefault((deploy_id, world), Series())
+                for resolution, bucket in item.add(sample):
+                    rows.append((deploy_id, world, resolution, bucket))
+            if rows:
+                await save(rows)
+            if time.time() - cleaned > HOUR:
+                await cleanup()
+                cleaned = time.time()
+        except Exception as e:
+            log.exception(f"record metrics failed: {e}")
+
+
+async def start():
+    tasks.append(asyncio.create_task(watch()))
+    tasks.append(asyncio.create_task(record()))
+
+
+def resolution_for(start: int, end: int) -> int:
+    """按时间范围选择粒度, 保证返回的点数在几千以内."""
+    span = end - start
+    if span <= METRIC_RAW_SIZE:
+        return 1
+    if span <= 2 * 86400:
+        return MINUTE
+    return HOUR
+
+
+async def query(
+    deploy_id: int,
+    world: str,
+    metric: str,
+    start: int,
+    end: int,
+    resolution: int | None = None,
+) -> List[dict]:
+    """查询指标历史.
+
+    Args:
+        deploy_id (int): 部署ID.
+        world (str): 世界名称.
+        metric (str): 指标.
+        start (int): 开始时间戳.
+        end (int): 结束时间戳.
+        resolution (int | None): 粒度(秒), 为空时按范围自动选择.
+
+    Returns:
+        List[dict]: [{"time", "avg", "max"}, ...].
+    """
+    resolution = resolution or resolution_for(start, end)
+    if resolution not in (1, MINUTE, HOUR):
+        raise ValueError(f"Unsupported resolution {resolution}")
+    index = METRICS.index(metric)
+    item = series.get((deploy_id, world))
+    if resolution == 1:
+        if item is None:
+            return []
+        return [
+            {"time": timestamp, "avg": values[index], "max": values[index]}
+            for timestamp, values in item.raw
+            if start <= timestamp <= end
+        ]
+    data = []
+    rows = models.Metric.filter(
+        deploy_id=deploy_id,
+        world=world,
+        resolution=resolution,
+        time__gte=start // resolution * resolution,
+        time__lte=end,
+    ).order_by("time")
+    async for row in rows:
+        avg, peak = row.data.get(metric, [0, 0])
+        data.append({"time": row.time, "avg": avg, "max": peak})
+    # 未结束的聚合段还在内存中
+    bucket = item.buckets.get(resolution) if item is not None else None
+    if bucket is not None and bucket.count and start <= bucket.start + resolution and bucket.start <= end:
+        if not data or data[-1]["time"] != bucket.start:
+            avg, peak = bucket.data()[metric]
+            data.append({"time": bucket.start, "avg": avg, "max": peak})
+    return data
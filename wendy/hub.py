@@ -0,0 +1,88 @@
+"""广播中心: 每个key只保留一个上游读取任务, 由所有订阅者共享"""
+
+from typing import Any, Callable, Coroutine, Dict
+
+import asyncio
+from collections import deque
+
+import structlog
+
+from wendy.sse import BoundedQueue
+
+
+log = structlog.get_logger()
+
+
+class Channel:
+    def __init__(self, key: str, size: int):
+        self.key = key
+        # 最近的消息, 新订阅者先回放
+        self.history = deque(maxlen=size)
+        # {订阅者队列: 过滤条件}
+        self.subscribers: Dict[BoundedQueue, Callable[[Any], bool] | None] = {}
+        self.task: asyncio.Task | None = None
+
+    def publish(self, item: Any):
+        self.history.append(item)
+        for queue, accept in self.subscribers.items():
+            if accept is None or accept(item):
+                queue.put_nowait((self.key, item))
+
+
+class Hub:
+    def __init__(self, size: int):
+        self.size = size
+        self.channels: Dict[str, Channel] = {}
+
+    def subscribe(
+        self,
+        key: str,
+        source: Callable[[Channel], Coroutine],
+        queue: BoundedQueue,
+        accept: Callable[[Any], bool] | None = None,
+        replay: Callable[[Any], bool] | None = None,
+    ) -> Channel:
+        """订阅key, 上游不存在时通过source(channel)启动.
+
+        Args:
+            key (str): 上游标识.
+            source (Callable[[Channel], Coroutine]): 读取上游并调用channel.publish的协程.
+            queue (BoundedQueue): 订阅者队列, 收到(key, item).
+            accept (Callable[[Any], bool] | None): 实时消息的过滤条件.
+            replay (Callable[[Any], bool] | None): 回放历史时的过滤条件, 默认同accept.
+
+        Returns:
+            Channel: 频道.
+        """
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = self.channels[key] = Channel(key, self.size)
+            channel.task = asyncio.create_task(self._run(channel, source))
+        replay = replay or accept
+        for item in channel.history:
+            if replay is None or replay(item):
+                queue.put_nowait((key, item))
+        channel.subscribers[queue] = accept
+        return channel
+
+    def unsubscribe(self, key: str, queue: BoundedQueue):
+        """取消订阅, 没有订阅者时关闭上游."""
+        channel = self.channels.get(key)
+        if channel is None:
+            return
+        channel.subscribers.pop(queue, None)
+        if not channel.subscribers:
+            self.channels.pop(key)
+            channel.task.cancel()
+
+    async def _run(self, channel: Channel, source: Callable[[Channel], Coroutine]):
+        try:
+            await source(channel)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning(f"hub source {channel.key} failed: {e}")
+        finally:
+            # 上游结束后移除频道, 订阅者下次检查时会重新订阅
+            if self.channels.get(channel.key) is channel:
+                self.channels.pop(channel.key)
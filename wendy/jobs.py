@@ -0,0 +1,190 @@
+"""部署任务队列: 接口只写入任务, 由后台worker执行耗时的docker操作"""
+
+from typing import Dict, Set
+
+import time
+import asyncio
+import traceback
+from contextlib import AsyncExitStack
+
+import structlog
+
+from wendy import agent, models, scheduler, shards
+from wendy.cluster import Cluster
+from wendy.constants import DeployStatus, JobStatus
+from wendy.settings import JOB_WORKERS, JOB_HOST_CONCURRENCY, READY_TIMEOUT
+
+
+log = structlog.get_logger()
+queue: asyncio.Queue = asyncio.Queue()
+# 每台docker主机的并发限制
+host_semaphores: Dict[str, asyncio.Semaphore] = {}
+# 同一部署的任务串行执行
+deploy_locks: Dict[int, asyncio.Lock] = {}
+# {任务ID: 进度订阅队列}
+subscribers: Dict[int, Set[asyncio.Queue]] = {}
+workers: Set[asyncio.Task] = set()
+
+
+async def submit(deploy_id: int, action: str) -> models.Job:
+    """提交部署任务.
+
+    Args:
+        deploy_id (int): 部署ID.
+        action (str): 任务类型, deploy/update/restart.
+
+    Returns:
+        models.Job: 任务.
+    """
+    job = await models.Job.create(
+        deploy_id=deploy_id,
+        action=action,
+        status=JobStatus.pending.value,
+        progress=[],
+    )
+    await queue.put(job.id)
+    return job
+
+
+async def active(deploy_id: int) -> bool:
+    """部署是否有未完成的任务."""
+    status = [JobStatus.pending.value, JobStatus.running.value]
+    return await models.Job.filter(deploy_id=deploy_id, status__in=status).exists()
+
+
+def publish(job_id: int, event: dict):
+    for subscriber in subscribers.get(job_id, set()):
+        subscriber.put_nowait(event)
+
+
+def subscribe(job_id: int) -> asyncio.Queue:
+    subscriber = asyncio.Queue()
+    subscribers.setdefault(job_id, set()).add(subscriber)
+    return subscriber
+
+
+def unsubscribe(job_id: int, subscriber: asyncio.Queue):
+    if job_id in subscribers:
+        subscribers[job_id].discard(subscriber)
+        if not subscribers[job_id]:
+            subscribers.pop(job_id)
+
+
+async def update(job: models.Job, **kwargs):
+    for k, v in kwargs.items():
+        setattr(job, k, v)
+    await job.save()
+    publish(job.id, {"status": job.status, "progress": job.progress, "error": job.error})
+
+
+async def wait_ready(job: models.Job, cluster: Cluster, started: float) -> Dict[str, float | None]:
+    """等待所有世界就绪, 记录每个世界从启动容器到就绪的耗时.
+
+    Returns:
+        Dict[str, float | None]: {世界名称: 耗时(秒), 超时为None}.
+    """
+    # 从进度中取启动各世界容器的时间, 未变化而没有重启的世界不等待
+    since = {item["stage"]: item["time"] for item in job.progress if item["time"] >= started}
+    worlds = [world for world in cluster.world if f"deploy {world.name}" in since]
+    starts = [since[f"deploy {world.name}"] for world in worlds]
+    times = await asyncio.gather(*(shards.wait_ready(world, start) for world, start in zip(worlds, starts)))
+    ready = {
+        world.name: None if at is None else round(max(at - start, 0), 3)
+        for world, start, at in zip(worlds, starts, times)
+    }
+    log.info(f"job {job.id} ready: {ready}")
+    await update(job, ready=ready)
+    return ready
+
+
+def merge(current, before, after):
+    """把任务修改过的字段合并到最新配置, 保留任务执行期间接口对其他字段的修改.
+
+    Args:
+        current: 数据库中最新的配置.
+        before: 任务开始时读取的配置.
+        after: 任务执行后的配置.
+
+    Returns:
+        合并后的配置, 同一字段都被修改时以数据库中的为准.
+    """
+    if before == after:
+        return current
+    if isinstance(current, dict) and isinstance(before, dict) and isinstance(after, dict):
+        result = dict(current)
+        for key, value in after.items():
+            if before.get(key) != value:
+                result[key] = merge(current[key], before.get(key), value) if key in current else value
+        return result
+    if (
+        isinstance(current, list)
+        and isinstance(before, list)
+        and isinstance(after, list)
+        and len(current) == len(before) == len(after)
+    ):
+        return [merge(*items) for items in zip(current, before, after)]
+    return after if current == before else current
+
+
+async def run(job: models.Job):
+    """执行任务."""
+
+    async def progress(stage: str):
+        await update(job, progress=[*job.progress, {"stage": stage, "time": time.time()}])
+
+    try:
+        async with deploy_locks.setdefault(job.deploy_id, asyncio.Lock()):
+            # 在锁内读取, 前一个任务写回的端口、容器等派生字段对本任务可见
+            deploy = await models.Deploy.get(id=job.deploy_id)
+            before = deploy.cluster
+            cluster = Cluster.model_validate(before)
+            # 先选择主机, 按世界实际所在的主机限制并发
+            await scheduler.place(cluster)
+            docker_apis = sorted({world.docker_api for world in cluster.world})
+            async with AsyncExitStack() as stack:
+                for item in docker_apis:
+                    await stack.enter_async_context(
+                        host_semaphores.setdefault(item, asyncio.Semaphore(JOB_HOST_CONCURRENCY))
+                    )
+                await update(job, status=JobStatus.running.value)
+                started = time.time()
+                cluster = await agent.deploy(deploy.id, cluster, progress=progress, restart=job.action == "restart")
+            # 只写回任务派生的字段, 不覆盖执行期间通过接口修改的配置
+            current = await models.Deploy.get(id=deploy.id)
+            await models.Deploy.filter(id=deploy.id).update(
+                cluster=merge(current.cluster, before, cluster.model_dump()),
+                status=DeployStatus.running.value,
+            )
+        # 等待就绪时不占用主机并发和部署锁
+        await progress("wait_ready")
+        ready = await wait_ready(job, cluster, started)
+        if None in ready.values():
+            pending = [name for name, elapsed in ready.items() if elapsed is None]
+            raise TimeoutError(f"worlds {pending} not ready within {READY_TIMEOUT}s")
+        await update(job, status=JobStatus.success.value)
+    except Exception:
+        log.exception(f"job {job.id} failed")
+        await update(job, status=JobStatus.failed.value, error=traceback.format_exc())
+
+
+async def worker():
+    while True:
+        job_id = await queue.get()
+        try:
+            job = await models.Job.get_or_none(id=job_id)
+            if job is not None and job.status == JobStatus.pending.value:
+                await run(job)
+        except Exception:
+            log.exception(traceback.format_exc())
+        finally:
+            queue.task_done()
+
+
+async def start():
+    """启动worker, 重新排队上次未完成的任务."""
+    await models.Job.filter(status=JobStatus.running.value).update(status=JobStatus.pending.value)
+    async for job in models.Job.filter(status=JobStatus.pending.value).order_by("id"):
+        await queue.put(job.id)
+    for _ in range(JOB_WORKERS):
+        task = asyncio.create_task(worker())
+        workers.add(task)
@@ -0,0 +1,260 @@
+"""docker日志流解析与共享订阅"""
+
+from typing import List, Literal, Tuple
+
+import os
+import re
+import json
+import asyncio
+from datetime import datetime
+
+import httpx
+import structlog
+import aiodocker
+
+from wendy.hub import Hub, Channel
+from wendy.cluster import ClusterWorld
+from wendy.settings import LOG_HISTORY
+
+
+log = structlog.get_logger()
+STREAMS = {0: "stdin", 1: "stdout", 2: "stderr"}
+LEVELS = {"info": 0, "warning": 1, "error": 2}
+ERROR_MARKERS = ("error", "assert failure", "stack traceback", "exception")
+TAIL_BLOCK_SIZE = 1 << 16
+# 每个容器一个上游日志流, 保留最近LOG_HISTORY行用于回放
+hub = Hub(LOG_HISTORY)
+
+
+def docker_client(docker_api: str, **kwargs) -> httpx.AsyncClient:
+    """直接访问docker api的httpx客户端, 用于日志和统计等流式接口.
+
+    Args:
+        docker_api (str): docker api地址.
+
+    Returns:
+        httpx.AsyncClient: 客户端.
+    """
+    if docker_api.startswith("http"):
+        transport = None
+        base_url = docker_api.replace("unix://", "")
+    else:
+        transport = httpx.AsyncHTTPTransport(uds="/var/run/docker.sock")
+        base_url = "http://docker"
+    return httpx.AsyncClient(transport=transport, base_url=base_url, **kwargs)
+
+
+class FrameDecoder:
+    """增量解析docker日志流, 非TTY容器的8字节多路复用帧头会被去掉并区分stdout/stderr.
+
+    按字节切分行后再解码, 多字节字符跨块时不会被截断.
+    """
+
+    def __init__(self, tty: bool | None = None):
+        # None时根据第一个块是否为合法帧头自动判断
+        self.tty = tty
+        self.buffer = bytearray()
+        self.pending = {name: bytearray() for name in STREAMS.values()}
+
+    @classmethod
+    def is_frame_header(cls, data: bytes) -> bool:
+        return len(data) >= 8 and data[0] in STREAMS and data[1:4] == b"\0\0\0"
+
+    def _lines(self, stream: str, payload: bytes) -> List[Tuple[str, str]]:
+        pending = self.pending[stream]
+        if b"\n" not in payload:
+            pending += payload
+            return []
+        parts = payload.split(b"\n")
+        parts[0] = bytes(pending) + parts[0]
+        self.pending[stream] = bytearray(parts.pop())
+        return [(stream, part.rstrip(b"\r").decode("utf-8", "replace")) for part in parts]
+
+    def feed(self, data: bytes) -> List[Tuple[str, str]]:
+        """输入一个数据块.
+
+        Args:
+            data (bytes): 数据块.
+
+        Returns:
+            List[Tuple[str, str]]: 完整的行, [(stream, line), ...].
+        """
+        if self.tty is None:
+            self.buffer += data
+            if len(self.buffer) < 8:
+                return []
+            self.tty = not self.is_frame_header(self.buffer)
+            data = bytes(self.buffer)
+            self.buffer = bytearray()
+        if self.tty:
+            return self._lines("stdout", data)
+        self.buffer += data
+        lines = []
+        position = 0
+        buffer = self.buffer
+        while len(buffer) - position >= 8:
+            size = int.from_bytes(buffer[position + 4 : position + 8], "big")
+            end = position + 8 + size
+            if end > len(buffer):
+                break
+            stream = STREAMS.get(buffer[position], "stdout")
+            lines.extend(self._lines(stream, bytes(buffer[position + 8 : end])))
+            position = end
+        del buffer[:position]
+        return lines
+
+    def close(self) -> List[Tuple[str, str]]:
+        """输出剩余未换行的内容."""
+        lines = []
+        if self.tty is None and self.buffer:
+            self.tty = True
+            lines.extend(self._lines("stdout", bytes(self.buffer)))
+            self.buffer = bytearray()
+        for stream, pending in self.pending.items():
+            if pending:
+                lines.append((stream, bytes(pending).rstrip(b"\r").decode("utf-8", "replace")))
+                self.pending[stream] = bytearray()
+        return lines
+
+
+def split_timestamp(line: str) -> Tuple[float, str]:
+    """拆分timestamps=true时行首的RFC3339时间."""
+    timestamp, _, data = line.partition(" ")
+    try:
+        return datetime.fromisoformat(timestamp).timestamp(), data
+    except ValueError:
+        return 0, line
+
+
+async def follow(channel: Channel, world: ClusterWorld, retry: int = 5):
+    """持续读取容器日志并发布到channel, 断开后从最后一行的时间继续.
+
+    首次连接读取最近的history.maxlen行用于回放.
+    """
+    last = 0
+    while True:
+        # 重连后跳过上一次连接已发布的行
+        cutoff = last
+        params = {"stdout": True, "stderr": True, "follow": True, "timestamps": True}
+        if last:
+            params["since"] = f"{last:.6f}"
+        else:
+            params["tail"] = channel.history.maxlen
+        try:
+            async with docker_client(world.docker_api) as client:
+                url = f"/containers/{world.container}/logs"
+                timeout = httpx.Timeout(None, connect=5)
+                decoder = FrameDecoder()
+                async with client.stream("GET", url, params=params, timeout=timeout) as response:
+                    if response.status_code != 200:
+                        # 容器不存在等错误不是日志帧, 结束上游由订阅者稍后重新订阅
+                        await response.aread()
+                        raise ValueError(
+                            f"follow logs {world.container} failed: {response.status_code} {response.text.strip()}"
+                        )
+                    async for chunk in response.aiter_bytes():
+                        for stream, line in decoder.feed(chunk):
+                            timestamp, data = split_timestamp(line)
+                            if 0 < timestamp <= cutoff:
+                                continue
+                            last = max(last, timestamp)
+                            channel.publish({"time": timestamp, "stream": stream, "data": data})
+        except httpx.HTTPError as e:
+            log.warning(f"follow logs {world.container} failed: {e}")
+        await asyncio.sleep(retry)
+
+
+async def local_log_path(world: ClusterWorld) -> str | None:
+    """本机json-file日志驱动的容器日志文件, 无法直接读取时返回None."""
+    if not world.docker_api.startswith("unix://"):
+        return None
+    try:
+        async with aiodocker.Docker(world.docker_api) as docker:
+            container = await docker.containers.get(world.container)
+    except aiodocker.DockerError:
+        return None
+    log_type = container._container.get("HostConfig", {}).get("LogConfig", {}).get("Type")
+    path = container._container.get("LogPath")
+    if log_type != "json-file" or not path or not os.access(path, os.R_OK):
+        return None
+    return path
+
+
+def tail_file(path: str, tail: int) -> List[str] | None:
+    """从json-file日志末尾按块向前读取最近tail行.
+
+    Args:
+        path (str): 日志文件.
+        tail (int): 行数.
+
+    Returns:
+        List[str] | None: 日志行, 当前文件行数不足且存在已轮转的文件时返回None.
+    """
+    with open(path, "rb") as file:
+        position = file.seek(0, os.SEEK_END)
+        blocks: List[bytes] = []
+        count = 0
+        # 超长的行会被docker拆成多条不以换行结尾的记录, 多读一些记录用于拼接
+        while position > 0 and count <= tail * 2:
+            size = min(TAIL_BLOCK_SIZE, position)
+            position -= size
+            file.seek(position)
+            blocks.append(file.read(size))
+            count += blocks[-1].count(b"\n")
+    records = b"".join(reversed(blocks)).split(b"\n")
+    if position > 0:
+        # 第一条记录可能不完整
+        records = records[1:]
+    elif os.path.exists(f"{path}.1") or os.path.exists(f"{path}.1.gz"):
+        if count < tail:
+            return None
+    records = [record for record in records if record]
+    items = json.loads(b"[" + b",".join(records) + b"]")
+    lines, pending = [], ""
+    for item in items:
+        pending += item.get("log", "")
+        if pending.endswith("\n"):
+            lines.append(pending.rstrip("\r\n"))
+            pending = ""
+    if pending:
+        lines.append(pending)
+    return lines[-tail:] if tail > 0 else []
+
+
+def level(item: dict) -> str:
+    """按stream和关键字推断日志级别, 饥荒日志本身不带级别."""
+    if item["stream"] == "stderr":
+        return "error"
+    data = item["data"].lower()
+    if any(marker in data for marker in ERROR_MARKERS):
+        return "error"
+    if "warning" in data:
+        return "warning"
+    return "info"
+
+
+class LogFilter:
+    """按关键字/正则及最低级别过滤日志"""
+
+    def __init__(
+        self,
+        grep: str | None = None,
+        regex: bool = False,
+        min_level: Literal["info", "warning", "error"] = "info",
+    ):
+        self.grep = grep or None
+        self.pattern = None
+        if self.grep and regex:
+            try:
+                self.pattern = re.compile(self.grep)
+            except re.error as e:
+                raise ValueError(f"invalid pattern {grep}: {e}")
+        self.min_level = LEVELS[min_level]
+
+    def __call__(self, item: dict) -> bool:
+        if self.pattern is not None:
+            if self.pattern.search(item["data"]) is None:
+                return False
+        elif self.grep is not None and self.grep not in item["data"]:
+            return False
+        return not self.min_level or LEVELS[level(item)] >= self.min_level
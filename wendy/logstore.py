@@ -0,0 +1,371 @@
+"""日志持久化: 每个世界按小时分段gzip存储, 每段附带倒排索引用于关键字搜索.
+
+目录结构: {LOG_STORE_PATH}/{部署ID}/{世界名称}/{YYYYMMDDHH}.log.gz 以及 .idx.gz.
+每次写入追加一个gzip member, 每行格式为"时间戳\\t内容". 索引记录每个member的偏移、
+长度和时间范围, 以及每个词出现在哪些member中, 搜索时只解压候选member.
+"""
+
+from typing import Dict, List, Set, Tuple
+
+import os
+import re
+import gzip
+import json
+import time
+import zlib
+import shutil
+import asyncio
+import threading
+from datetime import datetime, timezone
+from functools import lru_cache, partial
+
+import structlog
+
+from wendy import models
+from wendy.sse import BoundedQueue
+from wendy.cluster import Cluster, ClusterWorld
+from wendy.constants import DeployStatus
+from wendy.logs import follow, hub
+from wendy.settings import LOG_STORE_PATH, LOG_STORE_RETENTION, LOG_STORE_FLUSH_INTERVAL
+
+
+log = structlog.get_logger()
+SEGMENT = 3600
+queue = BoundedQueue(maxsize=100_000)
+# 写入线程与搜索线程共享正在写入的段
+lock = threading.Lock()
+# {上游key: (部署ID, 世界名称)}
+keys: Dict[str, Tuple[int, str]] = {}
+tasks: List[asyncio.Task] = []
+
+
+TOKEN = re.compile(r"[a-z0-9_]+|[^\W\x00-\x7f]")
+
+
+def tokenize(text: str) -> Set[str]:
+    """英文数字按单词, 中日韩等非ascii文字按单字切分."""
+    return set(TOKEN.findall(text.lower()))
+
+
+def segment_name(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y%m%d%H")
+
+
+def segment_start(name: str) -> int:
+    return int(datetime.strptime(name, "%Y%m%d%H").replace(tzinfo=timezone.utc).timestamp())
+
+
+def world_path(deploy_id: int, world: str) -> str:
+    """世界日志目录, 世界名称来自用户配置, 不允许包含路径."""
+    if not world or world in (".", "..") or "/" in world or "\\" in world or "\0" in world:
+        raise ValueError(f"invalid world name {world!r}")
+    return os.path.join(LOG_STORE_PATH, str(int(deploy_id)), world)
+
+
+def index_path(path: str) -> str:
+    return path[: -len(".log.gz")] + ".idx.gz"
+
+
+def parse_lines(text: str) -> List[Tuple[float, str]]:
+    lines = []
+    for line in text.splitlines():
+        timestamp, _, data = line.partition("\t")
+        lines.append((float(timestamp), data))
+    return lines
+
+
+def scan_members(path: str) -> List[Tuple[int, int, str]]:
+    """遍历日志段中的gzip member, 末尾写了一半的member会被截掉.
+
+    Returns:
+        List[Tuple[int, int, str]]: [(偏移, 长度, 内容), ...].
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    members = []
+    offset = 0
+    while offset < len(data):
+        decompressor = zlib.decompressobj(31)
+        try:
+            text = decompressor.decompress(data[offset:])
+        except zlib.error:
+            text = b""
+        if not decompressor.eof:
+            with open(path, "r+b") as file:
+                file.truncate(offset)
+            break
+        length = len(data) - offset - len(decompressor.unused_data)
+        members.append((offset, length, text.decode("utf-8", "replace")))
+        offset += length
+    return members
+
+
+class Index:
+    """一个日志段的索引"""
+
+    def __init__(self, members: List[list] | None = None, tokens: Dict[str, List[int]] | None = None):
+        # [[偏移, 长度, 最早时间, 最晚时间], ...]
+        self.members = members or []
+        # {词: [member序号, ...]}
+        self.tokens = tokens or {}
+
+    @property
+    def size(self) -> int:
+        return self.members[-1][0] + self.members[-1][1] if self.members else 0
+
+    @property
+    def last(self) -> float:
+        return max((item[3] for item in self.members), default=0.0)
+
+    def add(self, offset: int, length: int, lines: List[Tuple[float, str]]):
+        number = len(self.members)
+        self.members.append([offset, length, min(t for t, _ in lines), max(t for t, _ in lines)])
+        tokens = set()
+        for _, data in lines:
+            tokens |= tokenize(data)
+        for token in tokens:
+            self.tokens.setdefault(token, []).append(number)
+
+    def candidates(self, start: float, end: float, tokens: Set[str]) -> List[int]:
+        """时间范围重叠且包含全部词的member序号."""
+        numbers = None
+        for token in sorted(tokens, key=lambda item: len(self.tokens.get(item, []))):
+            postings = self.tokens.get(token, [])
+            numbers = set(postings) if numbers is None else numbers.intersection(postings)
+            if not numbers:
+                return []
+        if numbers is None:
+            numbers = range(len(self.members))
+        return sorted(
+            number for number in numbers if self.members[number][2] <= end and self.members[number][3] >= start
+        )
+
+    @classmethod
+    def build(cls, path: str) -> "Index":
+        index = cls()
+        for offset, length, text in scan_members(path):
+            if lines := parse_lines(text):
+                index.add(offset, length, lines)
+        return index
+
+    def save(self, path: str):
+        with gzip.open(index_path(path), "wt") as file:
+            json.dump({"members": self.members, "tokens": self.tokens}, file, separators=(",", ":"))
+
+
+class Segment:
+    """正在写入的一段日志, 索引保存在内存中, 结束时写入.idx.gz"""
+
+    def __init__(self, path: str):
+        self.path = path
+        # 重启后继续写入同一段, 重建索引
+        self.index = Index.build(path) if os.path.exists(path) else Index()
+        # 重启后上游会回放最近的日志, 跳过已写入的部分
+        self.cutoff = self.index.last
+        self.updated = time.time()
+
+    def append(self, records: List[Tuple[float, str]]):
+        lines = [(timestamp, data.replace("\n", " ")) for timestamp, data in records if timestamp > self.cutoff]
+        if not lines:
+            return
+        content = gzip.compress("".join(f"{t:.6f}\t{data}\n" for t, data in lines).encode(), compresslevel=6)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "ab") as file:
+            file.write(content)
+        self.index.add(self.index.size, len(content), lines)
+        self.updated = time.time()
+
+    def close(self):
+        self.index.save(self.path)
+
+
+@lru_cache(maxsize=1024)
+def read_member(path: str, offset: int, length: int) -> List[Tuple[float, str]]:
+    """读取一个member, 写入后不再变化."""
+    with open(path, "rb") as file:
+        file.seek(offset)
+        data = file.read(length)
+    return parse_lines(gzip.decompress(data).decode("utf-8", "replace"))
+
+
+@lru_cache(maxsize=256)
+def read_index(path: str, _mtime: float) -> Index:
+    with gzip.open(index_path(path), "rt") as file:
+        data = json.load(file)
+    return Index(data["members"], data["tokens"])
+
+
+def load_index(path: str) -> Index:
+    """已结束的段读取.idx.gz, 缺失时(如进程退出前未写入)重建."""
+    for segment in segments.values():
+        if segment.path == path:
+            return segment.index
+    if not os.path.exists(index_path(path)):
+        Index.build(path).save(path)
+    return read_index(path, os.path.getmtime(index_path(path)))
+
+
+# {(部署ID, 世界名称): 正在写入的段}
+segments: Dict[Tuple[int, str], Segment] = {}
+
+
+def write(records: Dict[Tuple[int, str], List[Tuple[float, str]]]):
+    """写入一批日志, 并关闭已过期的段."""
+    with lock:
+        _write(records)
+
+
+def _write(records: Dict[Tuple[int, str], List[Tuple[float, str]]]):
+    for (deploy_id, world), items in records.items():
+        try:
+            base = world_path(deploy_id, world)
+        except ValueError as e:
+            log.warning(f"skip logs: {e}")
+            continue
+        groups: Dict[str, List[Tuple[float, str]]] = {}
+        for timestamp, data in items:
+            groups.setdefault(segment_name(timestamp), []).append((timestamp, data))
+        for name, group in sorted(groups.items()):
+            path = os.path.join(base, f"{name}.log.gz")
+            segment = segments.get((deploy_id, world))
+            if segment is not None and segment.path != path:
+                segment.close()
+                segment = None
+            if segment is None:
+                segment = segments[(deploy_id, world)] = Segment(path)
+            segment.append(group)
+    now = time.time()
+    for key, segment in list(segments.items()):
+        # 小时已结束且一段时间内没有新日志时写入索引
+        name = os.path.basename(segment.path)[: -len(".log.gz")]
+        if segment_start(name) + SEGMENT < now and segment.updated + 60 < now:
+            segment.close()
+            segments.pop(key)
+
+
+def cleanup():
+    """删除超过保留天数的日志段, 以及已删除部署的目录."""
+    expired = segment_name(time.time() - LOG_STORE_RETENTION * 86400)
+    if not os.path.isdir(LOG_STORE_PATH):
+        return
+    for deploy_id in os.listdir(LOG_STORE_PATH):
+        deploy_path = os.path.join(LOG_STORE_PATH, deploy_id)
+        for world in os.listdir(deploy_path):
+            path = os.path.join(deploy_path, world)
+            for filename in os.listdir(path):
+                if filename[:10] < expired:
+                    os.remove(os.path.join(path, filename))
+            if not os.listdir(path):
+                os.rmdir(path)
+        if not os.listdir(deploy_path):
+            shutil.rmtree(deploy_path)
+
+
+async def watch():
+    """订阅所有运行中世界的日志, 不依赖前端是否打开"""
+    channels = {}
+    while True:
+        try:
+            current: Dict[str, Tuple[int, str]] = {}
+            worlds: Dict[str, ClusterWorld] = {}
+            async for deploy in models.Deploy.filter(status=DeployStatus.running.value):
+                cluster = Cluster.model_validate(deploy.cluster)
+                for world in cluster.world:
+                    key = f"{world.docker_api}/{world.container}"
+                    current[key] = (deploy.id, world.name)
+                    worlds[key] = world
+            for key in channels.keys() - current.keys():
+                hub.unsubscribe(key, queue)
+                channels.pop(key)
+            keys.clear()
+            keys.update(current)
+            for key, world in worlds.items():
+                channel = channels.get(key)
+                if channel is None or hub.channels.get(key) is not channel:
+                    channels[key] = hub.subscribe(key, partial(follow, world=world), queue, replay=lambda _: False)
+        except Exception as e:
+            log.exception(f"watch logs failed: {e}")
+        await asyncio.sleep(5)
+
+
+async def record():
+    cleaned = 0
+    while True:
+        try:
+            records: Dict[Tuple[int, str], List[Tuple[float, str]]] = {}
+            for key, item in await queue.get_batch(queue.maxsize, LOG_STORE_FLUSH_INTERVAL):
+                if key in keys and item["time"]:
+                    records.setdefault(keys[key], []).append((item["time"], item["data"]))
+            await asyncio.to_thread(write, records)
+            if time.time() - cleaned > SEGMENT:
+                await asyncio.to_thread(cleanup)
+                cleaned = time.time()
+        except Exception as e:
+            log.exception(f"record logs failed: {e}")
+
+
+async def start():
+    tasks.append(asyncio.create_task(watch()))
+    tasks.append(asyncio.create_task(record()))
+
+
+def search_segment(path: str, start: float, end: float, keyword: str, limit: int) -> List[Tuple[float, str]]:
+    """在一个日志段中搜索, 先用索引求候选member, 再按时间和关键字过滤行.
+
+    从新到旧读取member, 已取到limit条且剩余member都更早时停止.
+    """
+    tokens = tokenize(keyword)
+    phrases = re.findall(r"[^\x00-\x7f]+", keyword.lower())
+    with lock:
+        index = load_index(path)
+        members = [index.members[number] for number in index.candidates(start, end, tokens)]
+    result = []
+    for offset, length, _, last in sorted(members, key=lambda item: item[3], reverse=True):
+        if len(result) >= limit and last < result[limit - 1][0]:
+            break
+        for timestamp, data in read_member(path, offset, length):
+            if not start <= timestamp <= end:
+                continue
+            if tokens and not tokens <= tokenize(data):
+                continue
+            if phrases and not all(phrase in data.lower() for phrase in phrases):
+                continue
+            result.append((timestamp, data))
+        result.sort(reverse=True)
+    return result[:limit]
+
+
+def search(
+    deploy_id: int,
+    worlds: List[str],
+    start: float,
+    end: float,
+    keyword: str = "",
+    limit: int = 500,
+) -> List[dict]:
+    """按部署、世界、时间范围和关键字搜索日志, 从新到旧取limit条后按时间排序.
+
+    关键字中的英文单词需完整匹配, 中文按子串匹配.
+    """
+    first, last = segment_name(start), segment_name(end)
+    paths = []
+    for world in worlds:
+        path = world_path(deploy_id, world)
+        if not os.path.isdir(path):
+            continue
+        for filename in os.listdir(path):
+            if filename.endswith(".log.gz") and first <= filename[:10] <= last:
+                paths.append((filename[:10], world, os.path.join(path, filename)))
+    data = []
+    hour = None
+    for segment, world, path in sorted(paths, reverse=True):
+        # 同一小时的各世界都搜索完后才判断数量
+        if segment != hour and len(data) >= limit:
+            break
+        hour = segment
+        data.extend(
+            {"time": timestamp, "world": world, "data": line}
+            for timestamp, line in search_segment(path, start, end, keyword, limit)
+        )
+    data.sort(key=lambda item: item["time"], reverse=True)
+    return sorted(data[:limit], key=lambda item: item["time"])
@@ -0,0 +1,1093 @@
+"""受限的lua解释器, 用于在服务端执行modinfo.lua.
+
+只实现modinfo常用的lua子集, 不能访问python对象, 执行步数和时间均受限.
+"""
+
+from typing import Any, Callable, Dict, List
+
+import re
+import sys
+import json
+import math
+import time
+
+
+# 与lua 5.3一致, 整数为64位有符号数, 运算溢出时回绕
+INT_MIN, INT_MAX = -(1 << 63), (1 << 63) - 1
+# string.format转换说明的宽度和精度上限, 与lua一致为两位数
+FORMAT_SPEC = re.compile(r"%[-+ #0]*(\d*)(?:\.(\d*))?([a-zA-Z%])")
+
+
+class LuaError(Exception):
+    pass
+
+
+def wrap(value: int) -> int:
+    """整数回绕到64位."""
+    if INT_MIN <= value <= INT_MAX:
+        return value
+    return (value - INT_MIN) % (1 << 64) + INT_MIN
+
+
+def decimal(text: str) -> int | float:
+    """十进制整数常量, 超出64位时与lua 5.3一样转为浮点数."""
+    value = int(text)
+    return value if INT_MIN <= value <= INT_MAX else float(value)
+
+
+class LuaTable:
+    def __init__(self):
+        self.hash: Dict[Any, Any] = {}
+        # 数组部分的边界, 1..n均不为nil
+        self.n = 0
+
+    def get(self, key):
+        if isinstance(key, float) and key.is_integer():
+            key = int(key)
+        return self.hash.get(key)
+
+    def set(self, key, value):
+        if key is None:
+            raise LuaError("table index is nil")
+        if isinstance(key, float) and key.is_integer():
+            key = int(key)
+        if value is None:
+            self.hash.pop(key, None)
+            if isinstance(key, int) and 1 <= key <= self.n:
+                self.n = key - 1
+        else:
+            self.hash[key] = value
+            if key == self.n + 1 and not isinstance(key, bool):
+                while (self.n + 1) in self.hash:
+                    self.n += 1
+
+    def length(self) -> int:
+        return self.n
+
+    def to_python(self, depth: int = 0):
+        """转换为可json序列化的对象, 1..n连续整数键转为列表."""
+        if depth > 32:
+            raise LuaError("table too deep")
+        n = self.length()
+        if n == len(self.hash):
+            return [to_python(self.hash[i], depth + 1) for i in range(1, n + 1)]
+        return {str(k): to_python(v, depth + 1) for k, v in self.hash.items()}
+
+
+class LuaFunction:
+    def __init__(self, params: List[str], vararg: bool, body: list, scope: "Scope", name: str = "function"):
+        self.params = params
+        self.vararg = vararg
+        self.body = body
+        self.scope = scope
+        self.name = name
+
+
+class Builtin:
+    def __init__(self, func: Callable, name: str):
+        self.func = func
+        self.name = name
+
+
+def to_python(value, depth: int = 0):
+    if isinstance(value, LuaTable):
+        return value.to_python(depth)
+    if isinstance(value, (LuaFunction, Builtin)):
+        return None
+    if isinstance(value, float) and value.is_integer() and abs(value) < 2**53:
+        return int(value)
+    return value
+
+
+class Scope:
+    def __init__(self, parent: "Scope | None" = None):
+        self.vars: Dict[str, Any] = {}
+        self.parent = parent
+
+    def find(self, name: str) -> "Scope | None":
+        scope = self
+        while scope is not None:
+            if name in scope.vars:
+                return scope
+            scope = scope.parent
+        return None
+
+
+class BreakSignal(Exception):
+    pass
+
+
+class ReturnSignal(Exception):
+    def __init__(self, values: list):
+        self.values = values
+
+
+# ---------------------------------------------------------------------------
+# 词法分析
+
+TOKEN_RE = re.compile(
+    r"""
+    (?P<space>\s+)
+    |(?P<name>[A-Za-z_][A-Za-z_0-9]*)
+    |(?P<number>0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    |(?P<op>\.\.\.|\.\.|==|~=|<=|>=|//|::|[-+*/%^\#<>=(){}\[\];:,.])
+    """,
+    re.VERBOSE,
+)
+LONG_BRACKET_RE = re.compile(r"\[(=*)\[")
+ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "a": "\a", "b": "\b", "f": "\f", "v": "\v", "\\": "\\", '"': '"', "'": "'"}
+KEYWORDS = {
+    "and",
+    "break",
+    "do",
+    "else",
+    "elseif",
+    "end",
+    "false",
+    "for",
+    "function",
+    "goto",
+    "if",
+    "in",
+    "local",
+    "nil",
+    "not",
+    "or",
+    "repeat",
+    "return",
+    "then",
+    "true",
+    "until",
+    "while",
+}
+
+
+def read_string(code: str, i: int) -> tuple:
+    quote = code[i]
+    i += 1
+    out = []
+    while True:
+        if i >= len(code):
+            raise LuaError("unfinished string")
+        ch = code[i]
+        if ch == quote:
+            return "".join(out), i + 1
+        if ch == "\n":
+            raise LuaError("unfinished string")
+        if ch == "\\":
+            i += 1
+            ch = code[i] if i < len(code) else ""
+            if ch in ESCAPES:
+                out.append(ESCAPES[ch])
+                i += 1
+            elif ch == "\n":
+                out.append("\n")
+                i += 1
+            elif ch == "x":
+                out.append(chr(int(code[i + 1 : i + 3], 16)))
+                i += 3
+            elif ch == "z":
+                i += 1
+                while i < len(code) and code[i].isspace():
+                    i += 1
+            elif ch.isdigit():
+                digits = re.match(r"\d{1,3}", code[i:]).group()
+                out.append(chr(int(digits)))
+                i += len(digits)
+            elif ch == "u":
+                match = re.match(r"u\{([0-9a-fA-F]+)\}", code[i:])
+                if match is None:
+                    raise LuaError("invalid escape")
+                out.append(chr(int(match.group(1), 16)))
+                i += len(match.group())
+            else:
+                raise LuaError("invalid escape")
+        else:
+            out.append(ch)
+            i += 1
+
+
+def read_long_bracket(code: str, i: int) -> tuple | None:
+    match = LONG_BRACKET_RE.match(code, i)
+    if match is None:
+        return None
+    close = "]" + match.group(1) + "]"
+    end = code.find(close, match.end())
+    if end == -1:
+        raise LuaError("unfinished long string")
+    text = code[match.end() : end]
+    if text.startswith("\r\n"):
+        text = text[2:]
+    elif text.startswith("\n"):
+        text = text[1:]
+    return text, end + len(close)
+
+
+def tokenize(code: str) -> List[tuple]:
+    """词法分析, 返回[(类型, 值, 行号), ...]."""
+    tokens = []
+    i, line = 0, 1
+    if code.startswith("#"):
+        i = code.find("\n") if "\n" in code else len(code)
+    while i < len(code):
+        if code.startswith("--", i):
+            long = read_long_bracket(code, i + 2)
+            if long is not None:
+                line += code.count("\n", i, long[1])
+                i = long[1]
+            else:
+                end = code.find("\n", i)
+                i = len(code) if end == -1 else end
+            continue
+        ch = code[i]
+        if ch in "\"'":
+            value, end = read_string(code, i)
+            tokens.append(("string", value, line))
+            i = end
+            continue
+        if ch == "[":
+            long = read_long_bracket(code, i)
+            if long is not None:
+                tokens.append(("string", long[0], line))
+                line += code.count("\n", i, long[1])
+                i = long[1]
+                continue
+        match = TOKEN_RE.match(code, i)
+        if match is None:
+            raise LuaError(f"unexpected symbol near '{ch}' at line {line}")
+        kind, value = match.lastgroup, match.group()
+        if kind == "space":
+            line += value.count("\n")
+        elif kind == "name":
+            tokens.append(("keyword" if value in KEYWORDS else "name", value, line))
+        elif kind == "number":
+            if value.lower().startswith("0x"):
+                tokens.append(("number", wrap(int(value, 16)), line))
+            elif re.fullmatch(r"\d+", value):
+                tokens.append(("number", decimal(value), line))
+            else:
+                tokens.append(("number", float(value), line))
+        else:
+            tokens.append(("op", value, line))
+        i = match.end()
+    tokens.append(("eof", None, line))
+    return tokens
+
+
+# ---------------------------------------------------------------------------
+# 语法分析, 生成以元组表示的语法树
+
+BINARY_PRIORITY = {
+    "or": (1, 1),
+    "and": (2, 2),
+    "<": (3, 3),
+    ">": (3, 3),
+    "<=": (3, 3),
+    ">=": (3, 3),
+    "~=": (3, 3),
+    "==": (3, 3),
+    "..": (9, 8),
+    "+": (10, 10),
+    "-": (10, 10),
+    "*": (11, 11),
+    "/": (11, 11),
+    "//": (11, 11),
+    "%": (11, 11),
+    "^": (14, 13),
+}
+UNARY_PRIORITY = 12
+
+
+class Parser:
+    def __init__(self, code: str):
+        self.tokens = tokenize(code)
+        self.pos = 0
+
+    @property
+    def token(self) -> tuple:
+        return self.tokens[self.pos]
+
+    def check(self, value: str) -> bool:
+        kind, token, _ = self.token
+        return kind in ("op", "keyword") and token == value
+
+    def accept(self, value: str) -> bool:
+        if self.check(value):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, value: str):
+        if not self.accept(value):
+            raise LuaError(f"'{value}' expected near '{self.token[1]}' at line {self.token[2]}")
+
+    def name(self) -> str:
+        kind, value, line = self.token
+        if kind != "name":
+            raise LuaError(f"name expected near '{value}' at line {line}")
+        self.pos += 1
+        return value
+
+    def block(self) -> list:
+        statements = []
+        while not any(self.check(item) for item in ("end", "else", "elseif", "until")) and self.token[0] != "eof":
+            if self.check("return"):
+                self.pos += 1
+                values = []
+                if not any(self.check(item) for item in ("end", "else", "elseif", "until", ";")):
+                    if self.token[0] != "eof":
+                        values = self.exprlist()
+                self.accept(";")
+                statements.append(("return", values))
+                break
+            statement = self.statement()
+            if statement is not None:
+                statements.append(statement)
+        return statements
+
+    def statement(self):
+        if self.accept(";"):
+            return None
+        if self.accept("if"):
+            clauses = []
+            condition = self.expr()
+            self.expect("then")
+            clauses.append((condition, self.block()))
+            orelse = []
+            while True:
+                if self.accept("elseif"):
+                    condition = self.expr()
+                    self.expect("then")
+                    clauses.append((condition, self.block()))
+                elif self.accept("else"):
+                    orelse = self.block()
+                    self.expect("end")
+                    break
+                else:
+                    self.expect("end")
+                    break
+            return ("if", clauses, orelse)
+        if self.accept("while"):
+            condition = self.expr()
+            self.expect("do")
+            body = self.block()
+            self.expect("end")
+            return ("while", condition, body)
+        if self.accept("do"):
+            body = self.block()
+            self.expect("end")
+            return ("do", body)
+        if self.accept("repeat"):
+            body = self.block()
+            self.expect("until")
+            return ("repeat", body, self.expr())
+        if self.accept("for"):
+            first = self.name()
+            if self.accept("="):
+                start = self.expr()
+                self.expect(",")
+                stop = self.expr()
+                step = self.expr() if self.accept(",") else ("const", 1)
+                self.expect("do")
+                body = self.block()
+                self.expect("end")
+                return ("fornum", first, start, stop, step, body)
+            names = [first]
+            while self.accept(","):
+                names.append(self.name())
+            self.expect("in")
+            values = self.exprlist()
+            self.expect("do")
+            body = self.block()
+            self.expect("end")
+            return ("forin", names, values, body)
+        if self.accept("function"):
+            target = ("name", self.name())
+            method = False
+            while self.check(".") or self.check(":"):
+                method = self.check(":")
+                self.pos += 1
+                target = ("index", target, ("const", self.name()))
+                if method:
+                    break
+            return ("assign", [target], [self.function(method)])
+        if self.accept("local"):
+            if self.accept("function"):
+                name = self.name()
+                return ("localfunction", name, self.function(False))
+            names = [self.name()]
+            while self.accept(","):
+                names.append(self.name())
+            values = self.exprlist() if self.accept("=") else []
+            return ("local", names, values)
+        if self.accept("break"):
+            return ("break",)
+        expr = self.suffixedexp()
+        if self.check("=") or self.check(","):
+            targets = [expr]
+            while self.accept(","):
+                targets.append(self.suffixedexp())
+            self.expect("=")
+            for target in targets:
+                if target[0] not in ("name", "index"):
+                    raise LuaError("syntax error near '='")
+            return ("assign", targets, self.exprlist())
+        if expr[0] not in ("call", "method"):
+            raise LuaError(f"syntax error near '{self.token[1]}' at line {self.token[2]}")
+        return ("expr", expr)
+
+    def function(self, method: bool):
+        self.expect("(")
+        params = ["self"] if method else []
+        vararg = False
+        if not self.check(")"):
+            while True:
+                if self.accept("..."):
+                    vararg = True
+                    break
+                params.append(self.name())
+                if not self.accept(","):
+                    break
+        self.expect(")")
+        body = self.block()
+        self.expect("end")
+        return ("function", params, vararg, body)
+
+    def exprlist(self) -> list:
+        values = [self.expr()]
+        while self.accept(","):
+            values.append(self.expr())
+        return values
+
+    def expr(self, limit: int = 0):
+        kind, value, _ = self.token
+        if kind in ("op", "keyword") and value in ("not", "-", "#", "~"):
+            self.pos += 1
+            left = ("unop", value, self.expr(UNARY_PRIORITY))
+        else:
+            left = self.simpleexp()
+        while True:
+            kind, value, _ = self.token
+            if kind not in ("op", "keyword") or value not in BINARY_PRIORITY:
+                return left
+            priority, right = BINARY_PRIORITY[value]
+            if priority <= limit:
+                return left
+            self.pos += 1
+            left = ("binop", value, left, self.expr(right))
+
+    def simpleexp(self):
+        kind, value, line = self.token
+        if kind in ("number", "string"):
+            self.pos += 1
+            return ("const", value)
+        if kind == "keyword" and value in ("nil", "true", "false"):
+            self.pos += 1
+            return ("const", {"nil": None, "true": True, "false": False}[value])
+        if self.accept("..."):
+            return ("vararg",)
+        if self.check("{"):
+            return self.table()
+        if self.accept("function"):
+            return self.function(False)
+        return self.suffixedexp()
+
+    def primaryexp(self):
+        if self.accept("("):
+            expr = self.expr()
+            self.expect(")")
+            return ("paren", expr)
+        return ("name", self.name())
+
+    def suffixedexp(self):
+        expr = self.primaryexp()
+        while True:
+            if self.accept("."):
+                expr = ("index", expr, ("const", self.name()))
+            elif self.accept("["):
+                key = self.expr()
+                self.expect("]")
+                expr = ("index", expr, key)
+            elif self.accept(":"):
+                name = self.name()
+                expr = ("method", expr, name, self.args())
+            elif self.check("(") or self.check("{") or self.token[0] == "string":
+                expr = ("call", expr, self.args())
+            else:
+                return expr
+
+    def args(self) -> list:
+        if self.token[0] == "string":
+            value = self.token[1]
+            self.pos += 1
+            return [("const", value)]
+        if self.check("{"):
+            return [self.table()]
+        self.expect("(")
+        if self.accept(")"):
+            return []
+        values = self.exprlist()
+        self.expect(")")
+        return values
+
+    def table(self):
+        self.expect("{")
+        items = []
+        while not self.accept("}"):
+            if self.accept("["):
+                key = self.expr()
+                self.expect("]")
+                self.expect("=")
+                items.append((key, self.expr()))
+            elif self.token[0] == "name" and self.tokens[self.pos + 1][1] == "=":
+                key = ("const", self.name())
+                self.expect("=")
+                items.append((key, self.expr()))
+            else:
+                items.append((None, self.expr()))
+            if not (self.accept(",") or self.accept(";")):
+                self.expect("}")
+                break
+        return ("table", items)
+
+
+# ---------------------------------------------------------------------------
+# 执行
+
+
+class Interpreter:
+    def __init__(self, max_steps: int = 1_000_000, timeout: float = 1.0, max_string: int = 1 << 20):
+        self.max_steps = max_steps
+        self.max_string = max_string
+        self.steps = 0
+        self.deadline = time.monotonic() + timeout
+        self.globals = Scope()
+        self._install()
+
+    def step(self):
+        self.steps += 1
+        if self.steps > self.max_steps:
+            raise LuaError("step limit exceeded")
+        if self.steps % 1024 == 0 and time.monotonic() > self.deadline:
+            raise LuaError("time limit exceeded")
+
+    # -- 标准库 --
+
+    def _install(self):
+        def lua_type(value=None):
+            if value is None:
+                return "nil"
+            if isinstance(value, bool):
+                return "boolean"
+            if isinstance(value, (int, float)):
+                return "number"
+            if isinstance(value, str):
+                return "string"
+            if isinstance(value, LuaTable):
+                return "table"
+            return "function"
+
+        def ipairs(table=None):
+            if not isinstance(table, LuaTable):
+                raise LuaError("bad argument to 'ipairs'")
+
+            def iterator(_table=None, index=0):
+                value = table.get(index + 1)
+                return [None] if value is None else [index + 1, value]
+
+            return [Builtin(iterator, "ipairs_iterator"), table, 0]
+
+        def pairs(table=None):
+            if not isinstance(table, LuaTable):
+                raise LuaError("bad argument to 'pairs'")
+            keys = list(table.hash.keys())
+            positions = {key: index for index, key in enumerate(keys)}
+
+            def iterator(_table=None, key=None):
+                index = 0 if key is None else positions[key] + 1
+                while index < len(keys):
+                    if keys[index] in table.hash:
+                        return [keys[index], table.hash[keys[index]]]
+                    index += 1
+                return [None]
+
+            return [Builtin(iterator, "next"), table, None]
+
+        def tonumber(value=None, base=None):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return value
+            if isinstance(value, str):
+                try:
+                    if base:
+                        return wrap(int(value.strip(), base))
+                    return decimal(value) if re.fullmatch(r"\s*-?\d+\s*", value) else float(value)
+                except ValueError:
+                    return None
+            return None
+
+        def table_insert(table=None, *args):
+            if not isinstance(table, LuaTable):
+                raise LuaError("bad argument to 'insert'")
+            if len(args) == 1:
+                table.set(table.length() + 1, args[0])
+            elif len(args) == 2:
+                position, value = args
+                n = table.length()
+                for i in range(n, int(position) - 1, -1):
+                    self.step()
+                    table.set(i + 1, table.get(i))
+                table.set(position, value)
+
+        def table_concat(table=None, sep="", i=1, j=None):
+            if not isinstance(table, LuaTable):
+                raise LuaError("bad argument to 'concat'")
+            j = table.length() if j is None else j
+            sep = self.tostring(sep)
+            items, size = [], 0
+            for k in range(int(i), int(j) + 1):
+                self.step()
+                value = table.get(k)
+                if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+                    raise LuaError("invalid value in table for 'concat'")
+                items.append(self.tostring(value))
+                size += len(items[-1]) + (len(sep) if len(items) > 1 else 0)
+                if size > self.max_string:
+                    raise LuaError("string too long")
+            return sep.join(items)
+
+        def string_format(fmt="", *args):
+            # 先按转换说明估算结果长度, 避免"%900000000d"之类的格式构造超长字符串
+            size = len(fmt)
+            for width, precision, _ in FORMAT_SPEC.findall(fmt):
+                if len(width) > 2 or len(precision) > 2:
+                    raise LuaError("invalid conversion to 'format'")
+                size += int(width or 0) + int(precision or 0)
+            args = [self.tostring(arg) if isinstance(arg, (LuaTable, bool)) or arg is None else arg for arg in args]
+            size += sum(len(arg) if isinstance(arg, str) else 32 for arg in args)
+            if size > self.max_string:
+                raise LuaError("string too long")
+            try:
+                return re.sub(r"%(\d*)i", r"%\1d", fmt) % tuple(args)
+            except (TypeError, ValueError, OverflowError):
+                raise LuaError("bad argument to 'format'")
+
+        def string_sub(s="", i=1, j=-1):
+            n = len(s)
+            i, j = int(i), int(j)
+            i = max(n + i + 1, 1) if i < 0 else max(i, 1)
+            j = n + j + 1 if j < 0 else min(j, n)
+            return s[i - 1 : j]
+
+        def string_rep(s="", n=0, sep=""):
+            n = max(int(n), 0)
+            if n == 0 or not s and not sep:
+                return ""
+            if len(s) * n + len(sep) * (n - 1) > self.max_string:
+                raise LuaError("string too long")
+            return sep.join([s] * n)
+
+        def choose_translation_table(table=None):
+            locale = self.globals.vars.get("locale")
+            value = table.get(locale) if isinstance(table, LuaTable) else None
+            return value if value is not None else table.get(1)
+
+        string = LuaTable()
+        for key, func in {
+            "format": string_format,
+            "sub": string_sub,
+            "rep": string_rep,
+            "upper": lambda s="": s.upper(),
+            "lower": lambda s="": s.lower(),
+            "len": lambda s="": len(s),
+            "char": lambda *args: "".join(chr(int(arg)) for arg in args),
+            "byte": lambda s="", i=1: ord(s[int(i) - 1]) if 0 < int(i) <= len(s) else None,
+            "reverse": lambda s="": s[::-1],
+        }.items():
+            string.set(key, Builtin(func, key))
+        table = LuaTable()
+        table.set("insert", Builtin(table_insert, "insert"))
+        table.set("concat", Builtin(table_concat, "concat"))
+        table.set("getn", Builtin(lambda t=None: t.length(), "getn"))
+        math_table = LuaTable()
+        for key, func in {
+            "floor": lambda x=0: math.floor(x),
+            "ceil": lambda x=0: math.ceil(x),
+            "abs": abs,
+            "max": max,
+            "min": min,
+            "sqrt": math.sqrt,
+            "fmod": math.fmod,
+        }.items():
+            math_table.set(key, Builtin(func, key))
+        math_table.set("pi", math.pi)
+        math_table.set("huge", math.inf)
+        self.string = string
+        self.globals.vars.update(
+            {
+                "type": Builtin(lua_type, "type"),
+                "ipairs": Builtin(ipairs, "ipairs"),
+                "pairs": Builtin(pairs, "pairs"),
+                "tostring": Builtin(lambda value=None: self.tostring(value), "tostring"),
+                "tonumber": Builtin(tonumber, "tonumber"),
+                "print": Builtin(lambda *args: None, "print"),
+                "assert": Builtin(self._assert, "assert"),
+                "error": Builtin(self._error, "error"),
+                "unpack": Builtin(lambda t=None: [t.get(i) for i in range(1, t.length() + 1)], "unpack"),
+                "select": Builtin(self._select, "select"),
+                "string": string,
+                "table": table,
+                "math": math_table,
+                "ChooseTranslationTable": Builtin(choose_translation_table, "ChooseTranslationTable"),
+            }
+        )
+
+    def _assert(self, value=None, message="assertion failed!", *args):
+        if value is None or value is False:
+            raise LuaError(self.tostring(message))
+        return [value, message, *args]
+
+    def _error(self, message=None, *args):
+        raise LuaError(self.tostring(message))
+
+    def _select(self, n=None, *args):
+        if n == "#":
+            return len(args)
+        return list(args[int(n) - 1 :])
+
+    def tostring(self, value) -> str:
+        if value is None:
+            return "nil"
+        if value is True:
+            return "true"
+        if value is False:
+            return "false"
+        if isinstance(value, float):
+            if value.is_integer() and abs(value) < 1e16:
+                return str(int(value))
+            return repr(value)
+        if isinstance(value, LuaTable):
+            return "table"
+        if isinstance(value, (LuaFunction, Builtin)):
+            return "function"
+        return str(value)
+
+    # -- 语句 --
+
+    def run(self, code: str, env: dict | None = None) -> Scope:
+        """执行代码, 返回全局变量作用域."""
+        if env:
+            self.globals.vars.update(env)
+        try:
+            body = Parser(code).block()
+            self.exec_block(body, Scope(self.globals), new_scope=False)
+        except ReturnSignal:
+            pass
+        except BreakSignal:
+            raise LuaError("break outside a loop")
+        except RecursionError:
+            raise LuaError("stack overflow")
+        return self.globals
+
+    def exec_block(self, body: list, scope: Scope, new_scope: bool = True):
+        if new_scope:
+            scope = Scope(scope)
+        for statement in body:
+            self.exec_statement(statement, scope)
+
+    def exec_statement(self, statement: tuple, scope: Scope):
+        self.step()
+        kind = statement[0]
+        if kind == "local":
+            values = self.eval_list(statement[2], scope)
+            for i, name in enumerate(statement[1]):
+                scope.vars[name] = values[i] if i < len(values) else None
+        elif kind == "assign":
+            values = self.eval_list(statement[2], scope)
+            for i, target in enumerate(statement[1]):
+                self.assign(target, values[i] if i < len(values) else None, scope)
+        elif kind == "localfunction":
+            scope.vars[statement[1]] = None
+            scope.vars[statement[1]] = self.eval(statement[2], scope)
+        elif kind == "expr":
+            self.eval_multi(statement[1], scope)
+        elif kind == "if":
+            for condition, body in statement[1]:
+                if truthy(self.eval(condition, scope)):
+                    self.exec_block(body, scope)
+                    break
+            else:
+                self.exec_block(statement[2], scope)
+        elif kind == "while":
+            try:
+                while truthy(self.eval(statement[1], scope)):
+                    self.exec_block(statement[2], scope)
+            except BreakSignal:
+                pass
+        elif kind == "repeat":
+            try:
+                while True:
+                    inner = Scope(scope)
+                    self.exec_block(statement[1], inner, new_scope=False)
+                    if truthy(self.eval(statement[2], inner)):
+                        break
+            except BreakSignal:
+                pass
+        elif kind == "do":
+            self.exec_block(statement[1], scope)
+        elif kind == "fornum":
+            _, name, start, stop, step, body = statement
+            start, stop, step = (self.number(self.eval(item, scope)) for item in (start, stop, step))
+            if step == 0:
+                raise LuaError("'for' step is zero")
+            i = start
+            try:
+                while (step > 0 and i <= stop) or (step < 0 and i >= stop):
+                    inner = Scope(scope)
+                    inner.vars[name] = i
+                    self.exec_block(body, inner, new_scope=False)
+                    i += step
+            except BreakSignal:
+                pass
+        elif kind == "forin":
+            _, names, values, body = statement
+            values = self.eval_list(values, scope) + [None, None, None]
+            func, state, control = values[:3]
+            try:
+                while True:
+                    results = self.call(func, [state, control])
+                    if not results or results[0] is None:
+                        break
+                    control = results[0]
+                    inner = Scope(scope)
+                    for i, name in enumerate(names):
+                        inner.vars[name] = results[i] if i < len(results) else None
+                    self.exec_block(body, inner, new_scope=False)
+            except BreakSignal:
+                pass
+        elif kind == "return":
+            raise ReturnSignal(self.eval_list(statement[1], scope))
+        elif kind == "break":
+            raise BreakSignal()
+        else:
+            raise LuaError(f"unsupported statement {kind}")
+
+    def assign(self, target: tuple, value, scope: Scope):
+        if target[0] == "name":
+            owner = scope.find(target[1]) or self.globals
+            owner.vars[target[1]] = value
+        else:
+            table = self.eval(target[1], scope)
+            if not isinstance(table, LuaTable):
+                raise LuaError("attempt to index a non-table value")
+            table.set(self.eval(target[2], scope), value)
+
+    # -- 表达式 --
+
+    def eval_list(self, exprs: list, scope: Scope) -> list:
+        values = []
+        for i, expr in enumerate(exprs):
+            if i == len(exprs) - 1:
+                values.extend(self.eval_multi(expr, scope))
+            else:
+                values.append(self.eval(expr, scope))
+        return values
+
+    def eval_multi(self, expr: tuple, scope: Scope) -> list:
+        if expr[0] in ("call", "method"):
+            if expr[0] == "call":
+                func = self.eval(expr[1], scope)
+                args = self.eval_list(expr[2], scope)
+            else:
+                obj = self.eval(expr[1], scope)
+                func = self.index(obj, expr[2])
+                args = [obj, *self.eval_list(expr[3], scope)]
+            return self.call(func, args)
+        if expr[0] == "vararg":
+            owner = scope.find("...")
+            return list(owner.vars["..."]) if owner else []
+        return [self.eval(expr, scope)]
+
+    def call(self, func, args: list) -> list:
+        self.step()
+        if isinstance(func, Builtin):
+            try:
+                result = func.func(*args)
+            except LuaError:
+                raise
+            except Exception as exc:
+                raise LuaError(f"error in '{func.name}': {exc}")
+            return result if isinstance(result, list) else [result]
+        if isinstance(func, LuaFunction):
+            scope = Scope(func.scope)
+            for i, name in enumerate(func.params):
+                scope.vars[name] = args[i] if i < len(args) else None
+            if func.vararg:
+                scope.vars["..."] = args[len(func.params) :]
+            try:
+                self.exec_block(func.body, scope, new_scope=False)
+            except ReturnSignal as signal:
+                return signal.values
+            return []
+        raise LuaError(f"attempt to call a {type(func).__name__} value")
+
+    def index(self, obj, key):
+        if isinstance(obj, LuaTable):
+            return obj.get(key)
+        if isinstance(obj, str):
+            return self.string.get(key)
+        raise LuaError(f"attempt to index a {self.tostring(obj) if obj is None else type(obj).__name__} value")
+
+    def number(self, value):
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise LuaError("attempt to perform arithmetic on a non-number value")
+        if isinstance(value, str):
+            try:
+                return float(value) if "." in value or "e" in value.lower() else decimal(value)
+            except ValueError:
+                raise LuaError("attempt to perform arithmetic on a string value")
+        return value
+
+    def eval(self, expr: tuple, scope: Scope):
+        self.step()
+        kind = expr[0]
+        if kind == "const":
+            return expr[1]
+        if kind == "name":
+            owner = scope.find(expr[1])
+            return owner.vars[expr[1]] if owner else None
+        if kind == "index":
+            return self.index(self.eval(expr[1], scope), self.eval(expr[2], scope))
+        if kind in ("call", "method", "vararg"):
+            values = self.eval_multi(expr, scope)
+            return values[0] if values else None
+        if kind == "paren":
+            return self.eval(expr[1], scope)
+        if kind == "function":
+            return LuaFunction(expr[1], expr[2], expr[3], scope)
+        if kind == "table":
+            table = LuaTable()
+            n = 1
+            for i, (key, value) in enumerate(expr[1]):
+                if key is None:
+                    if i == len(expr[1]) - 1:
+                        for item in self.eval_multi(value, scope):
+                            table.set(n, item)
+                            n += 1
+                    else:
+                        table.set(n, self.eval(value, scope))
+                        n += 1
+                else:
+                    table.set(self.eval(key, scope), self.eval(value, scope))
+            return table
+        if kind == "unop":
+            value = self.eval(expr[2], scope)
+            if expr[1] == "not":
+                return not truthy(value)
+            if expr[1] == "-":
+                value = -self.number(value)
+                return wrap(value) if isinstance(value, int) else value
+            if expr[1] == "#":
+                if isinstance(value, str):
+                    return len(value)
+                if isinstance(value, LuaTable):
+                    return value.length()
+                raise LuaError("attempt to get length of a non-table value")
+            raise LuaError(f"unsupported operator {expr[1]}")
+        if kind == "binop":
+            op = expr[1]
+            left = self.eval(expr[2], scope)
+            if op == "and":
+                return self.eval(expr[3], scope) if truthy(left) else left
+            if op == "or":
+                return left if truthy(left) else self.eval(expr[3], scope)
+            right = self.eval(expr[3], scope)
+            return self.binop(op, left, right)
+        raise LuaError(f"unsupported expression {kind}")
+
+    def binop(self, op: str, left, right):
+        if op == "==":
+            return lua_equal(left, right)
+        if op == "~=":
+            return not lua_equal(left, right)
+        if op == "..":
+            if not isinstance(left, (str, int, float)) or isinstance(left, bool):
+                raise LuaError("attempt to concatenate a non-string value")
+            if not isinstance(right, (str, int, float)) or isinstance(right, bool):
+                raise LuaError("attempt to concatenate a non-string value")
+            value = self.tostring(left) + self.tostring(right)
+            if len(value) > self.max_string:
+                raise LuaError("string too long")
+            return value
+        if op in ("<", ">", "<=", ">="):
+            if isinstance(left, str) and isinstance(right, str):
+                pass
+            else:
+                left, right = self.number(left), self.number(right)
+            return {"<": left < right, ">": left > right, "<=": left <= right, ">=": left >= right}[op]
+        left, right = self.number(left), self.number(right)
+        integer = isinstance(left, int) and isinstance(right, int)
+        try:
+            if op == "+":
+                return wrap(left + right) if integer else left + right
+            if op == "-":
+                return wrap(left - right) if integer else left - right
+            if op == "*":
+                return wrap(left * right) if integer else left * right
+            if op == "/":
+                return left / right
+            if op == "//":
+                return wrap(left // right) if integer else left // right
+            if op == "%":
+                if integer:
+                    return left % right
+                return left - math.floor(left / right) * right
+            if op == "^":
+                return float(left) ** float(right)
+        except (ZeroDivisionError, OverflowError):
+            if op == "/":
+                return math.nan if left == 0 else math.copysign(math.inf, left)
+            raise LuaError("arithmetic error")
+        raise LuaError(f"unsupported operator {op}")
+
+
+def truthy(value) -> bool:
+    return value is not None and value is not False
+
+
+def lua_equal(left, right) -> bool:
+    if isinstance(left, bool) or isinstance(right, bool):
+        return left is right
+    if isinstance(left, (LuaTable, LuaFunction, Builtin)):
+        return left is right
+    return (
+        type(left) is type(right)
+        and left == right
+        or (isinstance(left, (int, float)) and isinstance(right, (int, float)) and left == right)
+    )
+
+
+def main():
+    """子进程入口, 从stdin读取请求, 执行后把指定全局变量以json输出到stdout.
+
+    不可信代码在子进程中执行, 调用方超时后可以直接kill, 并限制子进程的内存.
+    请求: {"code", "env", "fields", "max_steps", "timeout", "memory"}.
+    """
+    request = json.load(sys.stdin)
+    if request.get("memory"):
+        import resource
+
+        resource.setrlimit(resource.RLIMIT_AS, (request["memory"], request["memory"]))
+    interpreter = Interpreter(max_steps=request["max_steps"], timeout=request["timeout"])
+    try:
+        scope = interpreter.run(request["code"], request["env"])
+        values = {key: to_python(scope.vars.get(key)) for key in request["fields"]}
+        result = {"values": {key: value for key, value in values.items() if value is not None}, "error": None}
+    except LuaError as e:
+        result = {"values": None, "error": str(e)}
+    except MemoryError:
+        result = {"values": None, "error": "not enough memory"}
+    json.dump(result, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from tortoise.contrib.fastapi import register_tortoise
 
-from wendy import agent
+from wendy import agent, jobs, history, logstore, ports, shards
 from wendy.api import router
 from wendy.settings import APP_NAME, TORTOISE_ORM, DEBUG
 
@@ -28,6 +28,11 @@ async def lifespan(app: FastAPI):
         config=TORTOISE_ORM,
         add_exception_handlers=False,
     )
+    await ports.seed()
+    await jobs.start()
+    await history.start()
+    await logstore.start()
+    await shards.start()
     if not DEBUG:
         asyncio.create_task(agent.monitor())
     yield
@@ -0,0 +1,172 @@
+"""容器资源指标计算"""
+
+from typing import Any, Dict, List, Tuple
+
+import json
+import time
+from datetime import datetime
+
+
+def cpu_percent(stats: dict) -> float:
+    """根据docker stats计算cpu使用率(100表示占满一个核).
+
+    Args:
+        stats (dict): /containers/{id}/stats 返回.
+
+    Returns:
+        float: cpu使用率.
+    """
+    cpu_stats = stats.get("cpu_stats") or {}
+    precpu_stats = stats.get("precpu_stats") or {}
+    cpu_delta = cpu_stats.get("cpu_usage", {}).get("total_usage", 0) - precpu_stats.get("cpu_usage", {}).get(
+        "total_usage", 0
+    )
+    system_delta = cpu_stats.get("system_cpu_usage", 0) - precpu_stats.get("system_cpu_usage", 0)
+    if cpu_delta <= 0 or system_delta <= 0:
+        return 0.0
+    online_cpus = cpu_stats.get("online_cpus") or len(cpu_stats.get("cpu_usage", {}).get("percpu_usage") or [1])
+    return cpu_delta / system_delta * online_cpus * 100
+
+
+def memory_usage(stats: dict) -> int:
+    """根据docker stats计算内存使用(不含页缓存).
+
+    Args:
+        stats (dict): /containers/{id}/stats 返回.
+
+    Returns:
+        int: 内存使用字节数.
+    """
+    memory_stats = stats.get("memory_stats") or {}
+    usage = memory_stats.get("usage", 0)
+    cache = memory_stats.get("stats", {}).get("inactive_file", memory_stats.get("stats", {}).get("cache", 0))
+    return max(usage - cache, 0)
+
+
+def network_bytes(stats: dict) -> Tuple[int, int]:
+    """所有网卡的累计(接收, 发送)字节数, host网络模式下docker不返回networks."""
+    rx = tx = 0
+    for item in (stats.get("networks") or {}).values():
+        rx += item.get("rx_bytes", 0)
+        tx += item.get("tx_bytes", 0)
+    return rx, tx
+
+
+def block_io(stats: dict) -> Tuple[int, int]:
+    """块设备累计(读, 写)字节数."""
+    read = write = 0
+    for item in (stats.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []:
+        op = item.get("op", "").lower()
+        if op == "read":
+            read += item.get("value", 0)
+        elif op == "write":
+            write += item.get("value", 0)
+    return read, write
+
+
+def read_time(stats: dict) -> float:
+    try:
+        return datetime.fromisoformat(stats["read"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+def summary(stats: dict, previous: dict | None = None) -> Dict[str, Any]:
+    """将docker stats压缩为常用指标, 网络和磁盘为相对上一个采样的每秒速率.
+
+    Args:
+        stats (dict): 当前采样.
+        previous (dict | None): 上一个采样.
+
+    Returns:
+        Dict[str, Any]: 指标.
+    """
+    now = read_time(stats)
+    data = {
+        "time": now,
+        "cpu_percent": round(cpu_percent(stats), 2),
+        "memory": memory_usage(stats),
+        "memory_limit": (stats.get("memory_stats") or {}).get("limit", 0),
+        "pids": (stats.get("pids_stats") or {}).get("current", 0),
+        "net_rx": 0.0,
+        "net_tx": 0.0,
+        "block_read": 0.0,
+        "block_write": 0.0,
+    }
+    if previous is not None:
+        elapsed = now - read_time(previous)
+        if elapsed > 0:
+            for keys, func in ((("net_rx", "net_tx"), network_bytes), (("block_read", "block_write"), block_io)):
+                for key, value, before in zip(keys, func(stats), func(previous)):
+                    data[key] = round(max(value - before, 0) / elapsed, 2)
+    if "networks" not in stats:
+        # host网络模式没有容器自己的网卡, 网络指标不可用
+        data["net_rx"] = data["net_tx"] = None
+    return data
+
+
+def cgroup_summary(counters: dict, previous: dict | None = None) -> Dict[str, Any]:
+    """根据cgroup v2计数器计算指标, 格式与summary相同.
+
+    Args:
+        counters (dict): 当前读取的计数器.
+        previous (dict | None): 上一次读取的计数器.
+
+    Returns:
+        Dict[str, Any]: 指标.
+    """
+    data = {
+        "time": counters["time"],
+        "cpu_percent": 0.0,
+        "memory": max(counters["memory"] - counters["inactive_file"], 0),
+        "memory_limit": counters["memory_limit"],
+        "pids": counters["pids"],
+        "net_rx": 0.0,
+        "net_tx": 0.0,
+        "block_read": 0.0,
+        "block_write": 0.0,
+    }
+    if previous is not None:
+        elapsed = counters["time"] - previous["time"]
+        if elapsed > 0:
+            cpu = max(counters["cpu_usage"] - previous["cpu_usage"], 0)
+            data["cpu_percent"] = round(cpu / 1_000_000 / elapsed * 100, 2)
+            for key in ("net_rx", "net_tx", "block_read", "block_write"):
+                if key in counters and key in previous:
+                    data[key] = round(max(counters[key] - previous[key], 0) / elapsed, 2)
+    if "net_rx" not in counters:
+        # host网络模式下/proc/{pid}/net/dev是整台主机的流量, 网络指标不可用
+        data["net_rx"] = data["net_tx"] = None
+    return data
+
+
+def merge(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """合并一个时间段内的多个指标: 速率和cpu取平均, 其余取最新值."""
+    data = dict(samples[-1])
+    for key in ("cpu_percent", "net_rx", "net_tx", "block_read", "block_write"):
+        values = [item[key] for item in samples if item[key] is not None]
+        data[key] = round(sum(values) / len(values), 2) if values else None
+    return data
+
+
+class NDJSONDecoder:
+    """增量解析按行分隔的json流, 数据块边界与json对象不一定对齐"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[Any]:
+        self.buffer += data
+        if b"\n" not in data:
+            return []
+        *lines, rest = self.buffer.split(b"\n")
+        self.buffer = bytearray(rest)
+        items = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                continue
+        return items
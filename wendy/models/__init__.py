@@ -8,3 +8,66 @@ class Deploy(models.Model):
 
     created_at = fields.DatetimeField(auto_now_add=True)
     updated_at = fields.DatetimeField(auto_now=True)
+
+
+class Port(models.Model):
+    """端口段分配记录, deploy_id为空表示已回收可复用"""
+
+    id = fields.IntField(pk=True)
+    docker_api = fields.CharField(max_length=255)
+    slot = fields.IntField()
+    deploy_id = fields.IntField(null=True, index=True)
+
+    created_at = fields.DatetimeField(auto_now_add=True)
+    updated_at = fields.DatetimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (("docker_api", "slot"),)
+
+
+class Job(models.Model):
+    """部署任务"""
+
+    id = fields.IntField(pk=True)
+    deploy_id = fields.IntField(index=True)
+    action = fields.CharField(max_length=32)
+    status = fields.CharField(max_length=32)
+    # [{"stage": 阶段, "time": 时间戳}, ...]
+    progress = fields.JSONField(default=list)
+    # {世界名称: 从启动容器到就绪的秒数, 超时为null}
+    ready = fields.JSONField(null=True)
+    error = fields.TextField(null=True)
+
+    created_at = fields.DatetimeField(auto_now_add=True)
+    updated_at = fields.DatetimeField(auto_now=True)
+
+
+class ModInfo(models.Model):
+    """模组modinfo.lua及解析结果缓存"""
+
+    id = fields.IntField(pk=True)
+    mod_id = fields.CharField(max_length=64)
+    time_updated = fields.IntField()
+    code = fields.TextField()
+    info = fields.JSONField(null=True)
+    error = fields.TextField(null=True)
+
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (("mod_id", "time_updated"),)
+
+
+class Metric(models.Model):
+    """资源指标聚合, resolution为聚合粒度(秒), time为时间段开始的时间戳"""
+
+    id = fields.IntField(pk=True)
+    deploy_id = fields.IntField()
+    world = fields.CharField(max_length=64)
+    resolution = fields.IntField()
+    time = fields.IntField()
+    # {指标: [平均值, 最大值]}
+    data = fields.JSONField()
+
+    class Meta:
+        unique_together = (("deploy_id", "world", "resolution", "time"),)
@@ -0,0 +1,169 @@
+"""modinfo.lua解析与缓存"""
+
+from typing import Dict, List, Tuple
+
+import os
+import sys
+import json
+import asyncio
+
+import structlog
+
+from wendy import lua, models, steamcmd, remotezip
+from wendy.agent import download_mods
+from wendy.settings import (
+    GAME_ARCHIVE_PATH,
+    MODINFO_LOCALE,
+    MODINFO_MAX_STEPS,
+    MODINFO_TIMEOUT,
+    MODINFO_MEMORY,
+)
+
+
+log = structlog.get_logger()
+# modinfo.lua中需要返回的全局变量
+FIELDS = [
+    "name",
+    "description",
+    "author",
+    "version",
+    "api_version",
+    "api_version_dst",
+    "icon",
+    "icon_atlas",
+    "priority",
+    "dst_compatible",
+    "client_only_mod",
+    "server_only_mod",
+    "all_clients_require_mod",
+    "server_filter_tags",
+    "configuration_options",
+    "mod_dependencies",
+]
+# {(mod_id, time_updated): 解析结果}
+cache: Dict[Tuple[str, int], dict] = {}
+
+
+async def parse(code: str, mod_id: str) -> dict:
+    """在子进程的受限解释器中执行modinfo.lua, 超时后直接kill子进程.
+
+    Args:
+        code (str): modinfo.lua内容.
+        mod_id (str): 模组ID.
+
+    Returns:
+        dict: {"info": 解析结果, "error": 错误信息}.
+    """
+    request = {
+        "code": code,
+        "env": {"locale": MODINFO_LOCALE, "folder_name": f"workshop-{mod_id}"},
+        "fields": FIELDS,
+        "max_steps": MODINFO_MAX_STEPS,
+        "timeout": MODINFO_TIMEOUT,
+        "memory": MODINFO_MEMORY,
+    }
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "wendy.lua",
+        # 保证子进程能导入wendy
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(lua.__file__))),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        # 解释器自身的时间限制之外留出进程启动的时间
+        stdout, stderr = await asyncio.wait_for(process.communicate(json.dumps(request).encode()), MODINFO_TIMEOUT + 5)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return {"info": None, "error": "time limit exceeded"}
+    if process.returncode != 0:
+        message = stderr.decode(errors="replace").strip().splitlines()[-1:] or [f"exit code {process.returncode}"]
+        return {"info": None, "error": f"parser failed: {message[0]}"}
+    result = json.loads(stdout)
+    return {"info": result["values"], "error": result["error"]}
+
+
+def read_code(mod_path: str) -> str:
+    path = os.path.join(mod_path, "modinfo.lua")
+    if not os.path.exists(path):
+        return ""
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        return file.read()
+
+
+async def save(mod_id: str, time_updated: int, code: str) -> dict:
+    """解析并持久化modinfo.
+
+    Args:
+        mod_id (str): 模组ID.
+        time_updated (int): 模组更新时间.
+        code (str): modinfo.lua内容.
+
+    Returns:
+        dict: {"id", "code", "info", "error"}.
+    """
+    result = await parse(code, mod_id)
+    await models.ModInfo.update_or_create(
+        mod_id=mod_id,
+        time_updated=time_updated,
+        defaults={"code": code, **result},
+    )
+    data = {"id": mod_id, "code": code, **result}
+    cache[(mod_id, time_updated)] = data
+    return data
+
+
+async def load(mods: List[str]) -> List[dict]:
+    """获取模组modinfo, 优先使用(mod_id, time_updated)缓存, 缺失时通过Range读取或下载模组后解析.
+
+    Args:
+        mods (List[str]): 模组ID.
+
+    Returns:
+        List[dict]: [{"id", "code", "info", "error"}, ...].
+    """
+    if not mods:
+        return []
+    details = await steamcmd.publishedfiledetails(list(mods))
+    times = {}
+    for mod in details["response"]["publishedfiledetails"]:
+        times[mod["publishedfileid"]] = int(mod.get("time_updated") or 0)
+    missing = [mod_id for mod_id in mods if mod_id in times and (mod_id, times[mod_id]) not in cache]
+    if missing:
+        async for item in models.ModInfo.filter(mod_id__in=missing):
+            if times[item.mod_id] == item.time_updated:
+                cache[(item.mod_id, item.time_updated)] = {
+                    "id": item.mod_id,
+                    "code": item.code,
+                    "info": item.info,
+                    "error": item.error,
+                }
+        missing = [mod_id for mod_id in missing if (mod_id, times[mod_id]) not in cache]
+    file_urls = {}
+    for mod in details["response"]["publishedfiledetails"]:
+        if mod["publishedfileid"] in missing and mod.get("file_url"):
+            file_urls[mod["publishedfileid"]] = mod["file_url"]
+    for mod_id, file_url in file_urls.items():
+        # 只读取中央目录和modinfo.lua, 服务端不支持Range时回退到完整下载
+        try:
+            content = await remotezip.read_file(file_url, "modinfo.lua")
+        except Exception as e:
+            log.warning(f"read modinfo.lua by range failed: {mod_id}, {e}")
+            continue
+        code = content.decode("utf-8", errors="replace") if content is not None else ""
+        await save(mod_id, times[mod_id], code)
+        missing.remove(mod_id)
+    if missing:
+        mods_path = await download_mods(mods=missing, path=os.path.join(GAME_ARCHIVE_PATH, "mods"))
+        for mod_id in missing:
+            if mod_id in mods_path:
+                code = await asyncio.to_thread(read_code, mods_path[mod_id])
+                await save(mod_id, times[mod_id], code)
+    data = []
+    for mod_id in mods:
+        item = cache.get((mod_id, times.get(mod_id)))
+        data.append(item or {"id": mod_id, "code": "", "info": None, "error": None})
+    return data
@@ -0,0 +1,199 @@
+from typing import Dict, Set
+
+import asyncio
+
+import structlog
+
+from wendy import models
+from wendy.cluster import Cluster
+from wendy.settings import PORT_RANGE_START, PORT_RANGE_END, PORT_RANGE_SIZE
+
+
+log = structlog.get_logger()
+# 分配端口加锁
+lock = asyncio.Lock()
+# {docker_api: 已分配的最大slot}
+high_water: Dict[str, int] = {}
+max_slot = (PORT_RANGE_END - PORT_RANGE_START + 1) // PORT_RANGE_SIZE
+
+
+def slot_port(slot: int) -> int:
+    """端口段起始端口."""
+    return PORT_RANGE_START + slot * PORT_RANGE_SIZE
+
+
+def slot_conflict(slot: int, in_use: Set[int]) -> bool:
+    port = slot_port(slot)
+    return any(p in in_use for p in range(port, port + PORT_RANGE_SIZE))
+
+
+def parse_proc_net(content: str) -> Set[int]:
+    """解析/proc/net/{tcp,udp,tcp6,udp6}内容中监听的端口.
+
+    每个文件之前有一行"# 文件名", tcp只取LISTEN(0A)状态, udp只取未连接的绑定端口(07),
+    主动连接使用的临时端口和TIME_WAIT等状态不算占用.
+
+    Args:
+        content (str): 文件内容.
+
+    Returns:
+        Set[int]: 端口.
+    """
+    states = {"tcp": "0A", "tcp6": "0A", "udp": "07", "udp6": "07"}
+    state = None
+    ports = set()
+    for line in content.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[0] == "#":
+            state = states.get(parts[1])
+            continue
+        if state is None or len(parts) < 4 or ":" not in parts[1] or parts[3].upper() != state:
+            continue
+        try:
+            ports.add(int(parts[1].rsplit(":", 1)[1], 16))
+        except ValueError:
+            continue
+    return ports
+
+
+async def host_ports(docker_api: str) -> Set[int]:
+    """获取docker主机上已占用的端口(host网络).
+
+    Args:
+        docker_api (str): docker api.
+
+    Returns:
+        Set[int]: 端口, 获取失败时抛出ValueError, 避免把已占用的端口段分配出去.
+    """
+    from wendy.agent import run_busybox
+
+    try:
+        content = await run_busybox(
+            docker_api,
+            "wendy_busybox_ports",
+            'for name in tcp udp tcp6 udp6; do echo "# $name"; cat /proc/net/$name 2>/dev/null; done',
+            host_config={"NetworkMode": "host"},
+        )
+        return parse_proc_net(content)
+    except Exception as e:
+        raise ValueError(f"host ports unavailable on {docker_api}: {e}") from e
+
+
+async def acquire(docker_api: str, id: int) -> models.Port:
+    """在docker_api上为部署分配一个空闲端口段, 优先复用已回收的端口段.
+
+    Args:
+        docker_api (str): docker api.
+        id (int): 部署ID.
+
+    Returns:
+        models.Port: 端口段.
+    """
+    in_use = await host_ports(docker_api)
+    async for port in models.Port.filter(docker_api=docker_api, deploy_id=None).order_by("slot"):
+        if not slot_conflict(port.slot, in_use):
+            port.deploy_id = id
+            await port.save()
+            return port
+    if docker_api not in high_water:
+        last = await models.Port.filter(docker_api=docker_api).order_by("-slot").first()
+        high_water[docker_api] = -1 if last is None else last.slot
+    while high_water[docker_api] + 1 < max_slot:
+        high_water[docker_api] += 1
+        slot = high_water[docker_api]
+        # 已被其他程序占用的端口段记为空闲, 后续分配时重新检测
+        conflict = slot_conflict(slot, in_use)
+        port = await models.Port.create(
+            docker_api=docker_api,
+            slot=slot,
+            deploy_id=None if conflict else id,
+        )
+        if not conflict:
+            return port
+    raise ValueError(f"no free port range on {docker_api}")
+
+
+async def allocate(id: int, cluster: Cluster) -> Dict[str, int]:
+    """为集群中端口未设置的docker_api分配端口段.
+
+    Args:
+        id (int): 部署ID.
+        cluster (Cluster): cluster.
+
+    Returns:
+        Dict[str, int]: {docker_api: 端口段起始端口}.
+    """
+    docker_apis = set()
+    for world in cluster.world:
+        ports = (world.server_port, world.master_server_port, world.authentication_port)
+        if -1 in ports or (world.is_master and cluster.ini.master_port == -1):
+            docker_apis.add(world.docker_api)
+    data = {}
+    async with lock:
+        for docker_api in sorted(docker_apis):
+            port = await models.Port.filter(docker_api=docker_api, deploy_id=id).first()
+            if port is None:
+                port = await acquire(docker_api, id)
+                log.info(f"cluster {id} allocate ports {slot_port(port.slot)} on {docker_api}")
+            data[docker_api] = slot_port(port.slot)
+    return data
+
+
+def cluster_ports(cluster: Cluster) -> Dict[str, Set[int]]:
+    """集群已设置的端口.
+
+    Args:
+        cluster (Cluster): cluster.
+
+    Returns:
+        Dict[str, Set[int]]: {docker_api: 端口}.
+    """
+    data: Dict[str, Set[int]] = {}
+    for world in cluster.world:
+        ports = {world.server_port, world.master_server_port, world.authentication_port}
+        if world.is_master:
+            ports.add(cluster.ini.master_port)
+        data.setdefault(world.docker_api, set()).update(ports)
+    return data
+
+
+async def seed():
+    """把已有部署占用的端口段登记到分配记录, 启动时执行.
+
+    旧版本按10000+id*100分配端口且没有记录, 不登记的话新部署可能分到相同的端口.
+    登记的端口段以下尚无记录的端口段记为空闲, 分配时优先复用.
+    """
+    async with lock:
+        slots: Dict[str, Dict[int, int]] = {}
+        async for deploy in models.Deploy.all().order_by("id"):
+            cluster = Cluster.model_validate(deploy.cluster)
+            for docker_api, ports in cluster_ports(cluster).items():
+                for port in ports:
+                    slot = (port - PORT_RANGE_START) // PORT_RANGE_SIZE
+                    if port >= PORT_RANGE_START and slot < max_slot:
+                        slots.setdefault(docker_api, {}).setdefault(slot, deploy.id)
+        for docker_api, used in slots.items():
+            records = {port.slot: port async for port in models.Port.filter(docker_api=docker_api)}
+            for slot in range(max(used) + 1):
+                id = used.get(slot)
+                port = records.get(slot)
+                if port is None:
+                    await models.Port.create(docker_api=docker_api, slot=slot, deploy_id=id)
+                    if id is not None:
+                        log.info(f"cluster {id} seed ports {slot_port(slot)} on {docker_api}")
+                elif id is not None and port.deploy_id is None:
+                    port.deploy_id = id
+                    await port.save()
+                elif id is not None and port.deploy_id != id:
+                    log.warning(f"ports {slot_port(slot)} on {docker_api} used by cluster {id} and {port.deploy_id}")
+        high_water.clear()
+
+
+async def release(id: int):
+    """回收部署的端口段.
+
+    Args:
+        id (int): 部署ID.
+    """
+    async with lock:
+        await models.Port.filter(deploy_id=id).update(deploy_id=None)
@@ -0,0 +1,189 @@
+"""通过HTTP Range请求读取远程zip中的单个文件, 只下载中央目录和目标成员"""
+
+from typing import Dict
+
+import re
+import zlib
+import struct
+import zipfile
+
+import httpx
+
+
+# EOCD(22字节) + 最长注释(65535字节)
+TAIL_SIZE = 22 + 65535
+END_RECORD = struct.Struct("<4s4H2LH")
+ZIP64_LOCATOR = struct.Struct("<4sLQL")
+ZIP64_END_RECORD = struct.Struct("<4sQ2H2L4Q")
+CENTRAL_DIR = struct.Struct("<4s4B4HL2L5H2L")
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+# 读取成员的最大大小(解压后), 防止压缩炸弹
+MAX_MEMBER_SIZE = 4 << 20
+
+
+class RangeNotSupported(Exception):
+    """服务端不支持Range请求"""
+
+
+class RemoteZip:
+    def __init__(self, client: httpx.AsyncClient, url: str):
+        self.client = client
+        self.url = url
+        self.size = 0
+        # 已读取的tail数据, 中央目录较小时可直接复用
+        self._tail = b""
+        self._tail_offset = 0
+
+    async def get(self, value: str) -> httpx.Response:
+        """发送Range请求, 服务端忽略Range返回200时不读取响应体, 直接关闭连接.
+
+        Args:
+            value (str): Range请求头.
+
+        Returns:
+            httpx.Response: 已读取响应体的206响应.
+        """
+        async with self.client.stream("GET", self.url, headers={"Range": value}) as response:
+            if response.status_code != 206:
+                raise RangeNotSupported(self.url)
+            await response.aread()
+        return response
+
+    async def fetch(self, start: int, end: int) -> bytes:
+        """读取[start, end]字节."""
+        response = await self.get(f"bytes={start}-{end}")
+        return response.content
+
+    async def fetch_tail(self) -> bytes:
+        response = await self.get(f"bytes=-{TAIL_SIZE}")
+        match = re.match(r"bytes (\d+)-(\d+)/(\d+)", response.headers.get("content-range", ""))
+        if match is None:
+            raise RangeNotSupported(self.url)
+        self._tail_offset, self.size = int(match.group(1)), int(match.group(3))
+        self._tail = response.content
+        return self._tail
+
+    async def read(self, start: int, length: int) -> bytes:
+        if start >= self._tail_offset and start + length <= self._tail_offset + len(self._tail):
+            return self._tail[start - self._tail_offset : start - self._tail_offset + length]
+        return await self.fetch(start, start + length - 1)
+
+    async def directory(self) -> Dict[str, tuple]:
+        """读取中央目录.
+
+        Returns:
+            Dict[str, tuple]: {成员路径: (压缩方式, 压缩后大小, 解压后大小, 本地文件头偏移)}.
+        """
+        tail = await self.fetch_tail()
+        position = tail.rfind(b"PK\005\006")
+        if position == -1:
+            raise ValueError("not a zip file")
+        _, _, _, _, count, cd_size, cd_offset, _ = END_RECORD.unpack_from(tail, position)
+        if cd_offset == 0xFFFFFFFF or cd_size == 0xFFFFFFFF or count == 0xFFFF:
+            locator = position - ZIP64_LOCATOR.size
+            _, _, end_offset, _ = ZIP64_LOCATOR.unpack_from(tail, locator)
+            record = await self.read(end_offset, ZIP64_END_RECORD.size)
+            fields = ZIP64_END_RECORD.unpack(record)
+            cd_size, cd_offset = fields[8], fields[9]
+        data = await self.read(cd_offset, cd_size)
+        members = {}
+        position = 0
+        while position + CENTRAL_DIR.size <= len(data):
+            fields = CENTRAL_DIR.unpack_from(data, position)
+            if fields[0] != b"PK\001\002":
+                break
+            flag, method = fields[5], fields[6]
+            compress_size, file_size = fields[10], fields[11]
+            name_length, extra_length, comment_length = fields[12], fields[13], fields[14]
+            header_offset = fields[18]
+            name_start = position + CENTRAL_DIR.size
+            raw_name = data[name_start : name_start + name_length]
+            name = raw_name.decode("utf-8" if flag & 0x800 else "cp437").replace("\\", "/")
+            extra = data[name_start + name_length : name_start + name_length + extra_length]
+            if 0xFFFFFFFF in (compress_size, file_size, header_offset):
+                compress_size, file_size, header_offset = self._zip64_extra(
+                    extra, compress_size, file_size, header_offset
+                )
+            members[name] = (method, compress_size, file_size, header_offset)
+            position = name_start + name_length + extra_length + comment_length
+        return members
+
+    @classmethod
+    def _zip64_extra(cls, extra: bytes, compress_size: int, file_size: int, header_offset: int) -> tuple:
+        position = 0
+        while position + 4 <= len(extra):
+            tag, size = struct.unpack_from("<2H", extra, position)
+            if tag == 0x0001:
+                values = list(struct.unpack_from(f"<{size // 8}Q", extra, position + 4))
+                if file_size == 0xFFFFFFFF:
+                    file_size = values.pop(0)
+                if compress_size == 0xFFFFFFFF:
+                    compress_size = values.pop(0)
+                if header_offset == 0xFFFFFFFF:
+                    header_offset = values.pop(0)
+                break
+            position += 4 + size
+        return compress_size, file_size, header_offset
+
+    async def read_member(
+        self,
+        method: int,
+        compress_size: int,
+        file_size: int,
+        header_offset: int,
+        max_size: int = MAX_MEMBER_SIZE,
+    ) -> bytes:
+        """读取并解压成员, 解压后的大小超过中央目录记录的大小或max_size时抛出ValueError.
+
+        Args:
+            method (int): 压缩方式.
+            compress_size (int): 压缩后大小.
+            file_size (int): 解压后大小.
+            header_offset (int): 本地文件头偏移.
+            max_size (int): 最大大小.
+
+        Returns:
+            bytes: 成员内容.
+        """
+        if file_size > max_size or compress_size > max_size:
+            raise ValueError(f"member too large: {file_size}")
+        header = await self.read(header_offset, LOCAL_HEADER.size)
+        fields = LOCAL_HEADER.unpack(header)
+        if fields[0] != b"PK\003\004":
+            raise ValueError("bad local file header")
+        start = header_offset + LOCAL_HEADER.size + fields[10] + fields[11]
+        data = await self.read(start, compress_size) if compress_size else b""
+        if method == zipfile.ZIP_STORED:
+            content = data
+        elif method == zipfile.ZIP_DEFLATED:
+            # 最多多解压1字节, 用于判断实际大小是否超过记录的大小
+            decompressor = zlib.decompressobj(-15)
+            content = decompressor.decompress(data, file_size + 1)
+            if decompressor.unconsumed_tail:
+                raise ValueError(f"member larger than {file_size}")
+        else:
+            raise ValueError(f"unsupported compression method {method}")
+        if len(content) != file_size:
+            raise ValueError(f"member size mismatch: {len(content)} != {file_size}")
+        return content
+
+
+async def read_file(url: str, filename: str, timeout: int = 10) -> bytes | None:
+    """读取远程zip中指定文件名的成员, 存在多个时取层级最浅的.
+
+    Args:
+        url (str): zip地址.
+        filename (str): 文件名.
+        timeout (int): 超时时间.
+
+    Returns:
+        bytes | None: 文件内容, 不存在时返回None; 服务端不支持Range时抛出RangeNotSupported.
+    """
+    async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+        remote = RemoteZip(client, url)
+        members = await remote.directory()
+        names = [name for name in members if name.rsplit("/", 1)[-1] == filename]
+        if not names:
+            return None
+        name = min(names, key=lambda item: item.count("/"))
+        return await remote.read_member(*members[name])
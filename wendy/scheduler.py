@@ -0,0 +1,359 @@
+from typing import Dict, List
+
+import json
+import asyncio
+from urllib.parse import urlsplit
+
+import structlog
+import aiodocker
+from pydantic import BaseModel
+
+from wendy import models, metrics
+from wendy.cluster import Cluster, ClusterWorld
+from wendy.stats import latest
+from wendy.constants import DOCKER_API_AUTO
+from wendy.settings import DOCKER_API_HOSTS, SHARD_CAPACITY, HOST_LOAD_LIMIT
+
+
+log = structlog.get_logger()
+# 调度加锁, 防止并发部署选中同一空位
+lock = asyncio.Lock()
+# {docker_api: {numa节点: [cpu]}}, 无numa信息时只有节点-1
+topology: Dict[str, Dict[int, List[int]]] = {}
+
+
+class ContainerUsage(BaseModel):
+    cpu_percent: float = 0
+    memory: int = 0
+
+
+class HostLoad(BaseModel):
+    docker_api: str
+    cpus: int
+    memory: int
+    capacity: int
+    # 已预留分片数(所有部署中位于该主机的世界)
+    shards: int = 0
+    containers: Dict[str, ContainerUsage] = {}
+
+    @property
+    def cpu_usage(self) -> float:
+        return sum(item.cpu_percent for item in self.containers.values()) / 100 / max(self.cpus, 1)
+
+    @property
+    def memory_usage(self) -> float:
+        return sum(item.memory for item in self.containers.values()) / max(self.memory, 1)
+
+    @property
+    def utilization(self) -> float:
+        return max(self.shards / max(self.capacity, 1), self.cpu_usage, self.memory_usage)
+
+    def fits(self, shards: int) -> bool:
+        return (
+            self.shards + shards <= self.capacity
+            and self.cpu_usage < HOST_LOAD_LIMIT
+            and self.memory_usage < HOST_LOAD_LIMIT
+        )
+
+
+async def reserved_shards() -> Dict[str, List[tuple]]:
+    """统计各主机上已预留的分片.
+
+    Returns:
+        Dict[str, List[tuple]]: {docker_api: [(部署ID, 世界), ...]}.
+    """
+    data = {}
+    async for deploy in models.Deploy.all():
+        cluster = Cluster.model_validate(deploy.cluster)
+        for world in cluster.world:
+            data.setdefault(world.docker_api, []).append((deploy.id, world))
+    return data
+
+
+async def host_load(docker_api: str, shards: int) -> HostLoad | None:
+    """获取主机负载, 主机不可用时返回None.
+
+    Args:
+        docker_api (str): docker api.
+        shards (int): 已预留分片数.
+
+    Returns:
+        HostLoad | None: 主机负载.
+    """
+    try:
+        async with aiodocker.Docker(docker_api) as docker:
+            info = await docker.system.info()
+            containers = await docker.containers.list(filters=json.dumps({"name": ["dst_"]}))
+            usage = {}
+            # 已有订阅的容器直接使用共享采样, 其余才请求docker stats
+            pending = []
+            for container in containers:
+                name = container._container.get("Names", ["/"])[0].lstrip("/")
+                if item := latest(docker_api, name):
+                    usage[name] = ContainerUsage(cpu_percent=item["cpu_percent"], memory=item["memory"])
+                else:
+                    pending.append((name, container))
+            stats = await asyncio.gather(
+                *(container.stats(stream=False) for _, container in pending),
+                return_exceptions=True,
+            )
+    except Exception:
+        log.warning(f"docker host unavailable: {docker_api}")
+        return None
+    for (name, _), item in zip(pending, stats):
+        if isinstance(item, BaseException) or not item:
+            continue
+        usage[name] = ContainerUsage(
+            cpu_percent=metrics.cpu_percent(item[0]),
+            memory=metrics.memory_usage(item[0]),
+        )
+    cpus = info.get("NCPU", 1)
+    return HostLoad(
+        docker_api=docker_api,
+        cpus=cpus,
+        memory=info.get("MemTotal", 0),
+        capacity=SHARD_CAPACITY or cpus,
+        shards=shards,
+        containers=usage,
+    )
+
+
+async def hosts_load() -> List[HostLoad]:
+    """获取所有可调度主机的负载."""
+    reserved = await reserved_shards()
+    loads = await asyncio.gather(
+        *(host_load(docker_api, len(reserved.get(docker_api, []))) for docker_api in DOCKER_API_HOSTS)
+    )
+    return [item for item in loads if item is not None]
+
+
+def pick(loads: List[HostLoad], shards: int, exclude: List[str] | None = None) -> HostLoad | None:
+    """best-fit装箱: 在放得下的主机中选剩余容量最少的, 相同时选负载低的.
+
+    Args:
+        loads (List[HostLoad]): 主机负载.
+        shards (int): 需要的分片数.
+        exclude (List[str] | None): 尽量避开的主机.
+
+    Returns:
+        HostLoad | None: 选中的主机.
+    """
+    candidates = [item for item in loads if item.fits(shards)]
+    if exclude:
+        candidates = [item for item in candidates if item.docker_api not in exclude] or candidates
+    if not candidates:
+        return None
+    return min(candidates, key=lambda item: (item.capacity - item.shards, item.utilization))
+
+
+async def place(cluster: Cluster) -> Cluster:
+    """为docker_api为auto的世界选择主机.
+
+    Args:
+        cluster (Cluster): cluster.
+
+    Returns:
+        Cluster: cluster.
+    """
+    worlds = [world for world in cluster.world if world.docker_api == DOCKER_API_AUTO]
+    if worlds:
+        async with lock:
+            loads = await hosts_load()
+            if cluster.affinity == "together":
+                groups = [worlds]
+            else:
+                groups = [[world] for world in worlds]
+            for group in groups:
+                used = [world.docker_api for world in cluster.world if world.docker_api != DOCKER_API_AUTO]
+                host = pick(loads, len(group), exclude=used if cluster.affinity == "apart" else None)
+                if host is None:
+                    raise ValueError("no docker host available")
+                for world in group:
+                    world.docker_api = host.docker_api
+                host.shards += len(group)
+                log.info(f"place {[world.name for world in group]} on {host.docker_api}")
+    # 手动指定在不同主机上的世界同样需要连接主世界
+    link_shards(cluster)
+    return cluster
+
+
+def host_address(docker_api: str) -> str | None:
+    """docker_api对应主机的地址, 本机unix socket无法得知对外地址时返回None."""
+    url = urlsplit(docker_api)
+    if url.scheme in ("tcp", "http", "https") and url.hostname:
+        return url.hostname
+    return None
+
+
+def link_shards(cluster: Cluster):
+    """世界分散在不同主机时, 从世界需要通过网络连接主世界.
+
+    监听地址改为0.0.0.0, 主世界地址改为主世界所在主机, 已手动配置的地址不覆盖.
+    """
+    master = next((world for world in cluster.world if world.is_master), None)
+    if master is None or all(world.docker_api == master.docker_api for world in cluster.world):
+        return
+    if cluster.ini.bind_ip == "127.0.0.1":
+        cluster.ini.bind_ip = "0.0.0.0"
+    if cluster.ini.master_ip == "127.0.0.1":
+        address = host_address(master.docker_api)
+        if address is None:
+            raise ValueError(f"cannot determine address of {master.docker_api}, set ini.master_ip for split shards")
+        cluster.ini.master_ip = address
+
+
+def move(source: HostLoad, target: HostLoad, worlds: List[ClusterWorld]):
+    """把世界的分片数和资源占用从source移到target."""
+    for world in worlds:
+        target.containers[world.container] = source.containers.pop(world.container, ContainerUsage())
+    source.shards -= len(worlds)
+    target.shards += len(worlds)
+
+
+async def rebalance(threshold: float = 0.2) -> List[dict]:
+    """给出迁移建议, 使各主机利用率差不超过threshold. 同一部署同一主机上的世界一起迁移.
+
+    Args:
+        threshold (float): 利用率差阈值.
+
+    Returns:
+        List[dict]: [{"id": 部署ID, "worlds": [世界名], "source": 原主机, "target": 目标主机}, ...].
+    """
+    reserved = await reserved_shards()
+    loads = {item.docker_api: item for item in await hosts_load()}
+    groups = {}
+    for docker_api, items in reserved.items():
+        for id, world in items:
+            groups.setdefault((docker_api, id), []).append(world)
+    suggestions = []
+    moved = set()
+    while len(loads) > 1:
+        source = max(loads.values(), key=lambda item: item.utilization)
+        target = min(loads.values(), key=lambda item: item.utilization)
+        if source.utilization - target.utilization <= threshold:
+            break
+        spread = source.utilization - target.utilization
+        candidates = [
+            (id, worlds)
+            for (docker_api, id), worlds in groups.items()
+            if docker_api == source.docker_api and id not in moved and target.fits(len(worlds))
+        ]
+        # 优先迁移最小的组, 迁移后利用率差没有缩小的不迁移, 避免来回震荡
+        for id, worlds in sorted(candidates, key=lambda item: len(item[1])):
+            move(source, target, worlds)
+            if abs(source.utilization - target.utilization) < spread:
+                break
+            move(target, source, worlds)
+        else:
+            break
+        moved.add(id)
+        suggestions.append(
+            {
+                "id": id,
+                "worlds": [world.name for world in worlds],
+                "source": source.docker_api,
+                "target": target.docker_api,
+            }
+        )
+    return suggestions
+
+
+def parse_cpulist(cpulist: str) -> List[int]:
+    """解析cpulist格式, 如0-3,8-11.
+
+    Args:
+        cpulist (str): cpulist.
+
+    Returns:
+        List[int]: cpu编号.
+    """
+    cpus = []
+    for item in cpulist.strip().split(","):
+        if not item:
+            continue
+        if "-" in item:
+            start, end = item.split("-")
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(item))
+    return cpus
+
+
+def parse_topology(content: str) -> Dict[int, List[int]]:
+    """解析每行"节点编号 cpulist"格式的numa拓扑, 节点编号为-时视为单节点-1.
+
+    Args:
+        content (str): 内容.
+
+    Returns:
+        Dict[int, List[int]]: {numa节点: [cpu]}, 不含没有cpu的节点.
+    """
+    nodes = {}
+    for line in content.splitlines():
+        parts = line.split()
+        if len(parts) != 2:
+            continue
+        if cpus := parse_cpulist(parts[1]):
+            nodes[-1 if parts[0] == "-" else int(parts[0])] = cpus
+    return nodes
+
+
+async def cpu_topology(docker_api: str) -> Dict[int, List[int]]:
+    """获取主机numa拓扑, 无numa信息时视为单节点-1.
+
+    Args:
+        docker_api (str): docker api.
+
+    Returns:
+        Dict[int, List[int]]: {numa节点: [cpu]}.
+    """
+    from wendy.agent import run_busybox
+
+    if docker_api not in topology:
+        content = await run_busybox(
+            docker_api,
+            "wendy_busybox_topology",
+            "for node in /sys/devices/system/node/node[0-9]*; do "
+            '[ -e "$node/cpulist" ] && echo "${node##*node} $(cat $node/cpulist)"; '
+            "done; "
+            '[ -e /sys/devices/system/node/node0 ] || echo "- 0-$(($(nproc) - 1))"',
+        )
+        topology[docker_api] = parse_topology(content)
+    return topology[docker_api]
+
+
+async def assign_cpuset(id: int, cluster: Cluster) -> Cluster:
+    """为cpuset为auto的世界绑核: 依次选择绑定分片最少的numa节点和其中最空闲的cpu, 内存绑定到同一节点.
+
+    Args:
+        id (int): 部署ID.
+        cluster (Cluster): cluster.
+
+    Returns:
+        Cluster: cluster.
+    """
+    worlds = [world for world in cluster.world if world.cpuset == "auto"]
+    if not worlds:
+        return cluster
+    async with lock:
+        reserved = await reserved_shards()
+        for docker_api in {world.docker_api for world in worlds}:
+            nodes = await cpu_topology(docker_api)
+            pinned = {cpu: 0 for node in nodes.values() for cpu in node}
+            others = [world for deploy_id, world in reserved.get(docker_api, []) if deploy_id != id]
+            others.extend(world for world in cluster.world if world.docker_api == docker_api)
+            for world in others:
+                if world.cpuset and world.cpuset != "auto":
+                    for cpu in parse_cpulist(world.cpuset):
+                        if cpu in pinned:
+                            pinned[cpu] += 1
+            for world in worlds:
+                if world.docker_api != docker_api:
+                    continue
+                node = min(nodes, key=lambda node: sum(pinned[cpu] for cpu in nodes[node]) / len(nodes[node]))
+                cpu = min(nodes[node], key=lambda cpu: pinned[cpu])
+                pinned[cpu] += 1
+                world.cpuset = str(cpu)
+                world.cpuset_mems = str(node) if node >= 0 else ""
+                log.info(f"cluster {id} pin {world.name} to cpu {cpu} node {node} on {docker_api}")
+    return cluster
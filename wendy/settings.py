@@ -8,6 +8,17 @@ DOCKER_API_DEFAULT = os.environ.get(
     "DOCKER_API_DEFAULT",
     default="unix:///var/run/docker.sock",
 )
+# 可供自动调度的docker主机, 逗号分隔
+DOCKER_API_HOSTS = [
+    item.strip() for item in os.environ.get("DOCKER_API_HOSTS", default=DOCKER_API_DEFAULT).split(",") if item.strip()
+]
+# 每台主机可预留的分片数, 0表示按cpu核数
+SHARD_CAPACITY = int(os.environ.get("SHARD_CAPACITY", default=0))
+# 主机cpu/内存使用率超过该值时不再调度新分片
+HOST_LOAD_LIMIT = float(os.environ.get("HOST_LOAD_LIMIT", default=0.85))
+# 部署任务并发数, 以及每台docker主机上同时执行的部署任务数
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", default=4))
+JOB_HOST_CONCURRENCY = int(os.environ.get("JOB_HOST_CONCURRENCY", default=2))
 DST_IMAGE = os.environ.get("DST_IMAGE", default="ylei2023/dontstarvetogether")
 
 DATABASE_URL = os.environ.get("DATABASE_URL", default="sqlite://wendy.sqlite3")
@@ -23,3 +34,45 @@ TORTOISE_ORM = {
 }
 # STEAM_API_KEY
 STEAM_API_KEY = os.environ.get("STEAM_API_KEY")
+# 端口分配: 每个docker_api从[PORT_RANGE_START, PORT_RANGE_END]按PORT_RANGE_SIZE分段
+PORT_RANGE_START = int(os.environ.get("PORT_RANGE_START", default=10000))
+PORT_RANGE_END = int(os.environ.get("PORT_RANGE_END", default=65535))
+PORT_RANGE_SIZE = int(os.environ.get("PORT_RANGE_SIZE", default=10))
+# modinfo.lua解析限制
+MODINFO_TIMEOUT = float(os.environ.get("MODINFO_TIMEOUT", default=1))
+MODINFO_MAX_STEPS = int(os.environ.get("MODINFO_MAX_STEPS", default=1_000_000))
+MODINFO_LOCALE = os.environ.get("MODINFO_LOCALE", default="zh")
+# 解析modinfo.lua子进程的内存上限(字节)
+MODINFO_MEMORY = int(os.environ.get("MODINFO_MEMORY", default=512 << 20))
+# 每个容器保留用于回放的日志行数
+LOG_HISTORY = int(os.environ.get("LOG_HISTORY", default=1000))
+# SSE每个订阅者的队列长度, 以及合并推送的时间间隔和最大条数
+SSE_QUEUE_SIZE = int(os.environ.get("SSE_QUEUE_SIZE", default=1000))
+SSE_FLUSH_INTERVAL = float(os.environ.get("SSE_FLUSH_INTERVAL", default=0.2))
+SSE_BATCH_SIZE = int(os.environ.get("SSE_BATCH_SIZE", default=200))
+# 每个容器保留用于回放的资源采样数
+STATS_HISTORY = int(os.environ.get("STATS_HISTORY", default=60))
+# 本机容器直接读取cgroup v2和/proc的根目录(容器内运行时挂载宿主机目录), 以及采样间隔
+CGROUP_ROOT = os.environ.get("CGROUP_ROOT", default="/sys/fs/cgroup")
+PROC_ROOT = os.environ.get("PROC_ROOT", default="/proc")
+STATS_SAMPLE_INTERVAL = float(os.environ.get("STATS_SAMPLE_INTERVAL", default=1))
+# 资源指标历史: 内存中保留的秒级采样数, 分钟和小时聚合的保留天数
+METRIC_RAW_SIZE = int(os.environ.get("METRIC_RAW_SIZE", default=3600))
+METRIC_MINUTE_RETENTION = int(os.environ.get("METRIC_MINUTE_RETENTION", default=7))
+METRIC_HOUR_RETENTION = int(os.environ.get("METRIC_HOUR_RETENTION", default=365))
+# 日志持久化目录(默认在存档目录下, 与数据库一起挂载)、保留天数以及写入间隔
+LOG_STORE_PATH = os.environ.get("LOG_STORE_PATH", default=os.path.join(GAME_ARCHIVE_PATH or "", "logs"))
+LOG_STORE_RETENTION = int(os.environ.get("LOG_STORE_RETENTION", default=7))
+LOG_STORE_FLUSH_INTERVAL = float(os.environ.get("LOG_STORE_FLUSH_INTERVAL", default=5))
+# 分片容器的日志驱动及轮转默认值, 可在部署中覆盖
+LOG_DRIVER = os.environ.get("LOG_DRIVER", default="json-file")
+LOG_MAX_SIZE = os.environ.get("LOG_MAX_SIZE", default="50m")
+LOG_MAX_FILE = int(os.environ.get("LOG_MAX_FILE", default=3))
+LOG_COMPRESS = os.environ.get("LOG_COMPRESS", default="true").lower() in ("1", "true", "yes")
+# 控制台命令等待输出的默认超时(秒), 以及空闲会话的关闭时间(秒)
+CONSOLE_TIMEOUT = float(os.environ.get("CONSOLE_TIMEOUT", default=2))
+CONSOLE_SESSION_IDLE = float(os.environ.get("CONSOLE_SESSION_IDLE", default=600))
+# 批量执行控制台命令时的默认并发数
+CONSOLE_CONCURRENCY = int(os.environ.get("CONSOLE_CONCURRENCY", default=16))
+# 部署后等待分片就绪(日志出现就绪标记)的超时时间(秒)
+READY_TIMEOUT = float(os.environ.get("READY_TIMEOUT", default=600))
@@ -0,0 +1,192 @@
+"""分片状态: 持续读取每个分片的日志, 增量解析玩家进出、天数季节、世界生成进度和就绪标记.
+
+与日志持久化共享每个容器的上游日志流, 查询时直接返回内存中的状态.
+"""
+
+from typing import Dict, List, Tuple
+
+import re
+import time
+import asyncio
+from functools import partial
+
+import structlog
+
+from wendy import models
+from wendy.sse import BoundedQueue
+from wendy.cluster import Cluster, ClusterWorld
+from wendy.constants import DeployStatus
+from wendy.logs import follow, hub
+from wendy.settings import READY_TIMEOUT
+
+
+log = structlog.get_logger()
+# 日志行去掉"[00:00:00]: "前缀后匹配
+PREFIX = re.compile(r"^\[\d+:\d+:\d+\]:\s*")
+JOIN = re.compile(r"^\[Join Announcement\]\s*(.+)$")
+LEAVE = re.compile(r"^\[Leave Announcement\]\s*(.+)$")
+# 饥荒默认不输出天数和季节, 模组或c_dumpseasons等命令输出时同样解析
+DAY = re.compile(r"\bday[:\s]+(\d+)\b", re.I)
+SEASON = re.compile(r"\bseason[:\s]+(autumn|winter|spring|summer)\b", re.I)
+MARKERS = (
+    ("Starting Up", "starting"),
+    ("Generating world", "generating"),
+    ("Loading world", "loading"),
+    ("Server registered via geo DNS", "ready"),
+    # 洞穴等从世界连接主世界后
+    ("LUA is now ready", "ready"),
+    ("Shutting down", "stopped"),
+)
+queue = BoundedQueue(maxsize=100_000)
+# {上游key: (部署ID, 世界名称)}
+keys: Dict[str, Tuple[int, str]] = {}
+tasks: List[asyncio.Task] = []
+
+
+class ShardState:
+    """单个分片的状态"""
+
+    def __init__(self):
+        self.status = "unknown"
+        self.paused = False
+        self.day: int | None = None
+        self.season: str | None = None
+        # 最近一行世界生成进度
+        self.worldgen = ""
+        # {玩家名: 加入时间}
+        self.players: Dict[str, float] = {}
+        self.updated = 0.0
+        # 状态变为ready的时间
+        self.ready_at: float | None = None
+
+    def reset(self):
+        self.__init__()
+
+    def feed(self, item: dict):
+        """解析一行日志."""
+        line = PREFIX.sub("", item["data"]).strip()
+        timestamp = item["time"] or time.time()
+        self.updated = timestamp
+        for marker, status in MARKERS:
+            if marker in line:
+                if status == "starting":
+                    self.reset()
+                    self.updated = timestamp
+                self.status = status
+                if status == "ready":
+                    self.ready_at = timestamp
+                return
+        if self.status == "generating":
+            self.worldgen = line
+        if line == "Sim paused":
+            self.paused = True
+        elif line == "Sim unpaused":
+            self.paused = False
+        elif match := JOIN.match(line):
+            self.players[match[1]] = timestamp
+        elif match := LEAVE.match(line):
+            self.players.pop(match[1], None)
+        else:
+            if match := DAY.search(line):
+                self.day = int(match[1])
+            if match := SEASON.search(line):
+                self.season = match[1].lower()
+
+    def data(self) -> dict:
+        return {
+            "status": self.status,
+            "paused": self.paused,
+            "day": self.day,
+            "season": self.season,
+            "worldgen": self.worldgen,
+            "players": sorted(self.players),
+            "updated": self.updated,
+            "ready_at": self.ready_at,
+        }
+
+
+# {(部署ID, 世界名称): 状态}
+states: Dict[Tuple[int, str], ShardState] = {}
+
+
+async def watch():
+    """订阅所有运行中世界的日志, 首次订阅时回放最近的日志恢复状态"""
+    channels = {}
+    while True:
+        try:
+            current: Dict[str, Tuple[int, str]] = {}
+            worlds: Dict[str, ClusterWorld] = {}
+            async for deploy in models.Deploy.filter(status=DeployStatus.running.value):
+                cluster = Cluster.model_validate(deploy.cluster)
+                for world in cluster.world:
+                    key = f"{world.docker_api}/{world.container}"
+                    current[key] = (deploy.id, world.name)
+                    worlds[key] = world
+            for key in channels.keys() - current.keys():
+                hub.unsubscribe(key, queue)
+                channels.pop(key)
+            keys.clear()
+            keys.update(current)
+            for item in states.keys() - set(current.values()):
+                states.pop(item)
+            for key, world in worlds.items():
+                channel = channels.get(key)
+                if channel is None or hub.channels.get(key) is not channel:
+                    channels[key] = hub.subscribe(key, partial(follow, world=world), queue)
+        except Exception as e:
+            log.exception(f"watch shards failed: {e}")
+        await asyncio.sleep(5)
+
+
+async def record():
+    while True:
+        try:
+            for key, item in await queue.get_batch(queue.maxsize, 0):
+                if key in keys:
+                    states.setdefault(keys[key], ShardState()).feed(item)
+        except Exception as e:
+            log.exception(f"record shards failed: {e}")
+
+
+async def start():
+    tasks.append(asyncio.create_task(watch()))
+    tasks.append(asyncio.create_task(record()))
+
+
+def get(deploy_id: int, world: str) -> ShardState | None:
+    return states.get((deploy_id, world))
+
+
+async def wait_ready(world: ClusterWorld, since: float, timeout: float = READY_TIMEOUT) -> float | None:
+    """等待分片在since之后输出就绪标记.
+
+    Args:
+        world (ClusterWorld): 世界.
+        since (float): 只解析该时间之后的日志, 一般为启动容器的时间.
+        timeout (float): 超时时间(秒).
+
+    Returns:
+        float | None: 就绪的时间戳, 超时返回None.
+    """
+    key = f"{world.docker_api}/{world.container}"
+    waiter = BoundedQueue()
+    state = ShardState()
+    source = partial(follow, world=world)
+    channel = None
+    try:
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            # 上游出错结束(如容器尚未创建)后重新订阅
+            if channel is None or hub.channels.get(key) is not channel:
+                channel = hub.subscribe(key, source, waiter, accept=lambda item: item["time"] >= since)
+            try:
+                batch = await asyncio.wait_for(waiter.get_batch(interval=0), min(remaining, 5))
+            except asyncio.TimeoutError:
+                continue
+            for _, item in batch:
+                state.feed(item)
+                if state.ready_at is not None:
+                    return state.ready_at
+        return None
+    finally:
+        hub.unsubscribe(key, waiter)
@@ -0,0 +1,67 @@
+"""SSE推送: 每个订阅者一个有界队列, 按时间间隔或数量合并为一个事件"""
+
+from typing import Any, List
+
+import asyncio
+from collections import deque
+
+from wendy.settings import SSE_BATCH_SIZE, SSE_FLUSH_INTERVAL, SSE_QUEUE_SIZE
+
+
+class BoundedQueue:
+    """有界队列, 满时丢弃最旧的元素并计数, 慢客户端不会让内存无限增长"""
+
+    def __init__(self, maxsize: int = SSE_QUEUE_SIZE):
+        self.items = deque()
+        self.maxsize = maxsize
+        # 累计丢弃数, 以及上次get_batch后新丢弃的数量
+        self.dropped = 0
+        self.pending_dropped = 0
+        self._event = asyncio.Event()
+
+    def qsize(self) -> int:
+        return len(self.items)
+
+    def put_nowait(self, item: Any):
+        if len(self.items) >= self.maxsize:
+            self.items.popleft()
+            self.dropped += 1
+            self.pending_dropped += 1
+        self.items.append(item)
+        self._event.set()
+
+    async def _wait(self, timeout: float | None = None) -> bool:
+        self._event.clear()
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    async def get_batch(
+        self,
+        size: int = SSE_BATCH_SIZE,
+        interval: float = SSE_FLUSH_INTERVAL,
+    ) -> List[Any]:
+        """等待至少一个元素, 随后最多再等interval秒或凑满size个.
+
+        Args:
+            size (int): 每批最大数量.
+            interval (float): 合并等待时间.
+
+        Returns:
+            List[Any]: 元素.
+        """
+        while not self.items:
+            await self._wait()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + interval
+        while len(self.items) < size:
+            remaining = deadline - loop.time()
+            if remaining <= 0 or not await self._wait(remaining):
+                break
+        return [self.items.popleft() for _ in range(min(size, len(self.items)))]
+
+    def take_dropped(self) -> int:
+        dropped, self.pending_dropped = self.pending_dropped, 0
+        return dropped
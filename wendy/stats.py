@@ -0,0 +1,202 @@
+"""容器资源采集, 每个容器一个采集源, 由所有订阅者共享.
+
+本机容器直接读取cgroup v2和/proc, 一次遍历所有容器; 远程主机使用docker stats流.
+"""
+
+from typing import Dict, Tuple
+
+import os
+import time
+import asyncio
+
+import httpx
+import structlog
+import aiodocker
+
+from wendy import metrics
+from wendy.hub import Hub, Channel
+from wendy.cluster import ClusterWorld
+from wendy.logs import docker_client
+from wendy.settings import CGROUP_ROOT, PROC_ROOT, STATS_HISTORY, STATS_SAMPLE_INTERVAL
+
+
+log = structlog.get_logger()
+# 保留最近STATS_HISTORY个采样用于回放
+hub = Hub(STATS_HISTORY)
+# 本机容器 {channel_key: (channel, cgroup路径, 容器pid, 读取失败时通知)}
+local_channels: Dict[str, Tuple[Channel, str, int, asyncio.Event]] = {}
+sampler: asyncio.Task | None = None
+
+
+def channel_key(docker_api: str, container: str) -> str:
+    return f"{docker_api}/{container}"
+
+
+def is_local(docker_api: str) -> bool:
+    """本机docker且cgroup为v2时可直接读取."""
+    return docker_api.startswith("unix://") and os.path.exists(os.path.join(CGROUP_ROOT, "cgroup.controllers"))
+
+
+def find_cgroup(container_id: str) -> str | None:
+    """容器的cgroup目录, 兼容systemd和cgroupfs驱动."""
+    for name in (
+        f"system.slice/docker-{container_id}.scope",
+        f"docker/{container_id}",
+    ):
+        path = os.path.join(CGROUP_ROOT, name)
+        if os.path.isdir(path):
+            return path
+    return None
+
+
+def read_text(path: str) -> str:
+    with open(path, "r") as file:
+        return file.read()
+
+
+def read_counters(path: str, pid: int) -> dict:
+    """读取cgroup v2及/proc/{pid}/net/dev中的累计计数器.
+
+    pid为0表示容器使用host网络, 网卡计数是整台主机的, 不读取网络计数器.
+    """
+    counters = {"time": time.time()}
+    for line in read_text(os.path.join(path, "cpu.stat")).splitlines():
+        key, _, value = line.partition(" ")
+        if key == "usage_usec":
+            counters["cpu_usage"] = int(value)
+    counters["memory"] = int(read_text(os.path.join(path, "memory.current")))
+    counters["inactive_file"] = 0
+    for line in read_text(os.path.join(path, "memory.stat")).splitlines():
+        key, _, value = line.partition(" ")
+        if key == "inactive_file":
+            counters["inactive_file"] = int(value)
+            break
+    limit = read_text(os.path.join(path, "memory.max")).strip()
+    counters["memory_limit"] = 0 if limit == "max" else int(limit)
+    counters["pids"] = int(read_text(os.path.join(path, "pids.current")))
+    counters["block_read"] = counters["block_write"] = 0
+    for line in read_text(os.path.join(path, "io.stat")).splitlines():
+        for field in line.split()[1:]:
+            key, _, value = field.partition("=")
+            if key == "rbytes":
+                counters["block_read"] += int(value)
+            elif key == "wbytes":
+                counters["block_write"] += int(value)
+    if not pid:
+        return counters
+    counters["net_rx"] = counters["net_tx"] = 0
+    for line in read_text(os.path.join(PROC_ROOT, str(pid), "net", "dev")).splitlines()[2:]:
+        interface, _, fields = line.partition(":")
+        if interface.strip() == "lo":
+            continue
+        values = fields.split()
+        counters["net_rx"] += int(values[0])
+        counters["net_tx"] += int(values[8])
+    return counters
+
+
+def read_all(targets: Dict[str, Tuple[str, int]]) -> Dict[str, dict | None]:
+    data = {}
+    for key, (path, pid) in targets.items():
+        try:
+            data[key] = read_counters(path, pid)
+        except (OSError, ValueError, KeyError, IndexError):
+            data[key] = None
+    return data
+
+
+async def sample_local():
+    """一次遍历所有本机容器, 读取失败的容器通知其采集源重新定位."""
+    global sampler
+    previous: Dict[str, dict] = {}
+    try:
+        while local_channels:
+            targets = {key: (path, pid) for key, (_, path, pid, _) in local_channels.items()}
+            data = await asyncio.to_thread(read_all, targets)
+            for key, counters in data.items():
+                if key not in local_channels:
+                    continue
+                channel, _, _, failed = local_channels[key]
+                if counters is None:
+                    failed.set()
+                    continue
+                channel.publish(metrics.cgroup_summary(counters, previous.get(key)))
+                previous[key] = counters
+            previous = {key: value for key, value in previous.items() if key in local_channels}
+            await asyncio.sleep(STATS_SAMPLE_INTERVAL)
+    finally:
+        sampler = None
+
+
+async def cgroup_target(world: ClusterWorld) -> Tuple[str, int] | None:
+    """本机运行中容器的(cgroup路径, pid), 无法直接读取时返回None.
+
+    host网络模式的容器pid返回0, 不统计网络.
+    """
+    if not is_local(world.docker_api):
+        return None
+    try:
+        async with aiodocker.Docker(world.docker_api) as docker:
+            container = await docker.containers.get(world.container)
+    except aiodocker.DockerError:
+        return None
+    pid = container._container.get("State", {}).get("Pid") or 0
+    path = find_cgroup(container._container["Id"])
+    if not pid or path is None:
+        return None
+    if container._container.get("HostConfig", {}).get("NetworkMode") == "host":
+        pid = 0
+    return path, pid
+
+
+async def collect_cgroup(channel: Channel, path: str, pid: int):
+    """加入本机采样, 直到读取失败(如容器重启)."""
+    global sampler
+    failed = asyncio.Event()
+    local_channels[channel.key] = (channel, path, pid, failed)
+    if sampler is None:
+        sampler = asyncio.create_task(sample_local())
+    try:
+        await failed.wait()
+    finally:
+        if local_channels.get(channel.key, (None,))[0] is channel:
+            local_channels.pop(channel.key)
+
+
+async def collect_docker(channel: Channel, world: ClusterWorld):
+    """读取docker stats流, 计算指标后发布到channel."""
+    try:
+        async with docker_client(world.docker_api) as client:
+            url = f"/containers/{world.container}/stats"
+            timeout = httpx.Timeout(None, connect=5)
+            decoder = metrics.NDJSONDecoder()
+            previous = None
+            async with client.stream("GET", url, timeout=timeout) as response:
+                async for chunk in response.aiter_bytes():
+                    for stats in decoder.feed(chunk):
+                        channel.publish(metrics.summary(stats, previous))
+                        previous = stats
+    except httpx.HTTPError as e:
+        log.warning(f"collect stats {world.container} failed: {e}")
+
+
+async def collect(channel: Channel, world: ClusterWorld, retry: int = 5):
+    """持续采集容器资源, 本机优先读取cgroup, 否则使用docker stats."""
+    while True:
+        target = await cgroup_target(world)
+        if target is not None:
+            await collect_cgroup(channel, *target)
+        else:
+            await collect_docker(channel, world)
+        await asyncio.sleep(retry)
+
+
+def latest(docker_api: str, container: str, max_age: float = 10) -> dict | None:
+    """已有订阅时返回最近的采样, 用于调度时避免重复请求docker stats."""
+    channel = hub.channels.get(channel_key(docker_api, container))
+    if channel is None or not channel.history:
+        return None
+    item = channel.history[-1]
+    if time.time() - item["time"] > max_age:
+        return None
+    return item